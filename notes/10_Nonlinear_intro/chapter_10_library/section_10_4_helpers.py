@@ -101,11 +101,21 @@ class BaseSetup:
         if "w" in kwargs:
             w = kwargs["w"]
 
+        # l-bfgs settings - number of curvature pairs kept and gradient norm tolerance
+        memory = 10
+        if "memory" in kwargs:
+            memory = kwargs["memory"]
+        tol = 10 ** (-6)
+        if "tol" in kwargs:
+            tol = kwargs["tol"]
+
         # run gradient descent
         if algo == "gradient_descent":
             self.weight_history, self.cost_history = self.gradient_descent(self.cost_func, alpha_choice, max_its, w)
         if algo == "newtons_method":
             self.weight_history, self.cost_history = self.newtons_method(self.cost_func, max_its, w)
+        if algo == "lbfgs":
+            self.weight_history, self.cost_history = self.lbfgs(self.cost_func, max_its, w, memory=memory, tol=tol)
 
     ###### cost functions #####
     # compute linear combination of input point
@@ -321,6 +331,147 @@ class BaseSetup:
 
         return weight_history, cost_history
 
+    # line search along descent direction d from w satisfying the strong Wolfe conditions - given the
+    # cost / gradient function gradient(w) and their values f0 / g0 at w, returns the steplength along
+    # with the cost and gradient at the new point (a steplength of 0 if no acceptable step is found)
+    def strong_wolfe_linesearch(self, gradient, w, d, f0, g0, alpha):
+        # sufficient decrease and curvature parameters, maximum number of function evaluations
+        c1 = 10 ** (-4)
+        c2 = 0.9
+        max_evals = 25
+
+        # slope along the search direction at w
+        dphi0 = np.dot(g0, d)
+
+        # zoom in on an acceptable steplength inside the bracket [lo, hi] - each end stored as
+        # (steplength, cost, slope, gradient), with lo the end of lower cost
+        def zoom(lo, hi, num_evals):
+            while num_evals < max_evals:
+                # minimizer of the cubic interpolating both ends, safeguarded into the interior of
+                # the bracket - otherwise bisect
+                a_lo, f_lo, dphi_lo, g_lo = lo
+                a_hi, f_hi, dphi_hi, g_hi = hi
+                a = (a_lo + a_hi) / 2
+                d1 = dphi_lo + dphi_hi - 3 * (f_lo - f_hi) / (a_lo - a_hi)
+                d2_sq = d1**2 - dphi_lo * dphi_hi
+                if d2_sq >= 0:
+                    d2 = np.sign(a_hi - a_lo) * np.sqrt(d2_sq)
+                    a_cubic = a_hi - (a_hi - a_lo) * (dphi_hi + d2 - d1) / (dphi_hi - dphi_lo + 2 * d2)
+                    width = abs(a_hi - a_lo)
+                    if min(a_lo, a_hi) + 0.1 * width <= a_cubic <= max(a_lo, a_hi) - 0.1 * width:
+                        a = a_cubic
+
+                # evaluate new steplength and shrink bracket
+                f_a, g_a = gradient(w + a * d)
+                dphi_a = np.dot(g_a, d)
+                num_evals += 1
+                if f_a > f0 + c1 * a * dphi0 or f_a >= f_lo:
+                    hi = (a, f_a, dphi_a, g_a)
+                else:
+                    if abs(dphi_a) <= -c2 * dphi0:
+                        return a, f_a, g_a
+                    if dphi_a * (a_hi - a_lo) >= 0:
+                        hi = lo
+                    lo = (a, f_a, dphi_a, g_a)
+            return lo[0], lo[1], lo[3]
+
+        # expand steplength until the minimum is bracketed or the Wolfe conditions hold
+        prev = (0, f0, dphi0, g0)
+        for num_evals in range(1, max_evals + 1):
+            f_a, g_a = gradient(w + alpha * d)
+            dphi_a = np.dot(g_a, d)
+            current = (alpha, f_a, dphi_a, g_a)
+            if f_a > f0 + c1 * alpha * dphi0 or (num_evals > 1 and f_a >= prev[1]):
+                return zoom(prev, current, num_evals)
+            if abs(dphi_a) <= -c2 * dphi0:
+                return alpha, f_a, g_a
+            if dphi_a >= 0:
+                return zoom(current, prev, num_evals)
+            prev = current
+            alpha = 2 * alpha
+
+        # out of evaluations - settle for the last steplength evaluated
+        return prev[0], prev[1], prev[3]
+
+    # limited memory BFGS - inputs: g (input function), max_its (maximum number of iterations), w (initialization)
+    def lbfgs(self, g, max_its, w, **kwargs):
+        # flatten input funciton, in case it takes in matrices of weights
+        flat_g, unflatten, w = flatten_func(g, w)
+        gradient = value_and_grad(flat_g)
+
+        # number of curvature pairs kept in memory, and gradient norm at which to stop
+        memory = 10
+        if "memory" in kwargs:
+            memory = kwargs["memory"]
+        tol = 10 ** (-6)
+        if "tol" in kwargs:
+            tol = kwargs["tol"]
+
+        # curvature pairs s = w_new - w, y = grad_new - grad - most recent last
+        s_list = []
+        y_list = []
+
+        # run the l-bfgs loop
+        weight_history = []  # container for weight history
+        cost_history = []  # container for corresponding cost function history
+        cost_eval, grad_eval = gradient(w)
+        for k in range(max_its):
+            # store current weights and cost function value
+            weight_history.append(unflatten(w))
+            cost_history.append(cost_eval)
+
+            # stop once the gradient vanishes
+            if np.linalg.norm(grad_eval) <= tol:
+                return weight_history, cost_history
+
+            # two-loop recursion - apply inverse Hessian approximation to the gradient
+            q = np.array(grad_eval)
+            rhos = [1 / np.dot(y, s) for s, y in zip(s_list, y_list)]
+            coeffs = []
+            for s, y, rho in reversed(list(zip(s_list, y_list, rhos))):
+                coeff = rho * np.dot(s, q)
+                q = q - coeff * y
+                coeffs.append(coeff)
+            if len(s_list) > 0:
+                q = q * np.dot(s_list[-1], y_list[-1]) / np.dot(y_list[-1], y_list[-1])
+            for (s, y, rho), coeff in zip(zip(s_list, y_list, rhos), reversed(coeffs)):
+                q = q + (coeff - rho * np.dot(y, q)) * s
+            d = -q
+
+            # restart from steepest descent if this is not a descent direction - scaling the
+            # very first step to unit length
+            alpha = 1
+            if np.dot(d, grad_eval) >= 0 or len(s_list) == 0:
+                s_list = []
+                y_list = []
+                d = -grad_eval
+                alpha = min(1, 1 / np.linalg.norm(grad_eval))
+
+            # strong Wolfe line search - stop if no acceptable step exists
+            alpha, new_cost, new_grad = self.strong_wolfe_linesearch(gradient, w, d, cost_eval, grad_eval, alpha)
+            if alpha == 0:
+                return weight_history, cost_history
+
+            # store curvature pair, dropping the oldest beyond memory - skipping pairs of non-positive curvature
+            s = alpha * d
+            y = new_grad - grad_eval
+            if np.dot(s, y) > 10 ** (-10):
+                s_list.append(s)
+                y_list.append(y)
+                if len(s_list) > memory:
+                    s_list.pop(0)
+                    y_list.pop(0)
+
+            # take step
+            w = w + s
+            cost_eval, grad_eval = new_cost, new_grad
+
+        # collect final weights - whose cost value comes from the last line search
+        weight_history.append(unflatten(w))
+        cost_history.append(cost_eval)
+
+        return weight_history, cost_history
+
     ###### normalizers #####
     # standard normalization function
     def standard_normalizer(self, x):
@@ -77,6 +77,12 @@ class Visualizer:
         ymin -= ygap
         ymax += ygap
 
+        # fits of the model after every round, computed at once for runners with a flat-array predictor
+        fits = None
+        if hasattr(runner, "predictor"):
+            s = np.linspace(xmin, xmax, 2000)[np.newaxis, :]
+            fits = runner.predictor.prefix_predictions(self.normalizer(s))
+
         # start animation
         print("starting animation rendering...")
 
@@ -103,7 +109,7 @@ class Visualizer:
                 # plot current fit
                 a = inds[k - 1]
                 steps = runner.best_steps[: a + 1]
-                self.draw_fit(ax, steps, a)
+                self.draw_fit(ax, steps, a, fits)
 
                 # plot train / valid errors up to this point
                 self.plot_train_valid_errors(ax2, k - 1, train_errors, valid_errors, inds)
@@ -123,7 +129,7 @@ class Visualizer:
         clear_output()
 
     # 1d regression demo
-    def draw_fit(self, ax, steps, ind):
+    def draw_fit(self, ax, steps, ind, fits=None):
         # set plotting limits
         xmax = np.max(copy.deepcopy(self.x))
         xmin = np.min(copy.deepcopy(self.x))
@@ -133,8 +139,11 @@ class Visualizer:
 
         # plot fit
         s = np.linspace(xmin, xmax, 2000)[np.newaxis, :]
-        model = lambda x: np.sum([v(x) for v in steps], axis=0)
-        t = model(self.normalizer(s))
+        if fits is not None:
+            t = fits[ind][np.newaxis, :]
+        else:
+            model = lambda x: np.sum([v(x) for v in steps], axis=0)
+            t = model(self.normalizer(s))
 
         ax.plot(s.T, t.T, linewidth=4, c="k")
         ax.plot(s.T, t.T, linewidth=2, c="r")
@@ -0,0 +1,20 @@
+import autograd.numpy as np
+
+
+class Ensemble:
+    """
+    Additive ensemble built by boosting - the model after round m is the sum of the first m + 1 steps
+    (the first being the bias), each a function taking input x to a (1 x P) array of values.  The models
+    of every round share one list of steps rather than each holding copies of its own.
+    """
+
+    def __init__(self, steps, num_steps):
+        self.steps = steps
+        self.num_steps = num_steps
+
+    def __len__(self):
+        return self.num_steps
+
+    # evaluate the model on input x
+    def __call__(self, x):
+        return np.sum([v(x) for v in self.steps[: self.num_steps]], axis=0)
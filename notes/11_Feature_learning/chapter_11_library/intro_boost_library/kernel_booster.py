@@ -2,6 +2,9 @@ import autograd.numpy as np
 from . import optimizers
 from . import cost_functions
 from . import normalizers
+from . import ensemble
+from . import round_executor
+from . import monomial_search
 import copy
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
@@ -71,6 +74,17 @@ class Setup:
         if "epsilon" in kwargs:
             epsilon = kwargs["epsilon"]
 
+        # hessian-free newton settings
+        hessian_free = False
+        if "hessian_free" in kwargs:
+            hessian_free = kwargs["hessian_free"]
+        cg_max_its = 20
+        if "cg_max_its" in kwargs:
+            cg_max_its = kwargs["cg_max_its"]
+
+        # convergence tolerances - each run stops early once any one is met (0 = off)
+        tols = optimizers.convergence_tolerances(kwargs)
+
         # batch size for gradient descent?
         self.w = 0.0 * np.random.randn(self.x.shape[0] + 1, 1)
         num_pts = np.size(self.y)
@@ -78,41 +92,50 @@ class Setup:
         if "batch_size" in kwargs:
             self.batch_size = kwargs["batch_size"]
 
+        # record choices - monomials are fit in closed form for some costs / optimizers
+        self.optimizer_name = optimizer_name
+        self.max_its = max_its
+        self.epsilon = epsilon
+
         # run gradient descent
         if optimizer_name == "gradient_descent":
-            self.optimizer = lambda cost, x, y, w: optimizers.gradient_descent(cost, w, x, y, alpha_choice, max_its, batch_size)
+            self.optimizer = lambda cost, x, y, w: optimizers.gradient_descent(cost, w, x, y, alpha_choice, max_its, batch_size, **tols)
 
         if optimizer_name == "newtons_method":
-            self.optimizer = lambda cost, x, y, w: optimizers.newtons_method(cost, w, x, y, max_its, epsilon=epsilon)
+            self.optimizer = lambda cost, x, y, w: optimizers.newtons_method(
+                cost, w, x, y, max_its, epsilon=epsilon, hessian_free=hessian_free, cg_max_its=cg_max_its, **tols
+            )
 
     ######## boosting demo with monomials  ########
     ### create prototype steps ###
     def create_monomials(self, D):
-        N = self.x.shape[0]
+        # monomials of every input of total degree at most D, ordered by degree
         all_monos = []
-        if N == 1:
-            for d in range(D):
-                mon = lambda x, deg=d: x**deg
-                all_monos.append(copy.deepcopy(mon))
-
-        if N == 2:
-            degs = []
-            for n in range(D):
-                for m in range(D):
-                    if n + m <= D:
-                        degs.append([n, m])
-
-            for deg in degs:
-                mon = lambda x, n=deg[0], m=deg[1]: (x[0, :][np.newaxis, :] ** n) * (x[1, :][np.newaxis, :] ** m)
-                all_monos.append(copy.deepcopy(mon))
+        for deg in monomial_search.degrees(self.x.shape[0], D):
+            mon = lambda x, deg=deg: monomial_search.features(x, [deg])
+            all_monos.append(mon)
         return all_monos
 
     ### boost it ###
     def boost(self, num_rounds, D, **kwargs):
         # create monomials
+        degs = list(monomial_search.degrees(self.x.shape[0], D))
         all_steps = self.create_monomials(D)
         num_steps = len(all_steps)
 
+        # number of worker processes candidates are fit across
+        num_workers = 1
+        if "num_workers" in kwargs:
+            num_workers = kwargs["num_workers"]
+
+        # least squares and softmax monomials fit by a single Newton step have closed form weights - so
+        # every monomial can be scored at once from its values on the training points
+        searcher = None
+        closed_form = self.cost_name == "least_squares" or self.cost_name == "softmax"
+        if closed_form and self.optimizer_name == "newtons_method" and self.max_its == 1:
+            searcher = monomial_search.Setup(self.x_train, degs)
+            f_valid = monomial_search.features(self.x_valid, degs)
+
         # container for models and cost function histories
         self.best_steps = []
         self.train_cost_vals = []
@@ -130,13 +153,19 @@ class Setup:
         best_w = w_hist[ind][0]
 
         # lock in model_0 value
-        model = lambda x, w=best_w: model_0(x, w)
-        self.best_steps.append(copy.deepcopy(model))
-        self.models.append(copy.deepcopy(model))
+        self.best_steps.append(lambda x, w=best_w: model_0(x, w))
+        self.models.append(ensemble.Ensemble(self.best_steps, 1))
+
+        # running predictions of the current model on the training and validation points - kept as an
+        # extra row of the input so they are batched along with it, and updated as each step is locked
+        # in - so that each round evaluates only its new step.  These are shared with any worker processes
+        x_train = round_executor.shared_array(np.vstack((self.x_train, self.best_steps[-1](self.x_train))), num_workers)
+        x_valid = round_executor.shared_array(np.vstack((self.x_valid, self.best_steps[-1](self.x_valid))), num_workers)
+        model = lambda x: x[-1:, :]
 
         train_cost_val = c_hist[ind]
         self.train_cost_vals.append(train_cost_val)
-        valid_cost_val = self.cost.cost(best_w, self.x_valid, self.y_valid, np.arange(len(self.y_valid)))
+        valid_cost_val = self.cost.cost(best_w, self.x_valid, self.y_valid, np.arange(self.y_valid.size))
         self.valid_cost_vals.append(valid_cost_val)
 
         # pluck counter
@@ -158,79 +187,106 @@ class Setup:
         ):
             self.counter.set_model(model)
 
-            train_count = self.counter.cost(self.x_train, self.y_train)
-            valid_count = self.counter.cost(self.x_valid, self.y_valid)
+            train_count = self.counter.cost(x_train, self.y_train)
+            valid_count = self.counter.cost(x_valid, self.y_valid)
 
             self.train_count_vals.append(train_count)
             self.valid_count_vals.append(valid_count)
 
+        # fit candidate monomial n from initial weight w with the optimizer, returning its lowest cost and weight
+        def fit(n, w):
+            current_step = lambda x, w: w * all_steps[n - 1](x)
+            current_model = lambda x, w: model(x) + current_step(x[:-1, :], w)
+            self.cost.set_model(current_model)
+            w_hist, c_hist = self.optimizer(self.cost.cost, x_train, self.y_train, w)
+            ind = np.argmin(c_hist)
+            return c_hist[ind], w_hist[ind]
+
+        executor = None
+        if searcher is None:
+            executor = round_executor.Setup(fit, num_workers)
+
         # index sets to keep track of which feature-touching weights have been used
         # thus far
         used = [0]
         unused = {i for i in range(1, num_steps + 1)}
-        for i in range(num_rounds):
-            print("starting round " + str(i + 1) + " of " + str(num_rounds) + " of boosting")
-            # loop over unused indices and try out each remaining corresponding weight
-            best_weight = 0
-            best_train_cost = np.inf
-            best_valid_cost = np.inf
-            best_ind = 0
-
-            for n in unused:
-                # get current proto-step to test
-                w = 0.1 * np.random.randn(1)
-                current_step = lambda x, w: w * all_steps[n - 1](x)
-
-                # construct model to test
-                current_model = lambda x, w: model(x) + current_step(x, w)
-
-                # load in current model
-                self.cost.set_model(current_model)
-                w_hist, c_hist = self.optimizer(self.cost.cost, self.x_train, self.y_train, w)
-
-                # determine smallest cost value attained
-                ind = np.argmin(c_hist)
-                weight = w_hist[ind]
-                train_cost_val = c_hist[ind]
-                valid_cost_val = self.cost.cost(weight, self.x_valid, self.y_valid, np.arange(len(self.y_valid)))
-
-                # update smallest cost val / associated weight
-                if train_cost_val < best_train_cost:
-                    best_w = weight
-                    best_train_cost = train_cost_val
-                    best_valid_cost = valid_cost_val
-                    best_ind = n
-
-            # after sweeping through and computing minimum for all subproblems
-            # update the best weight value
-            self.train_cost_vals.append(copy.deepcopy(best_train_cost))
-            self.valid_cost_vals.append(copy.deepcopy(best_valid_cost))
-
-            best_step = lambda x, w=best_w, ind=best_ind - 1: w[0] * all_steps[ind](x)
-            self.best_steps.append(copy.deepcopy(best_step))
-
-            # fix next model
-            model = lambda x, steps=self.best_steps: np.sum([v(x) for v in steps], axis=0)
-            self.models.append(copy.deepcopy(model))
-
-            # pluck counter
-            if (
-                self.cost_name == "softmax"
-                or self.cost_name == "perceptron"
-                or self.cost_name == "multiclass_softmax"
-                or self.cost_name == "multiclass_perceptron"
-            ):
-                self.counter.set_model(model)
-
-                train_count = self.counter.cost(self.x_train, self.y_train)
-                valid_count = self.counter.cost(self.x_valid, self.y_valid)
-
-                self.train_count_vals.append(train_count)
-                self.valid_count_vals.append(valid_count)
-
-            # remove best index from unused set, add to used set
-            # unused -= {best_ind}
-            # used.append(best_ind)
+        try:
+            for i in range(num_rounds):
+                print("starting round " + str(i + 1) + " of " + str(num_rounds) + " of boosting")
+                # loop over unused indices and try out each remaining corresponding weight
+                best_weight = 0
+                best_train_cost = np.inf
+                best_valid_cost = np.inf
+                best_ind = 0
+
+                # score all monomials in closed form
+                if searcher is not None:
+                    y_train = self.y_train[0, :]
+                    m_train = x_train[-1, :]
+                    if self.cost_name == "least_squares":
+                        costs, w = searcher.least_squares(y_train - m_train, self.epsilon)
+                    else:
+                        costs, w = searcher.softmax_newton(y_train, m_train, self.epsilon)
+                    best_ind = np.argmin(costs) + 1
+                    best_w = np.array([w[best_ind - 1]])
+
+                    # exact cost of the step - a Newton step that fails to descend is not taken
+                    current_step = lambda x, w: w * all_steps[best_ind - 1](x)
+                    self.cost.set_model(lambda x, w: model(x) + current_step(x[:-1, :], w))
+                    best_train_cost = self.cost.cost(best_w, x_train, self.y_train, np.arange(self.y_train.size))
+                    zero_cost = self.cost.cost(np.zeros((1,)), x_train, self.y_train, np.arange(self.y_train.size))
+                    if zero_cost < best_train_cost:
+                        best_w = np.zeros((1,))
+                        best_train_cost = zero_cost
+
+                # otherwise fit each candidate from its own random initialization - drawn here, in order, so
+                # that results do not depend on the number of workers
+                else:
+                    candidates = list(unused)
+                    inits = [0.1 * np.random.randn(1) for n in candidates]
+                    best_ind, best_w, best_train_cost = executor.best(candidates, inits)
+                    current_step = lambda x, w: w * all_steps[best_ind - 1](x)
+                    self.cost.set_model(lambda x, w: model(x) + current_step(x[:-1, :], w))
+                best_valid_cost = self.cost.cost(best_w, x_valid, self.y_valid, np.arange(self.y_valid.size))
+
+                # after sweeping through and computing minimum for all subproblems
+                # update the best weight value
+                self.train_cost_vals.append(copy.deepcopy(best_train_cost))
+                self.valid_cost_vals.append(copy.deepcopy(best_valid_cost))
+
+                best_step = lambda x, w=best_w, ind=best_ind - 1: w[0] * all_steps[ind](x)
+                self.best_steps.append(best_step)
+
+                # fix next model, and update running predictions with its new step
+                self.models.append(ensemble.Ensemble(self.best_steps, len(self.best_steps)))
+                if searcher is not None:
+                    x_train[-1:, :] += best_w[0] * searcher.f[best_ind - 1]
+                    x_valid[-1:, :] += best_w[0] * f_valid[best_ind - 1]
+                else:
+                    x_train[-1:, :] += best_step(self.x_train)
+                    x_valid[-1:, :] += best_step(self.x_valid)
+
+                # pluck counter
+                if (
+                    self.cost_name == "softmax"
+                    or self.cost_name == "perceptron"
+                    or self.cost_name == "multiclass_softmax"
+                    or self.cost_name == "multiclass_perceptron"
+                ):
+                    self.counter.set_model(model)
+
+                    train_count = self.counter.cost(x_train, self.y_train)
+                    valid_count = self.counter.cost(x_valid, self.y_valid)
+
+                    self.train_count_vals.append(train_count)
+                    self.valid_count_vals.append(valid_count)
+
+                # remove best index from unused set, add to used set
+                # unused -= {best_ind}
+                # used.append(best_ind)
+        finally:
+            if executor is not None:
+                executor.close()
 
         # make universals
         self.used = used
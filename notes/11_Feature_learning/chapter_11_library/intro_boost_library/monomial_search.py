@@ -0,0 +1,76 @@
+import autograd.numpy as np
+
+
+# exponents of the N input dimensions summing to total, in graded lexicographic order - higher powers
+# of the earlier dimensions coming first
+def exponents(total, N):
+    if N == 1:
+        yield (total,)
+        return
+    for first in range(total, -1, -1):
+        for rest in exponents(total - first, N - 1):
+            yield (first,) + rest
+
+
+# exponents of all monomials in N inputs of total degree at most D, with no single power above D - 1,
+# ordered by total degree
+def degrees(N, D):
+    for total in range(D + 1):
+        for deg in exponents(total, N):
+            if max(deg) < D:
+                yield deg
+
+
+# values of the monomials with exponents degs on the points x - one row per monomial
+def features(x, degs):
+    degs = np.asarray(degs, dtype=int)
+    f = np.ones((np.shape(degs)[0], np.shape(x)[1]))
+    for n in range(np.shape(x)[0]):
+        f = f * x[n, :][np.newaxis, :] ** degs[:, n][:, np.newaxis]
+    return f
+
+
+class Setup:
+    """
+    Closed-form monomial search.  Each candidate step is a single monomial scaled by one weight, so with
+    the values of every monomial on the points x computed once as the rows of a feature matrix, all
+    candidates are scored together by products of that matrix with per-point quantities of the current
+    model - in O(M*P) time for M monomials.
+    """
+
+    def __init__(self, x, degs):
+        self.f = features(x, degs)
+        self.f_sq = self.f**2
+        self.P = np.shape(x)[1]
+
+        # squared norm of each monomial over the points
+        self.norms = np.sum(self.f_sq, axis=1)
+
+    # least squares - weights of one regularized Newton step from zero, given residuals r of the current
+    # model.  With no regularization the weight of each monomial f is <f, r>/<f, f>, lowering the sum of
+    # squared residuals by <f, r>^2/<f, f>.  A monomial vanishing at every point is given weight zero
+    def least_squares(self, r, epsilon):
+        fr = np.dot(self.f, r)
+
+        # Newton step on each weight - the hessian of the mean squared error is 2<f, f>/P
+        d = self.norms + 0.5 * epsilon * self.P
+        w = fr / np.where(d > 0, d, 1)
+
+        # the cost is quadratic in the weight, so this is exact
+        costs = np.sum(r**2) + w * (w * self.norms - 2 * fr)
+        return costs / float(self.P), w
+
+    # softmax - weights of one regularized Newton step from zero, taken from the current model
+    # predictions m on labels y, along with the exact cost after each step
+    def softmax_newton(self, y, m, epsilon):
+        # per-point gradient and hessian of log(1 + exp(-y*(m + w*f))) with respect to w*f at w = 0
+        s = 0.5 * (1 - np.tanh(0.5 * y * m))
+        g = np.dot(self.f, -y * s)
+        h = np.dot(self.f_sq, s * (1 - s))
+
+        # Newton step on each weight - costs are averages, hence the scaled regularization
+        w = -g / (h + epsilon * self.P)
+
+        # exact cost at the Newton step - the step values of every monomial at once, in O(M*P)
+        costs = np.mean(np.logaddexp(0, -y * (m + w[:, np.newaxis] * self.f)), axis=1)
+        return costs, w
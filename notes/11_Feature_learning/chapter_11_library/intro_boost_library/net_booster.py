@@ -2,6 +2,7 @@ import autograd.numpy as np
 from . import optimizers
 from . import cost_functions
 from . import normalizers
+from . import ensemble
 import copy
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
@@ -78,6 +79,17 @@ class Setup:
         if "epsilon" in kwargs:
             epsilon = kwargs["epsilon"]
 
+        # hessian-free newton settings
+        hessian_free = False
+        if "hessian_free" in kwargs:
+            hessian_free = kwargs["hessian_free"]
+        cg_max_its = 20
+        if "cg_max_its" in kwargs:
+            cg_max_its = kwargs["cg_max_its"]
+
+        # convergence tolerances - each run stops early once any one is met (0 = off)
+        tols = optimizers.convergence_tolerances(kwargs)
+
         # batch size for gradient descent?
         self.w = 0.0 * np.random.randn(self.x.shape[0] + 1, 1)
         num_pts = np.size(self.y)
@@ -87,10 +99,12 @@ class Setup:
 
         # run gradient descent
         if optimizer_name == "gradient_descent":
-            self.optimizer = lambda cost, x, y, w: optimizers.gradient_descent(cost, w, x, y, alpha_choice, max_its, batch_size)
+            self.optimizer = lambda cost, x, y, w: optimizers.gradient_descent(cost, w, x, y, alpha_choice, max_its, batch_size, **tols)
 
         if optimizer_name == "newtons_method":
-            self.optimizer = lambda cost, x, y, w: optimizers.newtons_method(cost, w, x, y, max_its, epsilon=epsilon)
+            self.optimizer = lambda cost, x, y, w: optimizers.newtons_method(
+                cost, w, x, y, max_its, epsilon=epsilon, hessian_free=hessian_free, cg_max_its=cg_max_its, **tols
+            )
 
     # define activation
     def choose_activation(self, activation):
@@ -134,16 +148,21 @@ class Setup:
         w_best = w_hist[ind]
 
         # lock in model_0 value
-        model = lambda x, w=w_best: model_0(x, w)
-        self.best_steps.append(copy.deepcopy(model))
-        self.models.append(copy.deepcopy(model))
-        model = lambda x, steps=self.best_steps: np.sum([v(x) for v in steps], axis=0)
+        self.best_steps.append(lambda x, w=w_best: model_0(x, w))
+        self.models.append(ensemble.Ensemble(self.best_steps, 1))
+
+        # running predictions of the current model on the training and validation points - kept as an
+        # extra row of the input so they are batched along with it, and updated as each step is locked
+        # in - so that each round evaluates only its new step
+        x_train = np.vstack((self.x_train, self.best_steps[-1](self.x_train)))
+        x_valid = np.vstack((self.x_valid, self.best_steps[-1](self.x_valid)))
+        model = lambda x: x[-1:, :]
 
         train_cost_val = c_hist[ind]
         self.train_cost_vals.append(copy.deepcopy(train_cost_val))
 
         if self.y_valid.size > 0:
-            valid_cost_val = self.cost.cost(w_best, self.x_valid, self.y_valid, np.arange(len(self.y_valid)))
+            valid_cost_val = self.cost.cost(w_best, self.x_valid, self.y_valid, np.arange(self.y_valid.size))
             self.valid_cost_vals.append(copy.deepcopy(valid_cost_val))
 
         # pluck counter
@@ -165,11 +184,11 @@ class Setup:
         ):
             self.counter.set_model(model)
 
-            train_count = self.counter.cost(self.x_train, self.y_train)
+            train_count = self.counter.cost(x_train, self.y_train)
             self.train_count_vals.append(train_count)
 
             if self.y_valid.size > 0:
-                valid_count = self.counter.cost(self.x_valid, self.y_valid)
+                valid_count = self.counter.cost(x_valid, self.y_valid)
                 self.valid_count_vals.append(valid_count)
 
         # boost rounds
@@ -184,11 +203,11 @@ class Setup:
 
             # construct model to test
             next_unit = lambda x, w: self.perceptron(x, w)
-            current_model = lambda x, w: model(x) + next_unit(x, w)
+            current_model = lambda x, w: model(x) + next_unit(x[:-1, :], w)
 
             # load in current model
             self.cost.set_model(current_model)
-            w_hist, c_hist = self.optimizer(self.cost.cost, self.x_train, self.y_train, w)
+            w_hist, c_hist = self.optimizer(self.cost.cost, x_train, self.y_train, w)
 
             # determine smallest cost value attained
             ind = np.argmin(c_hist)
@@ -197,9 +216,18 @@ class Setup:
             self.train_cost_vals.append(copy.deepcopy(best_train_cost))
 
             if self.y_valid.size > 0:
-                best_valid_cost = self.cost.cost(w_best, self.x_valid, self.y_valid, np.arange(len(self.y_valid)))
+                best_valid_cost = self.cost.cost(w_best, x_valid, self.y_valid, np.arange(self.y_valid.size))
                 self.valid_cost_vals.append(copy.deepcopy(best_valid_cost))
 
+            # best_perceptron = lambda x,w=w_best: np.dot(self.perceptron(x,w[0]).T,w[1]).T
+            best_perceptron = lambda x, w=w_best: next_unit(x, w)
+            self.best_steps.append(best_perceptron)
+
+            # fix next model, and update running predictions with its new step
+            self.models.append(ensemble.Ensemble(self.best_steps, len(self.best_steps)))
+            x_train[-1:, :] += best_perceptron(self.x_train)
+            x_valid[-1:, :] += best_perceptron(self.x_valid)
+
             # pluck counter
             if (
                 self.cost_name == "softmax"
@@ -207,21 +235,12 @@ class Setup:
                 or self.cost_name == "multiclass_softmax"
                 or self.cost_name == "multiclass_perceptron"
             ):
-                self.counter.set_model(model)
-
-                train_count = self.counter.cost(self.x_train, self.y_train)
+                train_count = self.counter.cost(x_train, self.y_train)
                 self.train_count_vals.append(train_count)
 
-                self.valid_count_vals.append(valid_count)
-                valid_count = self.counter.cost(self.x_valid, self.y_valid)
-
-            # best_perceptron = lambda x,w=w_best: np.dot(self.perceptron(x,w[0]).T,w[1]).T
-            best_perceptron = lambda x, w=w_best: next_unit(x, w)
-            self.best_steps.append(copy.deepcopy(best_perceptron))
-
-            # fix next model
-            model = lambda x, steps=self.best_steps: np.sum([v(x) for v in steps], axis=0)
-            self.models.append(copy.deepcopy(model))
+                if self.y_valid.size > 0:
+                    valid_count = self.counter.cost(x_valid, self.y_valid)
+                    self.valid_count_vals.append(valid_count)
 
         if verbose:
             print("boosting complete!")
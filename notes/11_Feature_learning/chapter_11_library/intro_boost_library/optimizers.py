@@ -1,16 +1,89 @@
 import autograd.numpy as np
 from autograd import value_and_grad
 from autograd import hessian
+from autograd import grad as compute_grad
+from autograd import make_jvp
 from autograd.misc.flatten import flatten_func
 
 
+# truncated conjugate gradient solve of the linear system A d = b, where A is only
+# available through matrix-vector products A_prod(v) - stops early once the residual
+# is small or a direction of non-positive curvature is found
+def conjugate_gradient(A_prod, b, max_its, **kwargs):
+    # relative residual tolerance
+    tol = 10 ** (-10)
+    if "tol" in kwargs:
+        tol = kwargs["tol"]
+
+    # initialize solution, residual, and search direction
+    d = np.zeros(np.shape(b))
+    r = b
+    p = r
+    r_sq = np.dot(r, r)
+    b_norm = np.sqrt(r_sq)
+
+    for i in range(max_its):
+        if np.sqrt(r_sq) <= tol * b_norm:
+            break
+
+        # non-positive curvature - fall back to steepest descent on the first pass
+        Ap = A_prod(p)
+        curvature = np.dot(p, Ap)
+        if curvature <= 0:
+            if i == 0:
+                d = b
+            break
+
+        # take step along conjugate direction, update residual and direction
+        step = r_sq / curvature
+        d = d + step * p
+        r = r - step * Ap
+        r_sq_new = np.dot(r, r)
+        p = r + (r_sq_new / r_sq) * p
+        r_sq = r_sq_new
+    return d
+
+
+# convergence tolerances on the gradient norm, relative change in cost and relative step size -
+# read from an optimizer's keyword arguments, each off (0) unless given
+def convergence_tolerances(kwargs):
+    tols = {"grad_tol": 0, "cost_tol": 0, "step_tol": 0}
+    for key in tols:
+        if key in kwargs:
+            tols[key] = kwargs[key]
+    return tols
+
+
+# check for convergence at weights w, reached from the previously recorded weights w_prev, given a full
+# batch gradient at either and the costs at both - any of which may be None when unavailable - returns
+# the name of the tolerance met, or None to keep going
+def check_convergence(tols, w, w_prev, grad_eval, cost_eval, cost_prev):
+    if tols["grad_tol"] > 0 and grad_eval is not None and np.linalg.norm(grad_eval) <= tols["grad_tol"]:
+        return "grad_tol"
+    if tols["cost_tol"] > 0 and cost_eval is not None and cost_prev is not None:
+        if np.abs(cost_prev - cost_eval) <= tols["cost_tol"] * np.abs(cost_prev):
+            return "cost_tol"
+    if tols["step_tol"] > 0 and w_prev is not None and np.linalg.norm(w - w_prev) <= tols["step_tol"] * (1 + np.linalg.norm(w_prev)):
+        return "step_tol"
+    return None
+
+
 #### optimizers ####
 # minibatch gradient descent
-def gradient_descent(g, w, x, y, alpha_choice, max_its, batch_size):
+def gradient_descent(g, w, x, y, alpha_choice, max_its, batch_size, **kwargs):
     # flatten the input function, create gradient based on flat function
     g_flat, unflatten, w = flatten_func(g, w)
     grad = value_and_grad(g_flat)
 
+    # convergence tolerances, and an optional dictionary in which to report why and at which
+    # iteration the run stopped
+    tols = convergence_tolerances(kwargs)
+    stop_info = {}
+    if "stop_info" in kwargs:
+        stop_info = kwargs["stop_info"]
+    stop_info["reason"] = "max_its"
+    stop_info["iteration"] = None
+
     # record history
     num_train = y.size
     w_hist = [unflatten(w)]
@@ -29,6 +102,7 @@ def gradient_descent(g, w, x, y, alpha_choice, max_its, batch_size):
         else:
             alpha = alpha_choice
 
+        w_prev = w
         for b in range(num_batches):
             # collect indices of current mini-batch
             batch_inds = np.arange(b * batch_size, min((b + 1) * batch_size, num_train))
@@ -46,6 +120,16 @@ def gradient_descent(g, w, x, y, alpha_choice, max_its, batch_size):
         # record weight update, train and val costs
         w_hist.append(unflatten(w))
         train_hist.append(train_cost)
+
+        # stop early once converged - the gradient norm is only checked for full batch steps
+        full_grad_eval = None
+        if num_batches == 1:
+            full_grad_eval = grad_eval
+        stop_reason = check_convergence(tols, w, w_prev, full_grad_eval, train_hist[-1], train_hist[-2])
+        if stop_reason is not None:
+            stop_info["reason"] = stop_reason
+            stop_info["iteration"] = k + 1
+            break
     return w_hist, train_hist
 
 
@@ -63,6 +147,27 @@ def newtons_method(g, w, x, y, max_its, **kwargs):
     if "epsilon" in kwargs:
         epsilon = kwargs["epsilon"]
 
+    # solve each Newton system by truncated conjugate gradient using only Hessian-vector
+    # products - never forming the Hessian - with at most cg_max_its inner iterations?
+    hessian_free = False
+    if "hessian_free" in kwargs:
+        hessian_free = kwargs["hessian_free"]
+    cg_max_its = 20
+    if "cg_max_its" in kwargs:
+        cg_max_its = kwargs["cg_max_its"]
+
+    # Hessian-vector products computed forward-over-reverse
+    hess_vec = make_jvp(compute_grad(g_flat))
+
+    # convergence tolerances, and an optional dictionary in which to report why and at which
+    # iteration the run stopped
+    tols = convergence_tolerances(kwargs)
+    stop_info = {}
+    if "stop_info" in kwargs:
+        stop_info = kwargs["stop_info"]
+    stop_info["reason"] = "max_its"
+    stop_info["iteration"] = None
+
     # record history
     num_train = y.size
     w_hist = [unflatten(w)]
@@ -71,18 +176,25 @@ def newtons_method(g, w, x, y, max_its, **kwargs):
     # over the line
     for k in range(max_its):
         # evaluate the gradient, store current weights and cost function value
+        w_prev = w
         cost_eval, grad_eval = grad(w, x, y, np.arange(num_train))
 
-        # evaluate the hessian
-        hess_eval = hess(w, x, y, np.arange(num_train))
+        # hessian-free - solve regularized second order system with conjugate gradient
+        if hessian_free == True:
+            hess_vec_eval = hess_vec(w, x, y, np.arange(num_train))
+            A_prod = lambda v: hess_vec_eval(v)[1] + epsilon * v
+            w = w + conjugate_gradient(A_prod, -grad_eval, cg_max_its)
+        else:
+            # evaluate the hessian
+            hess_eval = hess(w, x, y, np.arange(num_train))
 
-        # reshape for numpy linalg functionality
-        hess_eval.shape = (int((np.size(hess_eval)) ** (0.5)), int((np.size(hess_eval)) ** (0.5)))
+            # reshape for numpy linalg functionality
+            hess_eval.shape = (int((np.size(hess_eval)) ** (0.5)), int((np.size(hess_eval)) ** (0.5)))
 
-        # solve second order system system for weight update
-        A = hess_eval + epsilon * np.eye(np.size(w))
-        b = grad_eval
-        w = np.linalg.lstsq(A, np.dot(A, w) - b)[0]
+            # solve second order system system for weight update
+            A = hess_eval + epsilon * np.eye(np.size(w))
+            b = grad_eval
+            w = np.linalg.lstsq(A, np.dot(A, w) - b)[0]
 
         # w = w - np.dot(np.linalg.pinv(hess_eval + epsilon*np.eye(np.size(w))),grad_eval)
 
@@ -93,4 +205,11 @@ def newtons_method(g, w, x, y, max_its, **kwargs):
         w_hist.append(unflatten(w))
         train_hist.append(train_cost)
 
+        # stop early once converged
+        stop_reason = check_convergence(tols, w, w_prev, grad_eval, train_hist[-1], train_hist[-2])
+        if stop_reason is not None:
+            stop_info["reason"] = stop_reason
+            stop_info["iteration"] = k + 1
+            break
+
     return w_hist, train_hist
@@ -0,0 +1,71 @@
+import autograd.numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# candidate fitting function shared with forked workers - inherited rather than pickled per task
+fit_candidate = None
+
+
+# fit each candidate of one chunk from its initial weights, returning the (train cost, position, weight)
+# of the best among them - ties going to the candidate coming first
+def best_of_chunk(positions, candidates, inits):
+    best = None
+    for p, n, w in zip(positions, candidates, inits):
+        cost, weight = fit_candidate(n, w)
+        if best is None or cost < best[0]:
+            best = (cost, p, weight)
+    return best
+
+
+# copy of array a in memory shared with forked worker processes, if there are any - so that updates made
+# to it here, e.g., to the running predictions of a booster, are seen by the workers
+def shared_array(a, num_workers):
+    if num_workers == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return np.array(a, dtype=float)
+    raw = multiprocessing.get_context("fork").RawArray("d", max(np.size(a), 1))
+    shared = np.frombuffer(raw, dtype=float)[: np.size(a)].reshape(np.shape(a))
+    shared[...] = a
+    return shared
+
+
+class Setup:
+    """
+    Parallel evaluation of the candidates of a boosting round.  Candidates are split into contiguous
+    chunks, one per forked worker process, each returning its best fit - which are then reduced to the
+    overall best.  fit(n, w) fits candidate n from initial weights w, returning its training cost and
+    weights, and should read any data that changes between rounds from shared arrays.  As ties go to
+    the candidate coming first, results do not depend on the number of workers.  Chunks are evaluated
+    in turn here where fork is unavailable.
+    """
+
+    def __init__(self, fit, num_workers):
+        self.num_workers = num_workers
+
+        # workers are forked on demand, while the shared function is set
+        global fit_candidate
+        fit_candidate = fit
+        self.executor = None
+        if num_workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            self.executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=context)
+
+    # best of the candidates, each fit from the initial weights of the same position in inits - returns
+    # the best candidate, its weights, and its training cost
+    def best(self, candidates, inits):
+        chunks = [chunk for chunk in np.array_split(np.arange(len(candidates)), self.num_workers) if np.size(chunk) > 0]
+        chunk_candidates = [[candidates[p] for p in chunk] for chunk in chunks]
+        chunk_inits = [[inits[p] for p in chunk] for chunk in chunks]
+        if self.executor is not None:
+            results = list(self.executor.map(best_of_chunk, chunks, chunk_candidates, chunk_inits))
+        else:
+            results = [best_of_chunk(*args) for args in zip(chunks, chunk_candidates, chunk_inits)]
+
+        # reduce to the lowest cost overall, ties going to the candidate coming first
+        cost, p, weight = min(results, key=lambda result: (result[0], result[1]))
+        return candidates[p], weight, cost
+
+    def close(self):
+        global fit_candidate
+        if self.executor is not None:
+            self.executor.shutdown()
+        fit_candidate = None
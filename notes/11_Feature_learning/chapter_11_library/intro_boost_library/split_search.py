@@ -0,0 +1,91 @@
+import autograd.numpy as np
+
+
+# candidate splits at the interior quantiles of each input dimension - at most num_bins - 1 per dimension
+def quantile_splits(x, num_bins):
+    splits = []
+    dims = []
+    for n in range(np.shape(x)[0]):
+        thresholds = np.unique(np.quantile(x[n, :], np.linspace(0, 1, num_bins + 1)[1:-1]))
+        splits.extend(thresholds)
+        dims.extend([n] * len(thresholds))
+    return np.array(splits), np.array(dims)
+
+
+class Setup:
+    """
+    Closed-form split search for stumps.  Each candidate split is a threshold along one input dimension,
+    with points at or below it falling to the left.  The points x are binned once by the thresholds of
+    each dimension, after which the sum of any per-point quantity on either side of every split follows
+    from one bincount and one prefix sum - scoring all splits in O(N*P) time.
+    """
+
+    def __init__(self, x, splits, dims):
+        self.splits = np.asarray(splits, dtype=float)
+        self.dims = np.asarray(dims, dtype=int)
+        self.N, self.P = np.shape(x)
+
+        # bin the points along each dimension by its sorted thresholds - a point lies left of the j^th
+        # threshold exactly when its bin is at most j - with the bins of all dimensions laid end to end
+        point_bins = np.zeros((self.N, self.P), dtype=int)
+        self.lo = np.zeros(np.size(self.splits), dtype=int)
+        self.hi = np.zeros(np.size(self.splits), dtype=int)
+        offset = 0
+        for n in range(self.N):
+            cands = np.flatnonzero(self.dims == n)
+            thresholds = np.unique(self.splits[cands])
+            point_bins[n] = offset + np.searchsorted(thresholds, x[n, :], side="left")
+            self.lo[cands] = offset
+            self.hi[cands] = offset + np.searchsorted(thresholds, self.splits[cands]) + 1
+            offset += np.size(thresholds) + 1
+        self.point_bins = point_bins.ravel()
+        self.num_bins = offset
+
+        # number of points on either side of each split
+        self.left_counts, self.right_counts = self.leaf_sums(np.ones(self.P))
+
+    # sums of the per-point values v to the left and right of every split
+    def leaf_sums(self, v):
+        bin_sums = np.bincount(self.point_bins, weights=np.tile(v, self.N), minlength=self.num_bins)
+        prefix_sums = np.concatenate((np.zeros(1), np.cumsum(bin_sums)))
+        left = prefix_sums[self.hi] - prefix_sums[self.lo]
+        return left, np.sum(v) - left
+
+    # least squares - leaf values of one regularized Newton step from zero, given residuals r of the
+    # current model.  With no regularization this is the mean residual falling in each leaf, and the
+    # mean squared error of every split follows from the residual sums.  A leaf with no points is given
+    # value zero
+    def least_squares(self, r, epsilon):
+        r_left, r_right = self.leaf_sums(r)
+
+        # Newton step on each leaf - the hessian of the mean squared error is twice the leaf count over P
+        d_left = self.left_counts + 0.5 * epsilon * self.P
+        d_right = self.right_counts + 0.5 * epsilon * self.P
+        w_left = r_left / np.where(d_left > 0, d_left, 1)
+        w_right = r_right / np.where(d_right > 0, d_right, 1)
+
+        # the cost is quadratic in the leaf values, so this is exact
+        cost = np.sum(r**2)
+        cost += w_left * (w_left * self.left_counts - 2 * r_left)
+        cost += w_right * (w_right * self.right_counts - 2 * r_right)
+        return cost / float(self.P), w_left, w_right
+
+    # softmax - leaf values of one regularized Newton step from zero, taken from the current model
+    # predictions m on labels y, along with the second order model of the cost after each step
+    def softmax_newton(self, y, m, epsilon):
+        # per-point gradient and hessian of log(1 + exp(-y*(m + w))) at w = 0
+        s = 0.5 * (1 - np.tanh(0.5 * y * m))
+        g = -y * s
+        h = s * (1 - s)
+
+        # Newton step on each leaf - costs are averages, hence the scaled regularization
+        g_left, g_right = self.leaf_sums(g)
+        h_left, h_right = self.leaf_sums(h)
+        w_left = -g_left / (h_left + epsilon * self.P)
+        w_right = -g_right / (h_right + epsilon * self.P)
+
+        # second order model of the cost at the Newton step
+        cost = np.sum(np.logaddexp(0, -y * m))
+        cost += g_left * w_left + 0.5 * h_left * w_left**2
+        cost += g_right * w_right + 0.5 * h_right * w_right**2
+        return cost / float(self.P), w_left, w_right
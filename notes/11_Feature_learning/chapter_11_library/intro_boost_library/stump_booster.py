@@ -2,6 +2,10 @@ import autograd.numpy as np
 from . import optimizers
 from . import cost_functions
 from . import normalizers
+from . import split_search
+from . import ensemble
+from . import stump_ensemble
+from . import round_executor
 import copy
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
@@ -78,6 +82,17 @@ class Setup:
         if "epsilon" in kwargs:
             epsilon = kwargs["epsilon"]
 
+        # hessian-free newton settings
+        hessian_free = False
+        if "hessian_free" in kwargs:
+            hessian_free = kwargs["hessian_free"]
+        cg_max_its = 20
+        if "cg_max_its" in kwargs:
+            cg_max_its = kwargs["cg_max_its"]
+
+        # convergence tolerances - each run stops early once any one is met (0 = off)
+        tols = optimizers.convergence_tolerances(kwargs)
+
         # batch size for gradient descent?
         self.w = 0.0 * np.random.randn(self.x.shape[0] + 1, 1)
         num_pts = np.size(self.y)
@@ -85,56 +100,53 @@ class Setup:
         if "batch_size" in kwargs:
             self.batch_size = kwargs["batch_size"]
 
+        # record choices - stumps are fit in closed form for some costs / optimizers
+        self.optimizer_name = optimizer_name
+        self.max_its = max_its
+        self.epsilon = epsilon
+
         # run gradient descent
         if optimizer_name == "gradient_descent":
-            self.optimizer = lambda cost, x, y, w: optimizers.gradient_descent(cost, w, x, y, alpha_choice, max_its, batch_size)
+            self.optimizer = lambda cost, x, y, w: optimizers.gradient_descent(cost, w, x, y, alpha_choice, max_its, batch_size, **tols)
 
         if optimizer_name == "newtons_method":
-            self.optimizer = lambda cost, x, y, w: optimizers.newtons_method(cost, w, x, y, max_its, epsilon=epsilon)
+            self.optimizer = lambda cost, x, y, w: optimizers.newtons_method(
+                cost, w, x, y, max_its, epsilon=epsilon, hessian_free=hessian_free, cg_max_its=cg_max_its, **tols
+            )
 
     ### create prototype steps ###
-    def create_proto_stumps(self):
+    # a stump along dimension dim, splitting at split - with value w[0] to the left and w[1] to the right
+    def stump(self, split, dim):
+        def step(x, w):
+            left = (x[dim, :] <= split)[np.newaxis, :]
+            return w[0] * left + w[1] * (1 - left)
+
+        return step
+
+    # split points halfway between consecutive points along each dimension whose labels differ
+    def create_proto_splits(self):
         # for which dimension the stump is defined along
         splits = []
         dims = []
 
-        # important constants: dimension of input N and total number of points P
-        N = np.shape(self.x)[0]
-        P = np.size(self.y)
-
         # begin outer loop - loop over each dimension of the input - create split points and dimensions
+        N = np.shape(self.x)[0]
         for n in range(N):
-            # make a copy of the n^th dimension of the input data (we will sort after this)
-            x_n = copy.deepcopy(self.x[n, :])
-            y_n = copy.deepcopy(self.y)
-
-            # sort x_n and y_n according to ascending order in x_n
-            sorted_inds = np.argsort(x_n, axis=0)
-            x_n = x_n[sorted_inds]
-            y_n = y_n[0, sorted_inds]
-
-            # loop over points and create stump in between each
-            # in dimension n
-            for p in range(P - 1):
-                if y_n[p] != y_n[p + 1]:
-                    # compute split point
-                    split = (x_n[p] + x_n[p + 1]) / float(2)
-
-                    ### create non-zero stump to 'left' of split ###
-                    # compute and store split point
-                    splits.append(split)
-                    dims.append(n)
+            # sort the n^th dimension of the input, and the output, according to ascending order in x_n
+            sorted_inds = np.argsort(self.x[n, :])
+            x_n = self.x[n, sorted_inds]
+            y_n = self.y[0, sorted_inds]
+
+            # create stump in between each pair of consecutive points in dimension n with different labels
+            change = np.flatnonzero(y_n[:-1] != y_n[1:])
+            splits.append((x_n[change] + x_n[change + 1]) / float(2))
+            dims.append(n * np.ones(np.size(change), dtype=int))
+        return np.concatenate(splits), np.concatenate(dims)
 
+    def create_proto_stumps(self):
         ### create stumps out of splits and dims ###
-        all_steps = []
-        for ind in range(len(dims)):
-            # create step function
-            split = splits[ind]
-            dim = dims[ind]
-            step = lambda x, w, split=split, dim=dim: np.array([(w[0] if v <= split else w[1]) for v in x[dim, :]])
-
-            # add to list
-            all_steps.append(copy.deepcopy(step))
+        splits, dims = self.create_proto_splits()
+        all_steps = [self.stump(split, dim) for split, dim in zip(splits, dims)]
         return all_steps
 
     ### boost it ###
@@ -143,17 +155,37 @@ class Setup:
         if "verbose" in kwargs:
             verbose = kwargs["verbose"]
 
-        # create proto stumps
-        all_steps = self.create_proto_stumps()
-
-        # adjust num_rounds based on total number of step features available
-        num_steps = len(all_steps)
+        # candidate splits - between consecutive points with different labels along each dimension, or
+        # at the quantiles of each dimension when a number of histogram bins is given
+        num_bins = None
+        if "num_bins" in kwargs:
+            num_bins = kwargs["num_bins"]
+        if num_bins is None:
+            splits, dims = self.create_proto_splits()
+        else:
+            splits, dims = split_search.quantile_splits(self.x, num_bins)
+
+        # adjust num_rounds based on total number of step features available - stumps themselves are
+        # only created for the candidates fit
+        num_steps = np.size(splits)
+
+        # least squares and softmax stumps fit by a single Newton step have closed form leaf values - so
+        # every split can be scored at once from sums of the training residuals
+        searcher = None
+        closed_form = self.cost_name == "least_squares" or self.cost_name == "softmax"
+        if closed_form and self.optimizer_name == "newtons_method" and self.max_its == 1:
+            searcher = split_search.Setup(self.x_train, splits, dims)
 
         # set maximum number of random steps to check per round
         max_check = num_steps
         if "max_check" in kwargs:
             max_check = kwargs["max_check"]
 
+        # number of worker processes candidates are fit across, when not fit in closed form
+        num_workers = 1
+        if "num_workers" in kwargs:
+            num_workers = kwargs["num_workers"]
+
         # container for models and cost function histories
         self.best_steps = []
         self.train_cost_vals = []
@@ -171,14 +203,26 @@ class Setup:
         best_w = w_hist[ind][0]
 
         # lock in model_0 value
-        model = lambda x, w=best_w: model_0(x, w)
-        self.best_steps.append(copy.deepcopy(model))
-        self.models.append(copy.deepcopy(model))
+        self.best_steps.append(lambda x, w=best_w: model_0(x, w))
+        self.models.append(ensemble.Ensemble(self.best_steps, 1))
+
+        # flat record of the ensemble - the split, dimension and leaf values of each stump locked in
+        bias = best_w[0]
+        best_splits = []
+        best_dims = []
+        best_leaves = []
+
+        # running predictions of the current model on the training and validation points - kept as an
+        # extra row of the input so they are batched along with it, and updated as each step is locked
+        # in - so that each round evaluates only its new step.  These are shared with any worker processes
+        x_train = round_executor.shared_array(np.vstack((self.x_train, self.best_steps[-1](self.x_train))), num_workers)
+        x_valid = round_executor.shared_array(np.vstack((self.x_valid, self.best_steps[-1](self.x_valid))), num_workers)
+        model = lambda x: x[-1:, :]
         train_cost_val = c_hist[ind]
         self.train_cost_vals.append(train_cost_val)
 
         if self.y_valid.size > 0:
-            valid_cost_val = self.cost.cost(best_w, self.x_valid, self.y_valid, np.arange(len(self.y_valid)))
+            valid_cost_val = self.cost.cost(best_w, self.x_valid, self.y_valid, np.arange(self.y_valid.size))
             self.valid_cost_vals.append(valid_cost_val)
 
         # pluck counter
@@ -200,99 +244,136 @@ class Setup:
         ):
             self.counter.set_model(model)
 
-            train_count = self.counter.cost(self.x_train, self.y_train)
+            train_count = self.counter.cost(x_train, self.y_train)
             self.train_count_vals.append(train_count)
 
             if self.y_valid.size > 0:
-                valid_count = self.counter.cost(self.x_valid, self.y_valid)
+                valid_count = self.counter.cost(x_valid, self.y_valid)
                 self.valid_count_vals.append(valid_count)
 
-        for i in range(num_rounds):
-            # index sets to keep track of which feature-touching weights have been used
-            # thus far
-            used = [0]
-            check_inds = np.random.permutation(num_steps)[:max_check] + 1
-            unused = {i for i in check_inds}
-
-            if verbose == True:
-                print("starting round " + str(i + 1) + " of " + str(num_rounds) + " of boosting")
-
-            # loop over unused indices and try out each remaining corresponding weight
-            best_weight = 0
-            best_train_cost = np.inf
-            best_valid_cost = np.inf
-            best_ind = 0
-            for n in unused:
-                # get current proto-step to test
-                current_step = all_steps[n - 1]
-                w = np.zeros((2,))
-
-                # construct model to test
-                current_model = lambda x, w: model(x) + current_step(x, w)
-
-                # load in current model
-                self.cost.set_model(current_model)
-                w_hist, c_hist = self.optimizer(self.cost.cost, self.x_train, self.y_train, w)
-
-                # determine smallest cost value attained
-                ind = np.argmin(c_hist)
-                weight = w_hist[ind]
-                train_cost_val = c_hist[ind]
-
-                if self.y_valid.size > 0:
-                    valid_cost_val = self.cost.cost(weight, self.x_valid, self.y_valid, np.arange(len(self.y_valid)))
-
-                # update smallest cost val / associated weight
-                if train_cost_val < best_train_cost:
-                    best_w = weight
-                    best_train_cost = train_cost_val
-                    best_ind = n
-
+        # fit candidate stump n from initial leaf values w with the optimizer, returning its lowest cost and weights
+        def fit(n, w):
+            current_step = self.stump(splits[n - 1], dims[n - 1])
+            current_model = lambda x, w: model(x) + current_step(x[:-1, :], w)
+            self.cost.set_model(current_model)
+            w_hist, c_hist = self.optimizer(self.cost.cost, x_train, self.y_train, w)
+            ind = np.argmin(c_hist)
+            return c_hist[ind], w_hist[ind]
+
+        executor = None
+        if searcher is None:
+            executor = round_executor.Setup(fit, num_workers)
+
+        try:
+            for i in range(num_rounds):
+                # index sets to keep track of which feature-touching weights have been used
+                # thus far
+                used = [0]
+                check_inds = np.random.permutation(num_steps)[:max_check] + 1
+
+                if verbose == True:
+                    print("starting round " + str(i + 1) + " of " + str(num_rounds) + " of boosting")
+
+                # loop over unused indices and try out each remaining corresponding weight
+                best_weight = 0
+                best_train_cost = np.inf
+                best_valid_cost = np.inf
+                best_ind = 0
+
+                # score all splits in closed form, and fit the best of those checked this round
+                if searcher is not None:
+                    y_train = self.y_train[0, :]
+                    m_train = x_train[-1, :]
+                    if self.cost_name == "least_squares":
+                        costs, w_left, w_right = searcher.least_squares(y_train - m_train, self.epsilon)
+                    else:
+                        costs, w_left, w_right = searcher.softmax_newton(y_train, m_train, self.epsilon)
+                    check = np.sort(check_inds) - 1
+                    best_ind = check[np.argmin(costs[check])] + 1
+                    best_w = np.array([w_left[best_ind - 1], w_right[best_ind - 1]])
+
+                    # exact cost of the step - a Newton step that fails to descend is not taken
+                    current_step = self.stump(splits[best_ind - 1], dims[best_ind - 1])
+                    current_model = lambda x, w: model(x) + current_step(x[:-1, :], w)
+                    self.cost.set_model(current_model)
+                    best_train_cost = self.cost.cost(best_w, x_train, self.y_train, np.arange(self.y_train.size))
+                    zero_cost = self.cost.cost(np.zeros((2,)), x_train, self.y_train, np.arange(self.y_train.size))
+                    if zero_cost < best_train_cost:
+                        best_w = np.zeros((2,))
+                        best_train_cost = zero_cost
                     if self.y_valid.size > 0:
-                        best_valid_cost = valid_cost_val
-
-            # after sweeping through and computing minimum for all subproblems
-            # update the best weight value
-            self.train_cost_vals.append(copy.deepcopy(best_train_cost))
-
-            if self.y_valid.size > 0:
-                self.valid_cost_vals.append(copy.deepcopy(best_valid_cost))
+                        best_valid_cost = self.cost.cost(best_w, x_valid, self.y_valid, np.arange(self.y_valid.size))
 
-            best_step = lambda x, w=best_w, ind=best_ind - 1: all_steps[ind](x, w)
-            self.best_steps.append(copy.deepcopy(best_step))
-
-            # fix next model
-            model = lambda x, steps=self.best_steps: np.sum([v(x) for v in steps])
-            self.models.append(copy.deepcopy(model))
-
-            # pluck counter
-            if (
-                self.cost_name == "softmax"
-                or self.cost_name == "perceptron"
-                or self.cost_name == "multiclass_softmax"
-                or self.cost_name == "multiclass_perceptron"
-            ):
-                self.counter.set_model(model)
+                # otherwise fit each candidate checked with the optimizer - spread over any worker processes
+                else:
+                    candidates = list({i for i in check_inds})
+                    inits = [np.zeros((2,)) for n in candidates]
+                    best_ind, best_w, best_train_cost = executor.best(candidates, inits)
+                    if self.y_valid.size > 0:
+                        current_step = self.stump(splits[best_ind - 1], dims[best_ind - 1])
+                        self.cost.set_model(lambda x, w: model(x) + current_step(x[:-1, :], w))
+                        best_valid_cost = self.cost.cost(best_w, x_valid, self.y_valid, np.arange(self.y_valid.size))
 
-                train_count = self.counter.cost(self.x_train, self.y_train)
-                self.train_count_vals.append(train_count)
+                # after sweeping through and computing minimum for all subproblems
+                # update the best weight value
+                self.train_cost_vals.append(copy.deepcopy(best_train_cost))
 
                 if self.y_valid.size > 0:
-                    valid_count = self.counter.cost(self.x_valid, self.y_valid)
-                    self.valid_count_vals.append(valid_count)
+                    self.valid_cost_vals.append(copy.deepcopy(best_valid_cost))
+
+                best_stump = self.stump(splits[best_ind - 1], dims[best_ind - 1])
+                best_step = lambda x, w=best_w, stump=best_stump: stump(x, w)
+                self.best_steps.append(best_step)
+                best_splits.append(splits[best_ind - 1])
+                best_dims.append(dims[best_ind - 1])
+                best_leaves.append(best_w)
+
+                # fix next model, and update running predictions with its new step
+                self.models.append(ensemble.Ensemble(self.best_steps, len(self.best_steps)))
+                x_train[-1:, :] += best_step(self.x_train)
+                x_valid[-1:, :] += best_step(self.x_valid)
+
+                # pluck counter
+                if (
+                    self.cost_name == "softmax"
+                    or self.cost_name == "perceptron"
+                    or self.cost_name == "multiclass_softmax"
+                    or self.cost_name == "multiclass_perceptron"
+                ):
+                    self.counter.set_model(model)
+
+                    train_count = self.counter.cost(x_train, self.y_train)
+                    self.train_count_vals.append(train_count)
 
-            # remove best index from unused set, add to used set
-            # unused -= {best_ind}
-            used.append(best_ind)
+                    if self.y_valid.size > 0:
+                        valid_count = self.counter.cost(x_valid, self.y_valid)
+                        self.valid_count_vals.append(valid_count)
+
+                # remove best index from unused set, add to used set
+                # unused -= {best_ind}
+                used.append(best_ind)
+        finally:
+            if executor is not None:
+                executor.close()
 
         # make universals
         self.used = used
+        best_leaves = np.reshape(np.array(best_leaves, dtype=float), (-1, 2))
+        self.predictor = stump_ensemble.StumpEnsemble(bias, best_splits, best_dims, best_leaves[:, 0], best_leaves[:, 1])
 
         if verbose == True:
             print("boosting complete!")
             time.sleep(1.5)
             clear_output()
 
+    # cost of the model after every round on the points x, y - each from one row of the prefix predictions
+    # of the flat-array ensemble.  A cost of its own is used, leaving the model of self.cost untouched
+    def round_costs(self, x, y):
+        t = self.predictor.prefix_predictions(x)
+        cost = cost_functions.Setup(self.cost_name)
+        cost.set_model(lambda t, m: t[m : m + 1, :])
+        return [cost.cost(m, t, y, np.arange(np.size(y))) for m in range(len(self.predictor))]
+
     #### plotting functionality ###
     def plot_history(self):
         # colors for plotting
@@ -0,0 +1,48 @@
+import autograd.numpy as np
+
+
+class StumpEnsemble:
+    """
+    Flat-array form of a boosted ensemble of stumps - a bias, and for each stump its split, the input
+    dimension split along, and its values to the left (at or below the split) and right.  Evaluation
+    compares every point against every split at once, and the models of every round follow from one
+    cumulative sum over the stumps.
+    """
+
+    def __init__(self, bias, splits, dims, left, right):
+        self.bias = float(bias)
+        self.splits = np.asarray(splits, dtype=float)
+        self.dims = np.asarray(dims, dtype=int)
+        self.left = np.asarray(left, dtype=float)
+        self.right = np.asarray(right, dtype=float)
+
+    # number of steps, including the bias - as for ensemble.Ensemble
+    def __len__(self):
+        return np.size(self.splits) + 1
+
+    # values of each stump (one row each) on input x
+    def step_values(self, x):
+        left = x[self.dims, :] <= self.splits[:, np.newaxis]
+        return np.where(left, self.left[:, np.newaxis], self.right[:, np.newaxis])
+
+    # evaluate the model made of the first num_steps steps (by default all of them) on input x
+    def __call__(self, x, num_steps=None):
+        if num_steps is None:
+            num_steps = len(self)
+        values = self.step_values(x)[: num_steps - 1]
+        return self.bias + np.sum(values, axis=0)[np.newaxis, :]
+
+    # predictions of the model after every round on input x - the m^th row being those of the model made
+    # of the first m + 1 steps
+    def prefix_predictions(self, x):
+        values = np.vstack((self.bias * np.ones((1, np.shape(x)[1])), self.step_values(x)))
+        return np.cumsum(values, axis=0)
+
+    # save to / load from an .npz archive
+    def save(self, path):
+        np.savez(path, bias=self.bias, splits=self.splits, dims=self.dims, left=self.left, right=self.right)
+
+
+def load(path):
+    with np.load(path) as data:
+        return StumpEnsemble(data["bias"], data["splits"], data["dims"], data["left"], data["right"])
@@ -0,0 +1,215 @@
+import autograd.numpy as np
+from autograd import value_and_grad
+from autograd.misc.flatten import flatten_func
+from .weight_history import WeightHistory
+from .epoch_shuffler import EpochShuffler
+from .optimizers import flatten_value_and_grad, convergence_tolerances, check_stop
+
+
+class Setup:
+    """
+    Adaptive first order update rules - momentum, nesterov, adagrad, RMSprop and adam - acting on
+    flat weights.  All optimizer state lives in preallocated buffers and every update is computed
+    in place, so that no arrays are allocated per step.
+    """
+
+    def __init__(self, method, alpha, num_params, **kwargs):
+        self.method = method
+        self.alpha = alpha
+
+        # momentum / nesterov param
+        self.beta = 0.9
+        if "beta" in kwargs:
+            self.beta = kwargs["beta"]
+
+        # RMSprop param
+        self.gamma = 0.9
+        if "gamma" in kwargs:
+            self.gamma = kwargs["gamma"]
+
+        # adam params
+        self.beta_1 = 0.9
+        if "beta_1" in kwargs:
+            self.beta_1 = kwargs["beta_1"]
+        self.beta_2 = 0.999
+        if "beta_2" in kwargs:
+            self.beta_2 = kwargs["beta_2"]
+
+        # numerical stability param
+        self.eps = 10**-8
+        if "eps" in kwargs:
+            self.eps = kwargs["eps"]
+
+        # preallocated buffers - first moment (momentum direction), second moment (averaged
+        # or accumulated squared gradients), and the step itself
+        self.z = np.zeros(num_params)
+        self.h = np.zeros(num_params)
+        self.step_eval = np.zeros(num_params)
+
+        # RMSprop starts from a unit average of squared gradients, as the original RMSprop optimizer did
+        if method == "RMSprop":
+            self.h[:] = 1
+
+        # number of steps taken - for adam's bias correction
+        self.num_steps = 0
+
+    # divide the (scaled) direction d by the root of the second moment, storing the result in the step buffer
+    def scale_by_second_moment(self, d, h_scale):
+        s = self.step_eval
+        np.multiply(self.h, h_scale, out=s)
+        np.sqrt(s, out=s)
+        np.add(s, self.eps, out=s)
+        np.divide(d, s, out=s)
+
+    # update w in place given the gradient grad_eval at w
+    def step(self, w, grad_eval):
+        s = self.step_eval
+        self.num_steps += 1
+
+        # heavy ball momentum: z = beta*z + grad, w = w - alpha*z
+        if self.method == "momentum":
+            np.multiply(self.z, self.beta, out=self.z)
+            np.add(self.z, grad_eval, out=self.z)
+            np.multiply(self.z, self.alpha, out=s)
+
+        # nesterov momentum - written in terms of the gradient at w: z = beta*z + grad, w = w - alpha*(grad + beta*z)
+        if self.method == "nesterov":
+            np.multiply(self.z, self.beta, out=self.z)
+            np.add(self.z, grad_eval, out=self.z)
+            np.multiply(self.z, self.beta, out=s)
+            np.add(s, grad_eval, out=s)
+            np.multiply(s, self.alpha, out=s)
+
+        # adagrad: h = h + grad^2, w = w - alpha*grad/(sqrt(h) + eps)
+        if self.method == "adagrad":
+            np.multiply(grad_eval, grad_eval, out=s)
+            np.add(self.h, s, out=self.h)
+            self.scale_by_second_moment(grad_eval, 1)
+            np.multiply(s, self.alpha, out=s)
+
+        # RMSprop: h = gamma*h + (1 - gamma)*grad^2, w = w - alpha*grad/(sqrt(h) + eps)
+        if self.method == "RMSprop":
+            np.multiply(grad_eval, grad_eval, out=s)
+            np.multiply(s, 1 - self.gamma, out=s)
+            np.multiply(self.h, self.gamma, out=self.h)
+            np.add(self.h, s, out=self.h)
+            self.scale_by_second_moment(grad_eval, 1)
+            np.multiply(s, self.alpha, out=s)
+
+        # adam - exponential averages of the gradient and its square, both bias corrected
+        if self.method == "adam":
+            np.multiply(self.z, self.beta_1, out=self.z)
+            np.multiply(grad_eval, 1 - self.beta_1, out=s)
+            np.add(self.z, s, out=self.z)
+            np.multiply(grad_eval, grad_eval, out=s)
+            np.multiply(s, 1 - self.beta_2, out=s)
+            np.multiply(self.h, self.beta_2, out=self.h)
+            np.add(self.h, s, out=self.h)
+            self.scale_by_second_moment(self.z, 1 / (1 - self.beta_2**self.num_steps))
+            np.multiply(s, self.alpha / (1 - self.beta_1**self.num_steps), out=s)
+
+        # take step
+        np.subtract(w, s, out=w)
+
+
+# minibatch descent with one of the adaptive update rules above - method is one of "momentum",
+# "nesterov", "adagrad", "RMSprop" or "adam", with their parameters passed as keyword arguments
+def descent(g, method, alpha, max_its, w, num_pts, batch_size, **kwargs):
+    # flatten the input function, create gradient based on flat function
+    g_flat, unflatten, w = flatten_func(g, w)
+    grad = value_and_grad(g_flat)
+
+    # use a closed-form value and gradient in place of automatic differentiation, if provided
+    if "value_and_grad" in kwargs and kwargs["value_and_grad"] is not None:
+        grad = flatten_value_and_grad(kwargs["value_and_grad"], unflatten)
+
+    # weights are updated in place, so work on a copy of the initialization
+    w = np.array(w, dtype=float)
+    optimizer = Setup(method, alpha, np.size(w), **kwargs)
+
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight along with its cost
+    # value, when the latter comes for free from a full batch gradient evaluation.
+    # The callback may return a reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # step hook - called after each step taken (see optimizers.gradient_descent)
+    step_callback = None
+    if "step_callback" in kwargs:
+        step_callback = kwargs["step_callback"]
+
+    # convergence tolerances (see optimizers.gradient_descent), along with two buffers
+    # that take turns holding the weights at the start of the current / previous epoch
+    tols = convergence_tolerances(kwargs)
+    w_start = np.zeros(np.size(w))
+    w_spare = np.zeros(np.size(w))
+
+    # data to shuffle once per epoch (see optimizers.gradient_descent)
+    shuffler = None
+    if "shuffler" in kwargs and kwargs["shuffler"] is not None:
+        shuffler = EpochShuffler(kwargs["shuffler"], num_pts, max_its, **kwargs)
+
+    # how many mini-batches equal the entire dataset?
+    num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+    full_batch = num_batches == 1
+    if callback is not None and not full_batch:
+        callback(unflatten(np.array(w)), None)
+
+    # over the line
+    w_prev = None
+    cost_prev = None
+    stop_reason = None
+    try:
+        for k in range(max_its):
+            if shuffler is not None:
+                shuffler.shuffle()
+
+            # loop over each minibatch
+            np.copyto(w_start, w)
+            for b in range(num_batches):
+                batch_inds = slice(b * batch_size, min((b + 1) * batch_size, num_pts))
+
+                # plug in value into func and derivative
+                cost_eval, grad_eval = grad(w, batch_inds)
+
+                # full batch cost value belongs to the most recently recorded weights - stop
+                # here, before stepping, if they have converged
+                if full_batch:
+                    stop_reason = check_stop(callback, tols, unflatten, w, w_prev, grad_eval, cost_eval, cost_prev)
+                    if stop_reason is not None:
+                        break
+                    cost_prev = cost_eval
+
+                # take descent step in place
+                optimizer.step(w, grad_eval)
+                if step_callback is not None:
+                    step_callback()
+            if stop_reason is not None:
+                w_hist.stop(stop_reason, k)
+                break
+
+            # record weight update
+            w_hist.append(w)
+            w_prev, w_start, w_spare = w_start, w_spare, w_start
+            if not full_batch:
+                stop_reason = check_stop(callback, tols, unflatten, w, w_prev, None, None, None)
+                if stop_reason is not None:
+                    w_hist.stop(stop_reason, k + 1)
+                    break
+    finally:
+        if shuffler is not None:
+            shuffler.close()
+
+    # final weights have not been evaluated by a full batch gradient
+    if callback is not None and full_batch and stop_reason is None:
+        callback(unflatten(np.array(w)), None)
+
+    return w_hist
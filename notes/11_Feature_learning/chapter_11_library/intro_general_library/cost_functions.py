@@ -14,6 +14,12 @@ class Setup:
         # count parameter layers of input to feature transform
         self.sig = signature(self.feature_transforms)
 
+        # function splitting flat weights into [internal weights, final linear combination] views -
+        # given for feature transforms whose weights are kept in one flat vector
+        self.unpack = None
+        if "unpack" in kwargs:
+            self.unpack = kwargs["unpack"]
+
         ### make cost function choice ###
         # for regression
         if name == "least_squares":
@@ -48,6 +54,140 @@ class Setup:
         if "lam" in kwargs:
             self.lam = kwargs["lam"]
 
+        # pre-computed bias-padded feature matrix - available for feature transforms
+        # without internal parameters, whose features never change during training
+        self.feature_matrix = None
+        if "feature_matrix" in kwargs:
+            self.feature_matrix = kwargs["feature_matrix"]
+
+        # closed-form value / gradient and hessian of linear models on pre-computed features -
+        # left as None otherwise, in which case optimizers use automatic differentiation
+        self.value_and_grad = None
+        self.hessian = None
+        if self.feature_matrix is not None:
+            if name == "least_squares":
+                self.value_and_grad = self.least_squares_value_and_grad
+                self.hessian = self.least_squares_hessian
+            if name == "softmax":
+                self.value_and_grad = self.softmax_value_and_grad
+                self.hessian = self.softmax_hessian
+            if name == "perceptron":
+                self.value_and_grad = self.perceptron_value_and_grad
+            if name == "multiclass_softmax":
+                self.value_and_grad = self.multiclass_softmax_value_and_grad
+                self.hessian = self.multiclass_softmax_hessian
+
+        # sufficient statistics mode for least squares with a fixed feature transform - the cost
+        # and its derivatives over the full dataset depend only on F F^T, F y^T and y y^T, which are
+        # accumulated once (chunk_size points at a time) so that each evaluation costs O(N^2)
+        # regardless of the number of points
+        self.statistics_cost = None
+        self.statistics_value_and_grad = None
+        self.statistics_hessian = None
+        sufficient_statistics = False
+        if "sufficient_statistics" in kwargs:
+            sufficient_statistics = kwargs["sufficient_statistics"]
+        if sufficient_statistics == True and name == "least_squares" and len(self.sig.parameters) == 1:
+            chunk_size = None
+            if "chunk_size" in kwargs:
+                chunk_size = kwargs["chunk_size"]
+            self.compute_statistics(chunk_size)
+            self.statistics_cost = self.least_squares_statistics
+            self.statistics_value_and_grad = self.least_squares_statistics_value_and_grad
+            self.statistics_hessian = self.least_squares_statistics_hessian
+
+        # point-major data buffers for shuffled minibatches - created on first shuffle, along with a
+        # reference to the data in its original order
+        self.unshuffled = None
+        self.live_buffers = None
+        self.spare_buffers = None
+
+    ###### minibatch data pipeline #####
+    # gather data in the order given by perm into spare point-major buffers - the live
+    # data is only read, so this can safely run in the background during an epoch
+    def gather(self, perm):
+        # create contiguous point-major buffers on first use - always copies, since the buffers are
+        # later overwritten and must never share memory with the original data
+        if self.live_buffers is None:
+            self.unshuffled = [self.x, self.y, self.feature_matrix]
+            data = [self.x, self.y]
+            if self.feature_matrix is not None:
+                data.append(self.feature_matrix)
+            self.live_buffers = [np.array(v.T, order="C") for v in data]
+            self.spare_buffers = [np.empty_like(v) for v in self.live_buffers]
+
+        for live, spare in zip(self.live_buffers, self.spare_buffers):
+            np.take(live, perm, axis=0, out=spare)
+
+    # make the most recently gathered data live - a contiguous slice of points
+    # taken from it is then a view, with no copy made per minibatch
+    def swap(self):
+        self.live_buffers, self.spare_buffers = self.spare_buffers, self.live_buffers
+        self.x = self.live_buffers[0].T
+        self.y = self.live_buffers[1].T
+        if self.feature_matrix is not None:
+            self.feature_matrix = self.live_buffers[2].T
+
+    # return the data to its original order, releasing the buffers
+    def restore(self):
+        if self.unshuffled is not None:
+            self.x, self.y, self.feature_matrix = self.unshuffled
+        self.unshuffled = None
+        self.live_buffers = None
+        self.spare_buffers = None
+
+    ###### sufficient statistics #####
+    # accumulate the gram matrix F F^T, cross moments F y^T and output energy y y^T of the
+    # bias-padded features F over all points - in chunks, so F is never formed in full
+    def compute_statistics(self, chunk_size):
+        num_pts = np.shape(self.y)[1]
+        if chunk_size is None:
+            chunk_size = num_pts
+
+        self.gram = 0
+        self.cross = 0
+        self.y_energy = 0
+        for start in range(0, num_pts, chunk_size):
+            chunk = slice(start, min(start + chunk_size, num_pts))
+            if self.feature_matrix is not None:
+                f = self.feature_matrix[:, chunk]
+            else:
+                f = self.feature_transforms(self.x[:, chunk])
+                f = np.vstack((np.ones((1, np.shape(f)[1])), f))
+            y_c = self.y[:, chunk]
+            self.gram = self.gram + np.dot(f, f.T)
+            self.cross = self.cross + np.dot(f, y_c.T)
+            self.y_energy = self.y_energy + np.sum(y_c**2)
+
+    # least squares cost over the full dataset from sufficient statistics - the batch
+    # argument is ignored here and below, these are always full batch evaluations
+    def least_squares_statistics(self, w, iter):
+        cost = (np.sum(w * np.dot(self.gram, w)) - 2 * np.sum(w * self.cross) + self.y_energy) / self.y.size
+
+        # add l_2 regularizer
+        if self.lam > 0:
+            cost += self.lam * np.sum(w**2) / self.y.size
+        return cost
+
+    # least squares value and gradient over the full dataset from sufficient statistics
+    def least_squares_statistics_value_and_grad(self, w, iter):
+        gram_w = np.dot(self.gram, w)
+        cost = (np.sum(w * gram_w) - 2 * np.sum(w * self.cross) + self.y_energy) / self.y.size
+        grad = 2 * (gram_w - self.cross) / self.y.size
+
+        # add l_2 regularizer
+        if self.lam > 0:
+            cost += self.lam * np.sum(w**2) / self.y.size
+            grad += 2 * self.lam * w / self.y.size
+        return cost, grad
+
+    # least squares hessian over the full dataset from sufficient statistics
+    def least_squares_statistics_hessian(self, w, iter):
+        hess = 2 * np.kron(self.gram, np.eye(np.shape(w)[1])) / self.y.size
+        if self.lam > 0:
+            hess += 2 * self.lam * np.eye(np.size(w)) / self.y.size
+        return hess
+
     ###### cost functions #####
     # compute linear combination of input point
     def model(self, x, w):
@@ -56,6 +196,8 @@ class Setup:
         # not have internal parameters
         f = 0
         if len(self.sig.parameters) == 2:
+            if self.unpack is not None and np.ndim(w) == 1:
+                w = self.unpack(w)
             f = self.feature_transforms(x, w[0])
         else:
             f = self.feature_transforms(x)
@@ -74,15 +216,25 @@ class Setup:
             a = np.dot(f.T, w)
         return a.T
 
+    # evaluate model on a batch of points given as a slice or an index array - if features
+    # have been pre-computed simply slice the batch from the feature matrix instead of re-transforming
+    def batch_model(self, w, iter):
+        if self.feature_matrix is None:
+            return self.model(self.x[:, iter], w)
+
+        # compute linear combination of pre-computed features and return
+        f_p = self.feature_matrix[:, iter]
+        a = np.dot(f_p.T, w)
+        return a.T
+
     ###### regression costs #######
     # an implementation of the least squares cost function for linear regression
     def least_squares(self, w, iter):
         # get batch of points
-        x_p = self.x[:, iter]
         y_p = self.y[:, iter]
 
         # compute cost
-        cost = np.sum((self.model(x_p, w) - y_p) ** 2) / y_p.size
+        cost = np.sum((self.batch_model(w, iter) - y_p) ** 2) / y_p.size
 
         # add l_2 retularizer
         if self.lam > 0:
@@ -92,11 +244,10 @@ class Setup:
     # a compact least absolute deviations cost function
     def least_absolute_deviations(self, w, iter):
         # get batch of points
-        x_p = self.x[:, iter]
         y_p = self.y[:, iter]
 
         # compute cost
-        cost = np.sum(np.abs(self.model(x_p, w) - y_p)) / y_p.size
+        cost = np.sum(np.abs(self.batch_model(w, iter) - y_p)) / y_p.size
 
         # add l_2 retularizer
         if self.lam > 0:
@@ -108,11 +259,10 @@ class Setup:
     # the convex softmax cost function
     def softmax(self, w, iter):
         # get batch of points
-        x_p = self.x[:, iter]
         y_p = self.y[:, iter]
 
         # compute cost over batch
-        cost = np.sum(np.log(1 + np.exp(-y_p * self.model(x_p, w)))) / y_p.size
+        cost = np.sum(np.log(1 + np.exp(-y_p * self.batch_model(w, iter)))) / y_p.size
 
         # add l_2 retularizer
         if self.lam > 0:
@@ -122,11 +272,10 @@ class Setup:
     # the convex perceptron / relu cost function
     def perceptron(self, w, iter):
         # get batch of points
-        x_p = self.x[:, iter]
         y_p = self.y[:, iter]
 
         # compute cost over batch
-        cost = np.sum(np.maximum(0, -y_p * self.model(x_p, w))) / y_p.size
+        cost = np.sum(np.maximum(0, -y_p * self.batch_model(w, iter))) / y_p.size
 
         # add l_2 retularizer
         if self.lam > 0:
@@ -135,18 +284,17 @@ class Setup:
 
     # the counting cost function
     def counting_cost(self, w):
-        cost = np.sum((np.sign(self.model(self.x, w)) - self.y) ** 2)
+        cost = np.sum((np.sign(self.batch_model(w, slice(None))) - self.y) ** 2)
         return 0.25 * cost
 
     ###### multiclass classification costs #######
     # multiclass perceptron
     def multiclass_perceptron(self, w, iter):
         # get subset of points
-        x_p = self.x[:, iter]
         y_p = self.y[:, iter]
 
         # pre-compute predictions on all points
-        all_evals = self.model(x_p, w)
+        all_evals = self.batch_model(w, iter)
 
         # compute maximum across data points
         a = np.max(all_evals, axis=0)
@@ -165,11 +313,10 @@ class Setup:
     # multiclass softmax
     def multiclass_softmax(self, w, iter):
         # get subset of points
-        x_p = self.x[:, iter]
         y_p = self.y[:, iter]
 
         # pre-compute predictions on all points
-        all_evals = self.model(x_p, w)
+        all_evals = self.batch_model(w, iter)
 
         # compute softmax across data points
         a = np.log(np.sum(np.exp(all_evals), axis=0))
@@ -188,7 +335,7 @@ class Setup:
     # multiclass misclassification cost function - aka the fusion rule
     def multiclass_counting_cost(self, w):
         # pre-compute predictions on all points
-        all_evals = self.model(self.x, w)
+        all_evals = self.batch_model(w, slice(None))
 
         # compute predictions of each input point
         y_predict = (np.argmax(all_evals, axis=0))[np.newaxis, :]
@@ -234,3 +381,130 @@ class Setup:
         # compute Least Squares error
         cost = np.sum((b - self.x) ** 2)
         return cost / float(self.x.shape[1])
+
+    ###### closed-form derivatives of linear models on pre-computed features #######
+    # the values and gradients below accept either one set of weights (N x C) or a stack of
+    # K sets (K x N x C), in which case K costs and a stack of K gradients are returned
+
+    # evaluate linear model on a batch of features for one set of weights, or a stack of them
+    def feature_model(self, w, f_p):
+        return np.swapaxes(np.matmul(f_p.T, w), -1, -2)
+
+    # least squares value and gradient
+    def least_squares_value_and_grad(self, w, iter):
+        # get batch of features / outputs
+        f_p = self.feature_matrix[:, iter]
+        y_p = self.y[:, iter]
+
+        # compute residuals, cost, and gradient
+        r = self.feature_model(w, f_p) - y_p
+        cost = np.sum(r**2, axis=(-2, -1)) / y_p.size
+        grad = 2 * np.matmul(f_p, np.swapaxes(r, -1, -2)) / y_p.size
+
+        # add l_2 regularizer
+        if self.lam > 0:
+            cost += self.lam * np.sum(w**2, axis=(-2, -1)) / y_p.size
+            grad += 2 * self.lam * w / y_p.size
+        return cost, grad
+
+    # least squares hessian - with respect to flattened weights
+    def least_squares_hessian(self, w, iter):
+        f_p = self.feature_matrix[:, iter]
+        y_p = self.y[:, iter]
+
+        # each output shares the same hessian 2 F F^T
+        hess = 2 * np.kron(np.dot(f_p, f_p.T), np.eye(np.shape(w)[1])) / y_p.size
+        if self.lam > 0:
+            hess += 2 * self.lam * np.eye(np.size(w)) / y_p.size
+        return hess
+
+    # softmax value and gradient
+    def softmax_value_and_grad(self, w, iter):
+        # get batch of features / outputs
+        f_p = self.feature_matrix[:, iter]
+        y_p = self.y[:, iter]
+
+        # compute cost and gradient, where s = sigmoid(-y * model)
+        z = -y_p * self.feature_model(w, f_p)
+        cost = np.sum(np.log(1 + np.exp(z)), axis=(-2, -1)) / y_p.size
+        s = 1 / (1 + np.exp(-z))
+        grad = np.matmul(f_p, np.swapaxes(-y_p * s, -1, -2)) / y_p.size
+
+        # add l_2 regularizer
+        if self.lam > 0:
+            cost += self.lam * np.sum(w**2, axis=(-2, -1)) / y_p.size
+            grad += 2 * self.lam * w / y_p.size
+        return cost, grad
+
+    # softmax hessian F diag(s(1 - s)) F^T - with respect to flattened weights
+    def softmax_hessian(self, w, iter):
+        f_p = self.feature_matrix[:, iter]
+        y_p = self.y[:, iter]
+
+        s = 1 / (1 + np.exp(y_p * np.dot(f_p.T, w).T))
+        hess = np.dot(f_p * (s * (1 - s)), f_p.T) / y_p.size
+        if self.lam > 0:
+            hess += 2 * self.lam * np.eye(np.size(w)) / y_p.size
+        return hess
+
+    # perceptron value and (sub)gradient - matching automatic differentiation, points lying
+    # exactly on the boundary contribute half a gradient
+    def perceptron_value_and_grad(self, w, iter):
+        # get batch of features / outputs
+        f_p = self.feature_matrix[:, iter]
+        y_p = self.y[:, iter]
+
+        # compute cost and gradient
+        z = -y_p * self.feature_model(w, f_p)
+        cost = np.sum(np.maximum(0, z), axis=(-2, -1)) / y_p.size
+        active = (z > 0) + 0.5 * (z == 0)
+        grad = np.matmul(f_p, np.swapaxes(-y_p * active, -1, -2)) / y_p.size
+
+        # add l_2 regularizer
+        if self.lam > 0:
+            cost += self.lam * np.sum(w**2, axis=(-2, -1)) / y_p.size
+            grad += 2 * self.lam * w / y_p.size
+        return cost, grad
+
+    # class probabilities and one-hot encoded labels for multiclass softmax
+    def multiclass_softmax_probabilities(self, w, f_p, y_p):
+        all_evals = self.feature_model(w, f_p)
+        probs = np.exp(all_evals - np.max(all_evals, axis=-2, keepdims=True))
+        probs = probs / np.sum(probs, axis=-2, keepdims=True)
+        one_hot = np.zeros(np.shape(all_evals)[-2:])
+        one_hot[y_p.astype(int).flatten(), np.arange(np.size(y_p))] = 1
+        return all_evals, probs, one_hot
+
+    # multiclass softmax value and gradient
+    def multiclass_softmax_value_and_grad(self, w, iter):
+        # get batch of features / outputs
+        f_p = self.feature_matrix[:, iter]
+        y_p = self.y[:, iter]
+        all_evals, probs, one_hot = self.multiclass_softmax_probabilities(w, f_p, y_p)
+
+        # compute cost and gradient
+        a = np.log(np.sum(np.exp(all_evals), axis=-2))
+        b = np.sum(one_hot * all_evals, axis=-2)
+        cost = np.sum(a - b, axis=-1) / y_p.size
+        grad = np.matmul(f_p, np.swapaxes(probs - one_hot, -1, -2)) / y_p.size
+
+        # add l_2 regularizer
+        if self.lam > 0:
+            cost += self.lam * np.sum(w**2, axis=(-2, -1)) / y_p.size
+            grad += 2 * self.lam * w / y_p.size
+        return cost, grad
+
+    # multiclass softmax hessian - with respect to flattened weights, whose entry (f, c)
+    # couples features f and g with classes c and d via sum_p f_p g_p (delta_cd s_c - s_c s_d)
+    def multiclass_softmax_hessian(self, w, iter):
+        f_p = self.feature_matrix[:, iter]
+        y_p = self.y[:, iter]
+        all_evals, probs, one_hot = self.multiclass_softmax_probabilities(w, f_p, y_p)
+
+        C = np.shape(w)[1]
+        curvature = np.eye(C)[:, :, np.newaxis] * probs[np.newaxis, :, :] - probs[:, np.newaxis, :] * probs[np.newaxis, :, :]
+        hess = np.einsum("fp,gp,cdp->fcgd", f_p, f_p, curvature, optimize=True)
+        hess = np.reshape(hess, (np.size(w), np.size(w))) / y_p.size
+        if self.lam > 0:
+            hess += 2 * self.lam * np.eye(np.size(w)) / y_p.size
+        return hess
@@ -0,0 +1,50 @@
+import autograd.numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EpochShuffler:
+    """
+    Re-orders the points of a dataset once per epoch of minibatch descent, so that each mini-batch
+    is a contiguous slice of them.  The data is an object with gather(perm) / swap() / restore()
+    methods (e.g., a cost_functions.Setup), and with prefetch the next epoch's order is gathered in
+    a background thread during the current one.  close() returns the data to its original order.
+    """
+
+    def __init__(self, data, num_pts, max_its, **kwargs):
+        self.data = data
+        self.num_pts = num_pts
+
+        # number of epochs still to be shuffled - no order is prefetched past the last
+        self.epochs_left = max_its
+
+        # gather next epoch's shuffled data in a background thread?
+        prefetch = False
+        if "prefetch" in kwargs:
+            prefetch = kwargs["prefetch"]
+        self.executor = None
+        self.pending = None
+        if prefetch == True:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+    # make a new order of the data live for the next epoch - waiting on the prefetched order if
+    # there is one
+    def shuffle(self):
+        if self.pending is None:
+            self.data.gather(np.random.permutation(self.num_pts))
+        else:
+            self.pending.result()
+        self.data.swap()
+        self.epochs_left -= 1
+
+        self.pending = None
+        if self.executor is not None and self.epochs_left > 0:
+            self.pending = self.executor.submit(self.data.gather, np.random.permutation(self.num_pts))
+
+    # finish any background gather and put the data back in its original order
+    def close(self):
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.data.restore()
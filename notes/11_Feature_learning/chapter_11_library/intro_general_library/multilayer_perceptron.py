@@ -35,6 +35,22 @@ class Setup:
         if "scale" in kwargs:
             self.scale = kwargs["scale"]
 
+        # store all weights in one flat vector, rather than as nested lists of weight matrices?
+        self.flat = False
+        if "flat" in kwargs:
+            self.flat = kwargs["flat"]
+
+        # offset table locating each layer's weight matrix within the flat weight vector -
+        # (start, stop, shape) per layer, with the final linear combination last
+        self.offsets = []
+        start = 0
+        for k in range(len(self.layer_sizes) - 1):
+            shape = (self.layer_sizes[k] + 1, self.layer_sizes[k + 1])
+            stop = start + shape[0] * shape[1]
+            self.offsets.append((start, stop, shape))
+            start = stop
+        self.num_params = start
+
     # create initial weights for arbitrary feedforward network
     def initializer(self):
         # container for entire weight tensor
@@ -56,19 +72,26 @@ class Setup:
         # final linear combination in predict function
         w_init = [weights[:-1], weights[-1]]
 
+        # flat layout - concatenate in the same order autograd's flatten would use
+        if self.flat == True:
+            w_init = np.concatenate([np.ravel(weight) for weight in weights])
+
         return w_init
 
+    # split a flat weight vector into per-layer views [omega_inner, w] matching the
+    # nested layout - slices of a contiguous vector, so nothing is copied
+    def unpack(self, w):
+        views = [np.reshape(w[start:stop], shape) for start, stop, shape in self.offsets]
+        return [views[:-1], views[-1]]
+
     # fully evaluate our network features using the tensor of weights in w
     def feature_transforms(self, a, w):
         # loop through each layer matrix
         for W in w:
-            #  pad with ones (to compactly take care of bias) for next layer computation
-            o = np.ones((1, np.shape(a)[1]))
-            a = np.vstack((o, a))
-
-            # compute inner product with current layer weights
-            a = np.dot(a.T, W).T
+            # compute inner product with current layer weights - the first row of W holds
+            # the biases, so no row of ones need be padded onto the input
+            a = W[0] + np.dot(a.T, W[1:])
 
             # output of layer activation
-            a = self.activation(a)
+            a = self.activation(a).T
         return a
@@ -1,4 +1,5 @@
 import autograd.numpy as np
+from autograd.tracer import Box, getval
 
 
 class Setup:
@@ -35,6 +36,12 @@ class Setup:
         if "scale" in kwargs:
             self.scale = kwargs["scale"]
 
+        # momentum of the exponential running averages of each layer's normalization statistics
+        self.momentum = 0.9
+        if "momentum" in kwargs:
+            self.momentum = kwargs["momentum"]
+        self.reset_statistics()
+
     # create initial weights for arbitrary feedforward network
     def initializer(self):
         # container for entire weight tensor
@@ -58,70 +65,110 @@ class Setup:
 
         return w_init
 
-    # standard normalization function
-    def standard_normalizer(self, x):
+    # clear running averages of each hidden layer's activation means / standard deviations,
+    # stored as (U_k x 1) arrays
+    def reset_statistics(self):
+        self.running_means = [np.zeros((U_k, 1)) for U_k in self.layer_sizes[1:-1]]
+        self.running_stds = [np.ones((U_k, 1)) for U_k in self.layer_sizes[1:-1]]
+        self.num_updates = 0
+        self.pending_statistics = None
+
+    # running statistics, and the number of updates folded into them - for handing between processes
+    def statistics(self):
+        return [np.array(v) for v in self.running_means], [np.array(v) for v in self.running_stds], self.num_updates
+
+    def load_statistics(self, statistics):
+        self.running_means, self.running_stds, self.num_updates = statistics
+        self.pending_statistics = None
+
+    # standard normalization statistics - mean and standard deviation of each unit's activations
+    def standard_statistics(self, x):
         # compute the mean and standard deviation of the input
         x_means = np.mean(x, axis=1)[:, np.newaxis]
         x_stds = np.std(x, axis=1)[:, np.newaxis]
 
         # check to make sure thta x_stds > small threshold, for those not
         # divide by 1 instead of original standard deviation
-        ind = np.argwhere(x_stds < 10 ** (-2))
-        if len(ind) > 0:
-            ind = [v[0] for v in ind]
-            adjust = np.zeros((x_stds.shape))
-            adjust[ind] = 1.0
-            x_stds += adjust
+        x_stds = x_stds + (x_stds < 10 ** (-2))
+        return x_means, x_stds
 
-        # create standard normalizer function
-        normalizer = lambda data: (data - x_means) / x_stds
-
-        # return normalizer
-        return normalizer
-
-    # a multilayer perceptron network, note the input w is a tensor of weights, with
-    # activation output normalization
-    def feature_transforms(self, a, w):
-        # loop through each layer matrix
-        self.normalizers = []
+    # forward pass normalizing the activation outputs of each layer by their statistics over the
+    # batch a - returns the output along with each layer's (means, stds)
+    def batch_forward(self, a, w):
+        stats = []
         for W in w:
-            #  pad with ones (to compactly take care of bias) for next layer computation
-            o = np.ones((1, np.shape(a)[1]))
-            a = np.vstack((o, a))
-
-            # compute linear combination of current layer units
-            a = np.dot(a.T, W).T
+            # compute linear combination of current layer units - the first row of W
+            # holds the biases, so no row of ones need be padded onto the input
+            a = W[0] + np.dot(a.T, W[1:])
 
             # pass through activation
-            a = self.activation(a)
+            a = self.activation(a).T
 
             # NEW - perform standard normalization to the activation outputs
-            normalizer = self.standard_normalizer(a)
-            a = normalizer(a)
+            a_means, a_stds = self.standard_statistics(a)
+            a = (a - a_means) / a_stds
+            stats.append((a_means, a_stds))
+        return a, stats
 
-            # store normalizer for testing data
-            self.normalizers.append(normalizer)
+    # a multilayer perceptron network, note the input w is a tensor of weights, with
+    # activation output normalization by the statistics of the batch a.  The statistics of
+    # a gradient evaluation - i.e., when the weights are traced by autograd - are held until
+    # update_statistics is called, as the weights evaluated need not be those stepped to
+    def feature_transforms(self, a, w):
+        a, stats = self.batch_forward(a, w)
+        if len(w) > 0 and isinstance(w[0], Box):
+            self.pending_statistics = [(getval(a_means), getval(a_stds)) for a_means, a_stds in stats]
         return a
 
-    # a copy of the batch normalized architecture that employs normalizers
-    # at each layer based on statistics from training data and user-chosen
-    # choice of weights w
+    # fold the statistics of the most recent gradient evaluation into the running averages - called
+    # once for each step the optimizer accepts
+    def update_statistics(self):
+        if self.pending_statistics is None:
+            return
+        for c, (a_means, a_stds) in enumerate(self.pending_statistics):
+            if self.num_updates == 0:
+                self.running_means[c][:] = a_means
+                self.running_stds[c][:] = a_stds
+            else:
+                self.running_means[c] *= self.momentum
+                self.running_means[c] += (1 - self.momentum) * a_means
+                self.running_stds[c] *= self.momentum
+                self.running_stds[c] += (1 - self.momentum) * a_stds
+        self.num_updates += 1
+        self.pending_statistics = None
+
+    # fix the statistics to those of the data a passed through the network with weights w
+    def fix_statistics(self, a, w):
+        stats = self.batch_forward(a, w)[1]
+        self.running_means = [np.array(a_means) for a_means, a_stds in stats]
+        self.running_stds = [np.array(a_stds) for a_means, a_stds in stats]
+        self.num_updates = 1
+        self.pending_statistics = None
+
+    # inference version of the batch normalized architecture, using the running statistics
+    # from training.  The frozen normalization of each layer is folded into the next layer's
+    # weights, so only the outputs of the final layer are normalized explicitly.  Until a
+    # training step has been taken the statistics of the batch a are used instead
     def feature_transforms_testing(self, a, w):
+        if self.num_updates == 0:
+            return self.batch_forward(a, w)[0]
+
         # loop through each layer matrix
-        c = 0
-        for W in w:
-            #  pad with ones (to compactly take care of bias) for next layer computation
-            o = np.ones((1, np.shape(a)[1]))
-            a = np.vstack((o, a))
+        for c, W in enumerate(w):
+            # fold normalization of the previous layer's outputs into the current weights
+            b = W[0]
+            W_lin = W[1:]
+            if c > 0:
+                W_lin = W_lin / self.running_stds[c - 1]
+                b = b - np.dot(self.running_means[c - 1][:, 0], W_lin)
 
             # compute linear combination of current layer units
-            a = np.dot(a.T, W).T
+            a = b + np.dot(a.T, W_lin)
 
             # pass through activation
-            a = self.activation(a)
+            a = self.activation(a).T
 
-            # get normalizer for this layer tuned to training data
-            normalizer = self.normalizers[c]
-            a = normalizer(a)
-            c += 1
+        # normalize outputs of the final layer
+        if len(w) > 0:
+            a = (a - self.running_means[-1]) / self.running_stds[-1]
         return a
@@ -1,7 +1,95 @@
 import autograd.numpy as np
 from autograd import value_and_grad
 from autograd import hessian
+from autograd import grad as compute_grad
+from autograd import make_jvp
 from autograd.misc.flatten import flatten_func
+from autograd.misc.flatten import flatten
+from .weight_history import WeightHistory
+from .epoch_shuffler import EpochShuffler
+
+
+# truncated conjugate gradient solve of the linear system A d = b, where A is only
+# available through matrix-vector products A_prod(v) - stops early once the residual
+# is small or a direction of non-positive curvature is found
+def conjugate_gradient(A_prod, b, max_its, **kwargs):
+    # relative residual tolerance
+    tol = 10 ** (-10)
+    if "tol" in kwargs:
+        tol = kwargs["tol"]
+
+    # initialize solution, residual, and search direction
+    d = np.zeros(np.shape(b))
+    r = b
+    p = r
+    r_sq = np.dot(r, r)
+    b_norm = np.sqrt(r_sq)
+
+    for i in range(max_its):
+        if np.sqrt(r_sq) <= tol * b_norm:
+            break
+
+        # non-positive curvature - fall back to steepest descent on the first pass
+        Ap = A_prod(p)
+        curvature = np.dot(p, Ap)
+        if curvature <= 0:
+            if i == 0:
+                d = b
+            break
+
+        # take step along conjugate direction, update residual and direction
+        step = r_sq / curvature
+        d = d + step * p
+        r = r - step * Ap
+        r_sq_new = np.dot(r, r)
+        p = r + (r_sq_new / r_sq) * p
+        r_sq = r_sq_new
+    return d
+
+
+# wrap a closed-form value_and_grad(w, iter) - taking and returning unflattened weights -
+# so that it acts on flat weights like autograd's value_and_grad of a flattened function
+def flatten_value_and_grad(value_and_grad_func, unflatten):
+    def flat_value_and_grad(w, iter):
+        cost_eval, grad_eval = value_and_grad_func(unflatten(w), iter)
+        return cost_eval, np.ravel(grad_eval)
+
+    return flat_value_and_grad
+
+
+# convergence tolerances on the gradient norm, relative change in cost and relative step size -
+# read from an optimizer's keyword arguments, each off (0) unless given
+def convergence_tolerances(kwargs):
+    tols = {"grad_tol": 0, "cost_tol": 0, "step_tol": 0}
+    for key in tols:
+        if key in kwargs:
+            tols[key] = kwargs[key]
+    return tols
+
+
+# check for convergence at weights w, reached from the previously recorded weights w_prev, given a full
+# batch gradient at either and the costs at both - any of which may be None when unavailable - returns
+# the name of the tolerance met, or None to keep going
+def check_convergence(tols, w, w_prev, grad_eval, cost_eval, cost_prev):
+    if tols["grad_tol"] > 0 and grad_eval is not None and np.linalg.norm(grad_eval) <= tols["grad_tol"]:
+        return "grad_tol"
+    if tols["cost_tol"] > 0 and cost_eval is not None and cost_prev is not None:
+        if np.abs(cost_prev - cost_eval) <= tols["cost_tol"] * np.abs(cost_prev):
+            return "cost_tol"
+    if tols["step_tol"] > 0 and w_prev is not None and np.linalg.norm(w - w_prev) <= tols["step_tol"] * (1 + np.linalg.norm(w_prev)):
+        return "step_tol"
+    return None
+
+
+# stop check on recorded weights w - the callback (if any) is given a copy of them (optimizers may step
+# w in place) and their cost value first and may return a reason to stop, after which the convergence
+# tolerances are checked.  Returns the reason to stop, or None to keep going
+def check_stop(callback, tols, unflatten, w, w_prev, grad_eval, cost_eval, cost_prev):
+    if callback is not None:
+        stop_reason = callback(unflatten(np.array(w)), cost_eval)
+        if stop_reason is not None:
+            return stop_reason
+    return check_convergence(tols, w, w_prev, grad_eval, cost_eval, cost_prev)
 
 
 # minibatch gradient descent
@@ -10,28 +98,311 @@ def gradient_descent(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
     g_flat, unflatten, w = flatten_func(g, w)
     grad = value_and_grad(g_flat)
 
-    # record history
-    w_hist = []
-    w_hist.append(unflatten(w))
+    # use a closed-form value and gradient in place of automatic differentiation, if provided
+    if "value_and_grad" in kwargs and kwargs["value_and_grad"] is not None:
+        grad = flatten_value_and_grad(kwargs["value_and_grad"], unflatten)
+
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight along with its cost
+    # value, when the latter comes for free from a full batch gradient evaluation.
+    # The callback may return a reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # step hook - called after each step taken, e.g. to fold the batch normalization statistics of
+    # the gradient evaluation behind it into running averages
+    step_callback = None
+    if "step_callback" in kwargs:
+        step_callback = kwargs["step_callback"]
+
+    # convergence tolerances - gradient norm and relative cost change are only
+    # available for full batch steps, the relative step size for all
+    tols = convergence_tolerances(kwargs)
+
+    # data to shuffle - an object with gather(perm) / swap() / restore() methods (e.g., a
+    # cost_functions.Setup) re-ordered once per epoch, optionally prefetching the next order
+    shuffler = None
+    if "shuffler" in kwargs and kwargs["shuffler"] is not None:
+        shuffler = EpochShuffler(kwargs["shuffler"], num_pts, max_its, **kwargs)
 
     # how many mini-batches equal the entire dataset?
     num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+    full_batch = num_batches == 1
+    if callback is not None and not full_batch:
+        callback(unflatten(w), None)
+
     # over the line
+    w_prev = None
+    cost_prev = None
+    stop_reason = None
+    try:
+        for k in range(max_its):
+            # shuffle data for this epoch
+            if shuffler is not None:
+                shuffler.shuffle()
+
+            # loop over each minibatch
+            w_start = w
+            for b in range(num_batches):
+                # collect current mini-batch as a slice - a view of the data rather than a copy
+                batch_inds = slice(b * batch_size, min((b + 1) * batch_size, num_pts))
+
+                # plug in value into func and derivative
+                cost_eval, grad_eval = grad(w, batch_inds)
+                grad_eval.shape = np.shape(w)
+
+                # full batch cost value belongs to the most recently recorded weights - stop
+                # here, before stepping, if they have converged
+                if full_batch:
+                    stop_reason = check_stop(callback, tols, unflatten, w, w_prev, grad_eval, cost_eval, cost_prev)
+                    if stop_reason is not None:
+                        break
+                    cost_prev = cost_eval
+
+                # take descent step with momentum
+                w = w - alpha * grad_eval
+                if step_callback is not None:
+                    step_callback()
+            if stop_reason is not None:
+                w_hist.stop(stop_reason, k)
+                break
+
+            # record weight update
+            w_hist.append(w)
+            w_prev = w_start
+            if not full_batch:
+                stop_reason = check_stop(callback, tols, unflatten, w, w_prev, None, None, None)
+                if stop_reason is not None:
+                    w_hist.stop(stop_reason, k + 1)
+                    break
+    finally:
+        if shuffler is not None:
+            shuffler.close()
+
+    # final weights have not been evaluated by a full batch gradient
+    if callback is not None and full_batch and stop_reason is None:
+        callback(unflatten(w), None)
+
+    return w_hist
+
+
+# minibatch gradient descent run with K step lengths at once - value_and_grad(w, iter) must accept
+# a stack of K weights (K x N x C) and return K costs and a stack of K gradients, as the closed-form
+# linear model costs in cost_functions do, so that all trajectories advance in lock-step with batched
+# matrix products.  Returns one weight history per step length
+def gradient_descent_sweep(value_and_grad_func, alphas, max_its, w, num_pts, batch_size, **kwargs):
+    # stack K copies of the initialization
+    alphas = np.array(alphas, dtype=float)
+    K = np.size(alphas)
+    unflatten = flatten(w)[1]
+    w = np.repeat(np.array(w)[np.newaxis], K, axis=0)
+    step = np.reshape(alphas, (K,) + (1,) * (np.ndim(w) - 1))
+
+    # record one history per step length
+    w_hists = [WeightHistory(unflatten, max_its + 1, np.size(w[k])) for k in range(K)]
+    for k in range(K):
+        w_hists[k].append(w[k])
+
+    # metric callback - called once on each recorded stack of weights along with their K cost
+    # values, when the latter come for free from a full batch gradient evaluation
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # data to shuffle once per epoch (see gradient_descent)
+    shuffler = None
+    if "shuffler" in kwargs and kwargs["shuffler"] is not None:
+        shuffler = EpochShuffler(kwargs["shuffler"], num_pts, max_its, **kwargs)
+
+    # how many mini-batches equal the entire dataset?
+    num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+    full_batch = num_batches == 1
+    if callback is not None and not full_batch:
+        callback(w, None)
+
+    # over the line
+    try:
+        for j in range(max_its):
+            if shuffler is not None:
+                shuffler.shuffle()
+
+            # loop over each minibatch
+            for b in range(num_batches):
+                batch_inds = slice(b * batch_size, min((b + 1) * batch_size, num_pts))
+
+                # evaluate all K costs and gradients at once
+                cost_evals, grad_evals = value_and_grad_func(w, batch_inds)
+
+                # full batch cost values belong to the most recently recorded weights
+                if callback is not None and full_batch:
+                    callback(w, cost_evals)
+
+                # take K descent steps
+                w = w - step * grad_evals
+
+            # record weight updates
+            for k in range(K):
+                w_hists[k].append(w[k])
+            if callback is not None and not full_batch:
+                callback(w, None)
+    finally:
+        if shuffler is not None:
+            shuffler.close()
+
+    # final weights have not been evaluated by a full batch gradient
+    if callback is not None and full_batch:
+        callback(w, None)
+
+    return w_hists
+
+
+# stochastic variance reduced gradient (SVRG) - each epoch takes a full gradient snapshot at the current
+# weights, followed by num_batches steps on randomly drawn mini-batches whose gradients are corrected
+# using the snapshot.  With a fixed steplength this converges linearly on strongly convex costs
+def SVRG(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
+    # flatten the input function, create gradient based on flat function
+    g_flat, unflatten, w = flatten_func(g, w)
+    grad = value_and_grad(g_flat)
+
+    # use a closed-form value and gradient in place of automatic differentiation, if provided
+    if "value_and_grad" in kwargs and kwargs["value_and_grad"] is not None:
+        grad = flatten_value_and_grad(kwargs["value_and_grad"], unflatten)
+
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight along with its cost
+    # value, which comes for free from each full gradient snapshot.  The callback
+    # may return a reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # step hook - called after each step taken (see gradient_descent)
+    step_callback = None
+    if "step_callback" in kwargs:
+        step_callback = kwargs["step_callback"]
+
+    # convergence tolerances - checked at each full gradient snapshot
+    tols = convergence_tolerances(kwargs)
+
+    # how many mini-batches equal the entire dataset?
+    num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+
+    # over the line
+    w_prev = None
+    cost_prev = None
+    stop_reason = None
     for k in range(max_its):
-        # loop over each minibatch
-        for b in range(num_batches):
-            # collect indices of current mini-batch
-            batch_inds = np.arange(b * batch_size, min((b + 1) * batch_size, num_pts))
+        # full gradient snapshot - its cost value belongs to the most recently recorded weights
+        w_snap = w
+        cost_eval, full_grad = grad(w_snap, slice(0, num_pts))
+        stop_reason = check_stop(callback, tols, unflatten, w, w_prev, full_grad, cost_eval, cost_prev)
+        if stop_reason is not None:
+            w_hist.stop(stop_reason, k)
+            break
 
-            # plug in value into func and derivative
-            cost_eval, grad_eval = grad(w, batch_inds)
-            grad_eval.shape = np.shape(w)
+        # take steps on randomly drawn mini-batches - each gradient weighted by its batch's share
+        # of points, so that the corrected gradient is an unbiased estimate of the full gradient
+        for b in np.random.randint(num_batches, size=num_batches):
+            batch_inds = slice(b * batch_size, min((b + 1) * batch_size, num_pts))
+            weight = (batch_inds.stop - batch_inds.start) * num_batches / num_pts
+            snap_grad_eval = grad(w_snap, batch_inds)[1]
+            grad_eval = grad(w, batch_inds)[1]
+            w = w - alpha * (weight * (grad_eval - snap_grad_eval) + full_grad)
+            if step_callback is not None:
+                step_callback()
 
-            # take descent step with momentum
-            w = w - alpha * grad_eval
+        # record weights after each epoch
+        w_hist.append(w)
+        w_prev = w_snap
+        cost_prev = cost_eval
 
-        # record weight update
-        w_hist.append(unflatten(w))
+    # final weights have not been evaluated by a full gradient snapshot
+    if callback is not None and stop_reason is None:
+        callback(unflatten(w), None)
+
+    return w_hist
+
+
+# SAGA - keeps a table of the most recent gradient of each mini-batch, stored compactly as one row
+# per batch, and steps along the newest batch gradient corrected by the table.  With a fixed
+# steplength this converges linearly on strongly convex costs
+def SAGA(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
+    # flatten the input function, create gradient based on flat function
+    g_flat, unflatten, w = flatten_func(g, w)
+    grad = value_and_grad(g_flat)
+
+    # use a closed-form value and gradient in place of automatic differentiation, if provided
+    if "value_and_grad" in kwargs and kwargs["value_and_grad"] is not None:
+        grad = flatten_value_and_grad(kwargs["value_and_grad"], unflatten)
+
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight, and may return a
+    # reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # step hook - called after each step taken (see gradient_descent)
+    step_callback = None
+    if "step_callback" in kwargs:
+        step_callback = kwargs["step_callback"]
+
+    # relative step size tolerance - checked after each epoch
+    tols = convergence_tolerances(kwargs)
+    if callback is not None:
+        callback(unflatten(w), None)
+
+    # how many mini-batches equal the entire dataset?  Each batch's gradient is weighted by its
+    # share of points, so that the table average is the full gradient
+    num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+    batches = [slice(b * batch_size, min((b + 1) * batch_size, num_pts)) for b in range(num_batches)]
+    weights = [(s.stop - s.start) * num_batches / num_pts for s in batches]
+
+    # fill gradient table at the initialization
+    table = np.zeros((num_batches, np.size(w)))
+    for b in range(num_batches):
+        table[b] = weights[b] * grad(w, batches[b])[1]
+    table_avg = np.mean(table, axis=0)
+
+    # over the line
+    for k in range(max_its):
+        # take steps on randomly drawn mini-batches
+        w_start = w
+        for b in np.random.randint(num_batches, size=num_batches):
+            grad_eval = weights[b] * grad(w, batches[b])[1]
+            w = w - alpha * (grad_eval - table[b] + table_avg)
+            if step_callback is not None:
+                step_callback()
+
+            # update table and its average
+            table_avg = table_avg + (grad_eval - table[b]) / num_batches
+            table[b] = grad_eval
+
+        # record weights after each epoch
+        w_hist.append(w)
+        stop_reason = check_stop(callback, tols, unflatten, w, w_start, None, None, None)
+        if stop_reason is not None:
+            w_hist.stop(stop_reason, k + 1)
+            break
 
     return w_hist
 
@@ -49,21 +420,65 @@ def newtons_method(g, max_its, w, num_pts, batch_size, **kwargs):
     gradient = value_and_grad(flat_g)
     hess = hessian(flat_g)
 
+    # use a closed-form value / gradient and hessian in place of automatic differentiation, if provided
+    if "value_and_grad" in kwargs and kwargs["value_and_grad"] is not None:
+        gradient = flatten_value_and_grad(kwargs["value_and_grad"], unflatten)
+    if "hessian" in kwargs and kwargs["hessian"] is not None:
+        hessian_func = kwargs["hessian"]
+        hess = lambda w, iter: hessian_func(unflatten(w), iter)
+
     # set numericxal stability parameter / regularization parameter
     epsilon = 10 ** (-7)
     if "epsilon" in kwargs:
         epsilon = kwargs["epsilon"]
 
-    # record history
-    w_hist = []
-    w_hist.append(unflatten(w))
+    # solve each Newton system by truncated conjugate gradient using only Hessian-vector
+    # products - never forming the Hessian - with at most cg_max_its inner iterations?
+    hessian_free = False
+    if "hessian_free" in kwargs:
+        hessian_free = kwargs["hessian_free"]
+    cg_max_its = 20
+    if "cg_max_its" in kwargs:
+        cg_max_its = kwargs["cg_max_its"]
+
+    # Hessian-vector products computed forward-over-reverse
+    hess_vec = make_jvp(compute_grad(flat_g))
+
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight along with its cost
+    # value, when the latter comes for free from a full batch gradient evaluation.
+    # The callback may return a reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # step hook - called after each step taken (see gradient_descent)
+    step_callback = None
+    if "step_callback" in kwargs:
+        step_callback = kwargs["step_callback"]
+
+    # convergence tolerances - see gradient_descent
+    tols = convergence_tolerances(kwargs)
 
     # how many mini-batches equal the entire dataset?
     num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+    full_batch = num_batches == 1
+    if callback is not None and not full_batch:
+        callback(unflatten(w), None)
 
     # over the line
+    w_prev = None
+    cost_prev = None
+    stop_reason = None
     for k in range(max_its):
         # loop over each minibatch
+        w_start = w
         for b in range(num_batches):
             # collect indices of current mini-batch
             batch_inds = np.arange(b * batch_size, min((b + 1) * batch_size, num_pts))
@@ -71,23 +486,235 @@ def newtons_method(g, max_its, w, num_pts, batch_size, **kwargs):
             # evaluate the gradient, store current weights and cost function value
             cost_eval, grad_eval = gradient(w, batch_inds)
 
-            # evaluate the hessian
-            hess_eval = hess(w, batch_inds)
+            # full batch cost value belongs to the most recently recorded weights - stop
+            # here, before stepping, if they have converged
+            if full_batch:
+                stop_reason = check_stop(callback, tols, unflatten, w, w_prev, grad_eval, cost_eval, cost_prev)
+                if stop_reason is not None:
+                    break
+                cost_prev = cost_eval
+
+            # hessian-free - solve regularized second order system with conjugate gradient
+            if hessian_free == True:
+                hess_vec_eval = hess_vec(w, batch_inds)
+                A_prod = lambda v: hess_vec_eval(v)[1] + epsilon * v
+                w = w + conjugate_gradient(A_prod, -grad_eval, cg_max_its)
+            else:
+                # evaluate the hessian
+                hess_eval = hess(w, batch_inds)
 
-            # reshape for numpy linalg functionality
-            hess_eval.shape = (int((np.size(hess_eval)) ** (0.5)), int((np.size(hess_eval)) ** (0.5)))
+                # reshape for numpy linalg functionality
+                hess_eval.shape = (int((np.size(hess_eval)) ** (0.5)), int((np.size(hess_eval)) ** (0.5)))
 
-            # solve second order system system for weight update
-            A = hess_eval + epsilon * np.eye(np.size(w))
-            b = grad_eval
-            w = np.linalg.lstsq(A, np.dot(A, w) - b)[0]
+                # solve second order system system for weight update
+                A = hess_eval + epsilon * np.eye(np.size(w))
+                b = grad_eval
+                w = np.linalg.lstsq(A, np.dot(A, w) - b)[0]
+            if step_callback is not None:
+                step_callback()
 
             # w = w - np.dot(np.linalg.pinv(hess_eval + epsilon*np.eye(np.size(w))),grad_eval)
 
+        if stop_reason is not None:
+            w_hist.stop(stop_reason, k)
+            break
+
         # record weights after each epoch
-        w_hist.append(unflatten(w))
+        w_hist.append(w)
+        w_prev = w_start
+        if not full_batch:
+            stop_reason = check_stop(callback, tols, unflatten, w, w_prev, None, None, None)
+            if stop_reason is not None:
+                w_hist.stop(stop_reason, k + 1)
+                break
+
+    # final weights have not been evaluated by a full batch gradient
+    if callback is not None and full_batch and stop_reason is None:
+        callback(unflatten(w), None)
+
+    return w_hist
+
+
+# line search along descent direction d from w satisfying the strong Wolfe conditions - given the
+# cost / gradient function gradient(w) and their values f0 / g0 at w, returns the steplength along
+# with the cost and gradient at the new point (a steplength of 0 if no acceptable step is found)
+def strong_wolfe_linesearch(gradient, w, d, f0, g0, alpha, **kwargs):
+    # sufficient decrease and curvature parameters, maximum number of function evaluations
+    c1 = 10 ** (-4)
+    if "c1" in kwargs:
+        c1 = kwargs["c1"]
+    c2 = 0.9
+    if "c2" in kwargs:
+        c2 = kwargs["c2"]
+    max_evals = 25
+    if "max_evals" in kwargs:
+        max_evals = kwargs["max_evals"]
+
+    # slope along the search direction at w
+    dphi0 = np.dot(g0, d)
+
+    # zoom in on an acceptable steplength inside the bracket [lo, hi] - each end stored as
+    # (steplength, cost, slope, gradient), with lo the end of lower cost
+    def zoom(lo, hi, num_evals):
+        while num_evals < max_evals:
+            # minimizer of the cubic interpolating both ends, safeguarded into the interior of
+            # the bracket - otherwise bisect
+            a_lo, f_lo, dphi_lo, g_lo = lo
+            a_hi, f_hi, dphi_hi, g_hi = hi
+            a = (a_lo + a_hi) / 2
+            d1 = dphi_lo + dphi_hi - 3 * (f_lo - f_hi) / (a_lo - a_hi)
+            d2_sq = d1**2 - dphi_lo * dphi_hi
+            if d2_sq >= 0:
+                d2 = np.sign(a_hi - a_lo) * np.sqrt(d2_sq)
+                a_cubic = a_hi - (a_hi - a_lo) * (dphi_hi + d2 - d1) / (dphi_hi - dphi_lo + 2 * d2)
+                width = abs(a_hi - a_lo)
+                if min(a_lo, a_hi) + 0.1 * width <= a_cubic <= max(a_lo, a_hi) - 0.1 * width:
+                    a = a_cubic
+
+            # evaluate new steplength and shrink bracket
+            f_a, g_a = gradient(w + a * d)
+            dphi_a = np.dot(g_a, d)
+            num_evals += 1
+            if f_a > f0 + c1 * a * dphi0 or f_a >= f_lo:
+                hi = (a, f_a, dphi_a, g_a)
+            else:
+                if abs(dphi_a) <= -c2 * dphi0:
+                    return a, f_a, g_a
+                if dphi_a * (a_hi - a_lo) >= 0:
+                    hi = lo
+                lo = (a, f_a, dphi_a, g_a)
+        return lo[0], lo[1], lo[3]
+
+    # expand steplength until the minimum is bracketed or the Wolfe conditions hold
+    prev = (0, f0, dphi0, g0)
+    for num_evals in range(1, max_evals + 1):
+        f_a, g_a = gradient(w + alpha * d)
+        dphi_a = np.dot(g_a, d)
+        current = (alpha, f_a, dphi_a, g_a)
+        if f_a > f0 + c1 * alpha * dphi0 or (num_evals > 1 and f_a >= prev[1]):
+            return zoom(prev, current, num_evals)
+        if abs(dphi_a) <= -c2 * dphi0:
+            return alpha, f_a, g_a
+        if dphi_a >= 0:
+            return zoom(current, prev, num_evals)
+        prev = current
+        alpha = 2 * alpha
+
+    # out of evaluations - settle for the last steplength evaluated
+    return prev[0], prev[1], prev[3]
+
+
+# limited memory BFGS - inputs: g (input function), max_its (maximum number of iterations), w (initialization),
+# num_pts (number of points - each step uses the full batch)
+def lbfgs(g, max_its, w, num_pts, **kwargs):
+    # flatten the input function, create gradient based on flat function
+    g_flat, unflatten, w = flatten_func(g, w)
+    grad = value_and_grad(g_flat)
+
+    # use a closed-form value and gradient in place of automatic differentiation, if provided
+    if "value_and_grad" in kwargs and kwargs["value_and_grad"] is not None:
+        grad = flatten_value_and_grad(kwargs["value_and_grad"], unflatten)
+    batch_inds = slice(0, num_pts)
+    gradient = lambda w: grad(w, batch_inds)
+
+    # number of curvature pairs kept in memory, and gradient norm at which to stop
+    memory = 10
+    if "memory" in kwargs:
+        memory = kwargs["memory"]
+    tol = 10 ** (-6)
+    if "tol" in kwargs:
+        tol = kwargs["tol"]
+
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight along with its cost value,
+    # and may return a reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # step hook - called after each step taken (see gradient_descent)
+    step_callback = None
+    if "step_callback" in kwargs:
+        step_callback = kwargs["step_callback"]
+
+    # convergence tolerances - see gradient_descent
+    tols = convergence_tolerances(kwargs)
+
+    # curvature pairs s = w_new - w, y = grad_new - grad - most recent last
+    s_list = []
+    y_list = []
+
+    # over the line
+    cost_eval, grad_eval = gradient(w)
+    w_prev = None
+    cost_prev = None
+    stop_reason = None
+    for k in range(max_its):
+        # stop once the run has converged or the gradient vanishes
+        stop_reason = check_stop(callback, tols, unflatten, w, w_prev, grad_eval, cost_eval, cost_prev)
+        if stop_reason is None and np.linalg.norm(grad_eval) <= tol:
+            stop_reason = "grad_tol"
+        if stop_reason is not None:
+            w_hist.stop(stop_reason, k)
+            break
+
+        # two-loop recursion - apply inverse Hessian approximation to the gradient
+        q = np.array(grad_eval)
+        rhos = [1 / np.dot(y, s) for s, y in zip(s_list, y_list)]
+        coeffs = []
+        for s, y, rho in reversed(list(zip(s_list, y_list, rhos))):
+            coeff = rho * np.dot(s, q)
+            q = q - coeff * y
+            coeffs.append(coeff)
+        if len(s_list) > 0:
+            q = q * np.dot(s_list[-1], y_list[-1]) / np.dot(y_list[-1], y_list[-1])
+        for (s, y, rho), coeff in zip(zip(s_list, y_list, rhos), reversed(coeffs)):
+            q = q + (coeff - rho * np.dot(y, q)) * s
+        d = -q
+
+        # restart from steepest descent if this is not a descent direction - scaling the
+        # very first step to unit length
+        alpha = 1
+        if np.dot(d, grad_eval) >= 0 or len(s_list) == 0:
+            s_list = []
+            y_list = []
+            d = -grad_eval
+            alpha = min(1, 1 / np.linalg.norm(grad_eval))
+
+        # strong Wolfe line search - stop if no acceptable step exists
+        alpha, new_cost, new_grad = strong_wolfe_linesearch(gradient, w, d, cost_eval, grad_eval, alpha)
+        if alpha == 0:
+            stop_reason = "line_search"
+            w_hist.stop(stop_reason, k)
+            break
+
+        # store curvature pair, dropping the oldest beyond memory - skipping pairs of non-positive curvature
+        s = alpha * d
+        y = new_grad - grad_eval
+        if np.dot(s, y) > 10 ** (-10):
+            s_list.append(s)
+            y_list.append(y)
+            if len(s_list) > memory:
+                s_list.pop(0)
+                y_list.pop(0)
+
+        # take step and record
+        w_prev = w
+        cost_prev = cost_eval
+        w = w + s
+        cost_eval, grad_eval = new_cost, new_grad
+        if step_callback is not None:
+            step_callback()
+        w_hist.append(w)
 
-    # collect final weights
-    w_hist.append(unflatten(w))
+    # final weights have not been passed to the callback if all iterations ran
+    if callback is not None and stop_reason is None:
+        callback(unflatten(w), cost_eval)
 
     return w_hist
@@ -1,5 +1,4 @@
 import autograd.numpy as np
-import copy
 
 
 class Setup:
@@ -15,6 +14,12 @@ class Setup:
         if "scale" in kwargs:
             self.scale = kwargs["scale"]
 
+        # number of points transformed at once - bounds the size of the
+        # (number of stumps) x (chunk size) comparison array built per chunk
+        self.chunk_size = None
+        if "chunk_size" in kwargs:
+            self.chunk_size = kwargs["chunk_size"]
+
     # create initial weights for arbitrary feedforward network
     def initializer(self):
         w_init = np.zeros((len(self.splits) + 1, self.num_classifiers))
@@ -23,27 +28,30 @@ class Setup:
     # compute transformation on entire set of inputs
     def feature_transforms(self, x):
         # container for stump transformed data
-        N = x.shape[0]
         P = x.shape[1]
         S = len(self.splits)
+
+        # transform all points at once
+        if self.chunk_size is None or self.chunk_size >= P:
+            return self.transform_chunk(x)
+
+        # otherwise transform points chunk by chunk to bound memory
         x_transformed = np.zeros((S, P))
+        for start in range(0, P, self.chunk_size):
+            stop = min(start + self.chunk_size, P)
+            x_transformed[:, start:stop] = self.transform_chunk(x[:, start:stop])
+        return x_transformed
 
-        # loop over points and transform each individually
-        for pt in range(P):
-            x_n = x[:, pt]
-
-            # loop over the stump collectionand calculate weighted contribution
-            for u in range(len(self.splits)):
-                # get current stump f_u
-                split = self.splits[u]
-                level = self.levels[u]
-                dim = self.dims[u]
-
-                ### our stump function f_u(x)
-                if x_n[dim] <= split:  # lies to the left - so evaluate at left level
-                    x_transformed[u][pt] = level[0]
-                else:
-                    x_transformed[u][pt] = level[1]
+    # evaluate every stump on a batch of points via broadcast comparison
+    def transform_chunk(self, x):
+        # pluck out the input dimension each stump is defined along - shape (S, P)
+        x_dims = x[self.dims, :]
+
+        ### our stump functions f_u(x) all at once
+        # points that lie to the left of a split evaluate at the left level,
+        # the rest evaluate at the right level
+        left = x_dims <= self.splits[:, np.newaxis]
+        x_transformed = np.where(left, self.levels[:, 0][:, np.newaxis], self.levels[:, 1][:, np.newaxis])
         return x_transformed
 
     def create_boost_stumps(self, x, y):
@@ -54,48 +62,24 @@ class Setup:
         The input to this function: a dataset (x,y) where the input x has shape
         (NUMBER OF POINTS by  DIMENSION OF INPUT)
 
-        The output of this function is a set of two lists, one containing the split points and
-        the other the corresponding levels of stumps.
+        The output of this function is a set of three arrays, containing the split points,
+        the corresponding levels of stumps, and the dimension each stump is defined along.
         """
 
-        # containers for the split points and levels of our stumps, along with container
-        # for which dimension the stump is defined along
-        splits = []
-        levels = []
-        dims = []
-
         # important constants: dimension of input N and total number of points P
         N = np.shape(x)[0]
         P = np.size(y)
 
-        ### begin outer loop - loop over each dimension of the input
-        for n in range(N):
-            # make a copy of the n^th dimension of the input data (we will sort after this)
-            x_n = copy.deepcopy(x[n, :])
-            y_n = copy.deepcopy(y)
-
-            # sort x_n and y_n according to ascending order in x_n
-            sorted_inds = np.argsort(x_n, axis=0)
-            x_n = x_n[sorted_inds]
-            y_n = y_n[:, sorted_inds]
-
-            # loop over points and create stump in between each
-            # in dimension n
-            for p in range(P - 1):
-                # compute split point
-                split = (x_n[p] + x_n[p + 1]) / float(2)
-
-                ### create non-zero stump to 'left' of split ###
-                # compute and store split point
-                splits.append(split)
-                levels.append([1, 0])
-                dims.append(n)
-
-                ### create non-zero stump to 'right' of split ###
-                # compute and store split point
-                splits.append(split)
-                levels.append([0, 1])
-                dims.append(n)
+        # sort each dimension of the input in ascending order and compute the split
+        # point between each pair of successive inputs - shape (N, P-1)
+        x_sorted = np.sort(x, axis=1)
+        midpoints = (x_sorted[:, :-1] + x_sorted[:, 1:]) / float(2)
+
+        # each split point defines two stumps - one non-zero to the 'left' of the
+        # split and one non-zero to the 'right' - stored back to back per dimension
+        splits = np.repeat(midpoints.flatten(), 2)
+        levels = np.tile(np.array([[1.0, 0.0], [0.0, 1.0]]), (N * (P - 1), 1))
+        dims = np.repeat(np.arange(N), 2 * (P - 1))
 
         # return items
         return splits, levels, dims
@@ -1,5 +1,11 @@
 import autograd.numpy as np
+from autograd.misc.flatten import flatten
+from inspect import signature
+import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from . import optimizers
+from . import adaptive_optimizers
 from . import cost_functions
 from . import normalizers
 from . import multilayer_perceptron
@@ -7,6 +13,34 @@ from . import multilayer_perceptron_batch_normalized
 from . import stumps
 from . import polys
 from . import history_plotters
+from .weight_history import WeightHistory
+
+# setup shared with forked fit_many workers - inherited rather than pickled per task
+fit_many_setup = None
+
+
+# run one fit_many configuration on the shared setup, returning only its new histories
+def fit_many_worker(seed, config):
+    setup = fit_many_setup
+    np.random.seed(seed)
+    setup.fit(**config)
+
+    result = {
+        "weights": np.array(setup.weight_histories[-1].weights()),
+        "stop_reason": setup.weight_histories[-1].stop_reason,
+        "stop_iteration": setup.weight_histories[-1].stop_iteration,
+        "train_cost": setup.train_cost_histories[-1],
+        "valid_cost": setup.valid_cost_histories[-1],
+        "train_count": None,
+        "valid_count": None,
+        "statistics": None,
+    }
+    if len(setup.train_count_histories) > 0:
+        result["train_count"] = setup.train_count_histories[-1]
+        result["valid_count"] = setup.valid_count_histories[-1]
+    if setup.feature_name == "multilayer_perceptron_batch_normalized":
+        result["statistics"] = setup.transformer.statistics()
+    return result
 
 
 class Setup:
@@ -25,11 +59,17 @@ class Setup:
     #### define feature transformation ####
     def choose_features(self, name, **kwargs):
         # multilayer perceptron #
+        # multilayer perceptron weights are kept in one flat vector if flat=True is given, so
+        # optimizers work on them directly instead of flattening nested lists every step - weight
+        # histories then hold flat vectors, rather than nested lists
+        self.unpack = None
         if name == "multilayer_perceptron":
             self.transformer = multilayer_perceptron.Setup(**kwargs)
             self.feature_transforms = self.transformer.feature_transforms
             self.initializer = self.transformer.initializer
             self.layer_sizes = self.transformer.layer_sizes
+            if self.transformer.flat == True:
+                self.unpack = self.transformer.unpack
 
         if name == "multilayer_perceptron_batch_normalized":
             self.transformer = multilayer_perceptron_batch_normalized.Setup(**kwargs)
@@ -82,38 +122,100 @@ class Setup:
         self.y_train = self.y[:, self.train_inds]
         self.y_valid = self.y[:, self.valid_inds]
 
+    #### pre-compute features for transforms without internal parameters ####
+    def cache_features(self):
+        # feature transforms with internal parameters (e.g., multilayer perceptrons)
+        # change during training and cannot be cached
+        self.full_features = None
+        self.train_features = None
+        self.valid_features = None
+        if len(signature(self.feature_transforms).parameters) != 1:
+            return
+
+        # transform the entire dataset once and tack a 1 onto the top of each point
+        f = self.feature_transforms(self.x)
+        o = np.ones((1, np.shape(f)[1]))
+        self.full_features = np.vstack((o, f))
+
+        # training and validation features are column subsets of the full set
+        self.train_features = self.full_features[:, self.train_inds]
+        self.valid_features = self.full_features[:, self.valid_inds]
+
     #### define cost function ####
     def choose_cost(self, name, **kwargs):
         self.lam = 0
         if "lam" in kwargs:
             self.lam = kwargs["lam"]
 
+        # fit least squares from sufficient statistics of the training data?  These are
+        # streamed from the data, so feature matrices are not cached in this mode
+        self.sufficient_statistics = False
+        if "sufficient_statistics" in kwargs:
+            self.sufficient_statistics = kwargs["sufficient_statistics"]
+
+        # build cached feature matrices for parameter-free feature transforms
+        if self.sufficient_statistics == True:
+            self.full_features = None
+            self.train_features = None
+            self.valid_features = None
+        else:
+            self.cache_features()
+        if self.unpack is not None:
+            kwargs["unpack"] = self.unpack
+        full_kwargs = dict(kwargs)
+        train_kwargs = dict(kwargs)
+        valid_kwargs = dict(kwargs)
+        full_kwargs["sufficient_statistics"] = False
+        if self.full_features is not None:
+            full_kwargs["feature_matrix"] = self.full_features
+            train_kwargs["feature_matrix"] = self.train_features
+            valid_kwargs["feature_matrix"] = self.valid_features
+
+        # batch normalized networks normalize by the running statistics of training everywhere
+        # but in the training cost itself
+        inference_transforms = self.feature_transforms
+        if self.feature_name == "multilayer_perceptron_batch_normalized":
+            inference_transforms = self.transformer.feature_transforms_testing
+
         # create cost on entire dataset
-        funcs = cost_functions.Setup(name, self.x, self.y, self.feature_transforms, **kwargs)
+        funcs = cost_functions.Setup(name, self.x, self.y, inference_transforms, **full_kwargs)
         self.full_cost = funcs.cost
         self.full_model = funcs.model
 
         # create training and testing cost functions
-        funcs = cost_functions.Setup(name, self.x_train, self.y_train, self.feature_transforms, **kwargs)
+        funcs = cost_functions.Setup(name, self.x_train, self.y_train, self.feature_transforms, **train_kwargs)
         self.cost = funcs.cost
         self.model = funcs.model
-
-        funcs = cost_functions.Setup(name, self.x_valid, self.y_valid, self.feature_transforms, **kwargs)
+        self.train_funcs = funcs
+        if inference_transforms is not self.feature_transforms:
+            self.model = cost_functions.Setup(name, self.x_train, self.y_train, inference_transforms, **train_kwargs).model
+
+        # closed-form derivatives of the training cost - None unless the cost is a built-in
+        # linear model on cached features, in which case optimizers fall back to autograd
+        self.cost_value_and_grad = funcs.value_and_grad
+        self.cost_hessian = funcs.hessian
+        self.statistics_cost = funcs.statistics_cost
+        self.statistics_value_and_grad = funcs.statistics_value_and_grad
+        self.statistics_hessian = funcs.statistics_hessian
+
+        funcs = cost_functions.Setup(name, self.x_valid, self.y_valid, inference_transforms, **valid_kwargs)
         self.valid_cost = funcs.cost
+        self.valid_statistics_cost = funcs.statistics_cost
+        self.valid_value_and_grad = funcs.value_and_grad
 
         # if the cost function is a two-class classifier, build a counter too
         if name == "softmax" or name == "perceptron":
-            funcs = cost_functions.Setup("twoclass_counter", self.x_train, self.y_train, self.feature_transforms, **kwargs)
+            funcs = cost_functions.Setup("twoclass_counter", self.x_train, self.y_train, inference_transforms, **train_kwargs)
             self.counter = funcs.cost
 
-            funcs = cost_functions.Setup("twoclass_counter", self.x_valid, self.y_valid, self.feature_transforms, **kwargs)
+            funcs = cost_functions.Setup("twoclass_counter", self.x_valid, self.y_valid, inference_transforms, **valid_kwargs)
             self.valid_counter = funcs.cost
 
         if name == "multiclass_softmax" or name == "multiclass_perceptron":
-            funcs = cost_functions.Setup("multiclass_counter", self.x_train, self.y_train, self.feature_transforms, **kwargs)
+            funcs = cost_functions.Setup("multiclass_counter", self.x_train, self.y_train, inference_transforms, **train_kwargs)
             self.counter = funcs.cost
 
-            funcs = cost_functions.Setup("multiclass_counter", self.x_valid, self.y_valid, self.feature_transforms, **kwargs)
+            funcs = cost_functions.Setup("multiclass_counter", self.x_valid, self.y_valid, inference_transforms, **valid_kwargs)
             self.valid_counter = funcs.cost
 
         self.cost_name = name
@@ -125,6 +227,10 @@ class Setup:
         alpha_choice = 10 ** (-1)
         self.w_init = self.initializer()
         optimizer = "gradient_descent"
+
+        # running normalization statistics are tracked afresh for each run
+        if self.feature_name == "multilayer_perceptron_batch_normalized":
+            self.transformer.reset_statistics()
         epsilon = 10 ** (-10)
 
         # set parameters by hand
@@ -137,44 +243,390 @@ class Setup:
         if "epsilon" in kwargs:
             epsilon = kwargs["epsilon"]
 
+        # hessian-free newton settings
+        hessian_free = False
+        if "hessian_free" in kwargs:
+            hessian_free = kwargs["hessian_free"]
+        cg_max_its = 20
+        if "cg_max_its" in kwargs:
+            cg_max_its = kwargs["cg_max_its"]
+
+        # l-bfgs settings - number of curvature pairs kept and gradient norm tolerance
+        memory = 10
+        if "memory" in kwargs:
+            memory = kwargs["memory"]
+        tol = 10 ** (-6)
+        if "tol" in kwargs:
+            tol = kwargs["tol"]
+
+        # convergence tolerances on the gradient norm, relative cost change and relative step
+        # size - each run stops early once any one is met (0 = off), recording why and when in
+        # its weight history's stop_reason / stop_iteration
+        tols = optimizers.convergence_tolerances(kwargs)
+
+        # memory-map the weight history to a file?
+        history_file = None
+        if "history_file" in kwargs:
+            history_file = kwargs["history_file"]
+
         # batch size for gradient descent?
         self.num_pts = np.size(self.y_train)
         self.batch_size = np.size(self.y_train)
         if "batch_size" in kwargs:
             self.batch_size = kwargs["batch_size"]
 
+        # reshuffle training data each epoch of minibatch descent, optionally
+        # prefetching the next epoch's order in the background
+        shuffle = True
+        if "shuffle" in kwargs:
+            shuffle = kwargs["shuffle"]
+        prefetch = False
+        if "prefetch" in kwargs:
+            prefetch = kwargs["prefetch"]
+        shuffler = None
+        if shuffle == True and self.batch_size < self.num_pts:
+            shuffler = self.train_funcs
+
+        # full batch least squares runs purely on sufficient statistics, when computed
+        value_and_grad = self.cost_value_and_grad
+        cost_hessian = self.cost_hessian
+        if self.statistics_value_and_grad is not None and self.batch_size == self.num_pts:
+            value_and_grad = self.statistics_value_and_grad
+            cost_hessian = self.statistics_hessian
+
+        # full training / validation costs recorded in histories - from sufficient statistics when computed
+        train_full_cost = self.cost
+        if self.statistics_cost is not None:
+            train_full_cost = self.statistics_cost
+        valid_full_cost = self.valid_cost
+        if self.valid_statistics_cost is not None:
+            valid_full_cost = self.valid_statistics_cost
+
+        # evaluate validation cost / count every valid_stride steps only?
+        valid_stride = 1
+        if "valid_stride" in kwargs:
+            valid_stride = kwargs["valid_stride"]
+
+        # containers for histories tracked during optimization
+        train_cost_history = []
+        valid_cost_history = []
+        train_count_history = []
+        valid_count_history = []
+        classifier = (
+            self.cost_name == "softmax"
+            or self.cost_name == "perceptron"
+            or self.cost_name == "multiclass_softmax"
+            or self.cost_name == "multiclass_perceptron"
+        )
+
+        # batch normalized networks fold the normalization statistics behind each step taken -
+        # minibatch or full batch - into their running averages
+        step_callback = None
+        if self.feature_name == "multilayer_perceptron_batch_normalized":
+            step_callback = self.transformer.update_statistics
+
+        # record training / validation histories on each weight as the optimizer produces it,
+        # reusing the training cost computed alongside a full batch gradient when available
+        def track_histories(w, cost_eval):
+            k = len(train_cost_history)
+            if cost_eval is None:
+                cost_eval = train_full_cost(w, np.arange(np.size(self.y_train)))
+            else:
+                # costs evaluated on flattened weights come back as length-one arrays
+                cost_eval = np.ravel(cost_eval)[0]
+            train_cost_history.append(cost_eval)
+            if classifier:
+                train_count_history.append(self.counter(w))
+
+            # in between validation evaluations carry the last value forward
+            if k % valid_stride == 0:
+                valid_cost_history.append(valid_full_cost(w, np.arange(np.size(self.y_valid))))
+                if classifier:
+                    valid_count_history.append(self.valid_counter(w))
+            else:
+                valid_cost_history.append(valid_cost_history[-1])
+                if classifier:
+                    valid_count_history.append(valid_count_history[-1])
+
+        # adaptive first order methods - momentum, nesterov, adagrad, RMSprop and adam - with
+        # their parameters (beta, gamma, beta_1, beta_2, eps) passed through
+        adaptive_kwargs = {}
+        for key in ["beta", "gamma", "beta_1", "beta_2", "eps"]:
+            if key in kwargs:
+                adaptive_kwargs[key] = kwargs[key]
+        adaptive = optimizer == "momentum" or optimizer == "nesterov" or optimizer == "adagrad" or optimizer == "RMSprop" or optimizer == "adam"
+
         # optimize
         weight_history = []
 
         # run gradient descent
         if optimizer == "gradient_descent":
-            weight_history = optimizers.gradient_descent(self.cost, self.alpha_choice, self.max_its, self.w_init, self.num_pts, self.batch_size)
+            weight_history = optimizers.gradient_descent(
+                self.cost,
+                self.alpha_choice,
+                self.max_its,
+                self.w_init,
+                self.num_pts,
+                self.batch_size,
+                history_file=history_file,
+                callback=track_histories,
+                step_callback=step_callback,
+                **tols,
+                value_and_grad=value_and_grad,
+                shuffler=shuffler,
+                prefetch=prefetch,
+            )
+
+        if adaptive:
+            weight_history = adaptive_optimizers.descent(
+                self.cost,
+                optimizer,
+                self.alpha_choice,
+                self.max_its,
+                self.w_init,
+                self.num_pts,
+                self.batch_size,
+                history_file=history_file,
+                callback=track_histories,
+                step_callback=step_callback,
+                **tols,
+                value_and_grad=value_and_grad,
+                shuffler=shuffler,
+                prefetch=prefetch,
+                **adaptive_kwargs,
+            )
+
+        # variance-reduced stochastic methods for convex costs
+        if optimizer == "SVRG" or optimizer == "SAGA":
+            variance_reduced = optimizers.SVRG
+            if optimizer == "SAGA":
+                variance_reduced = optimizers.SAGA
+            weight_history = variance_reduced(
+                self.cost,
+                self.alpha_choice,
+                self.max_its,
+                self.w_init,
+                self.num_pts,
+                self.batch_size,
+                history_file=history_file,
+                callback=track_histories,
+                step_callback=step_callback,
+                **tols,
+                value_and_grad=value_and_grad,
+            )
 
         if optimizer == "newtons_method":
-            weight_history = optimizers.newtons_method(self.cost, self.max_its, self.w_init, self.num_pts, self.batch_size, epsilon=epsilon)
-
-        # compute training and testing cost histories
-        train_cost_history = [self.cost(v, np.arange(np.size(self.y_train))) for v in weight_history]
-        valid_cost_history = [self.valid_cost(v, np.arange(np.size(self.y_valid))) for v in weight_history]
+            weight_history = optimizers.newtons_method(
+                self.cost,
+                self.max_its,
+                self.w_init,
+                self.num_pts,
+                self.batch_size,
+                epsilon=epsilon,
+                hessian_free=hessian_free,
+                cg_max_its=cg_max_its,
+                history_file=history_file,
+                callback=track_histories,
+                step_callback=step_callback,
+                **tols,
+                value_and_grad=value_and_grad,
+                hessian=cost_hessian,
+            )
+
+        if optimizer == "lbfgs":
+            weight_history = optimizers.lbfgs(
+                self.cost,
+                self.max_its,
+                self.w_init,
+                self.num_pts,
+                memory=memory,
+                tol=tol,
+                history_file=history_file,
+                callback=track_histories,
+                step_callback=step_callback,
+                **tols,
+                value_and_grad=value_and_grad,
+            )
 
         # store all new histories
         self.weight_histories.append(weight_history)
         self.train_cost_histories.append(train_cost_history)
         self.valid_cost_histories.append(valid_cost_history)
 
-        # if classification produce count history
-        if (
+        # if classification store count history
+        if classifier:
+            self.train_count_histories.append(train_count_history)
+            self.valid_count_histories.append(valid_count_history)
+
+    #### run gradient descent with many step lengths at once ####
+    # for built-in linear model costs on cached features all K trajectories advance together
+    # with batched matrix products, otherwise each step length is fit in turn.  One set of
+    # histories is appended per step length, in the order of alpha_choices
+    def fit_sweep(self, alpha_choices, **kwargs):
+        # fall back to one run per step length where closed-form derivatives are unavailable
+        if self.cost_value_and_grad is None:
+            for alpha_choice in alpha_choices:
+                self.fit(alpha_choice=alpha_choice, **kwargs)
+            return
+
+        # basic parameters
+        self.w_init = self.initializer()
+        if "max_its" in kwargs:
+            self.max_its = kwargs["max_its"]
+        self.num_pts = np.size(self.y_train)
+        self.batch_size = np.size(self.y_train)
+        if "batch_size" in kwargs:
+            self.batch_size = kwargs["batch_size"]
+
+        # reshuffle training data each epoch of minibatch descent, optionally
+        # prefetching the next epoch's order in the background
+        shuffle = True
+        if "shuffle" in kwargs:
+            shuffle = kwargs["shuffle"]
+        prefetch = False
+        if "prefetch" in kwargs:
+            prefetch = kwargs["prefetch"]
+        shuffler = None
+        if shuffle == True and self.batch_size < self.num_pts:
+            shuffler = self.train_funcs
+
+        # evaluate validation cost / count every valid_stride steps only?
+        valid_stride = 1
+        if "valid_stride" in kwargs:
+            valid_stride = kwargs["valid_stride"]
+
+        # containers for histories of each step length
+        K = len(alpha_choices)
+        train_cost_histories = [[] for k in range(K)]
+        valid_cost_histories = [[] for k in range(K)]
+        train_count_histories = [[] for k in range(K)]
+        valid_count_histories = [[] for k in range(K)]
+        classifier = (
             self.cost_name == "softmax"
             or self.cost_name == "perceptron"
             or self.cost_name == "multiclass_softmax"
             or self.cost_name == "multiclass_perceptron"
-        ):
-            train_count_history = [self.counter(v) for v in weight_history]
-            valid_count_history = [self.valid_counter(v) for v in weight_history]
+        )
+
+        # record histories on each stack of weights, evaluating costs for all step lengths at once
+        def track_histories(w, cost_evals):
+            j = len(train_cost_histories[0])
+            if cost_evals is None:
+                cost_evals = self.cost_value_and_grad(w, slice(None))[0]
+            evaluate_valid = j % valid_stride == 0
+            if evaluate_valid:
+                valid_evals = self.valid_value_and_grad(w, slice(None))[0]
+            for k in range(K):
+                train_cost_histories[k].append(cost_evals[k])
+                if classifier:
+                    train_count_histories[k].append(self.counter(w[k]))
+
+                # in between validation evaluations carry the last value forward
+                if evaluate_valid:
+                    valid_cost_histories[k].append(valid_evals[k])
+                    if classifier:
+                        valid_count_histories[k].append(self.valid_counter(w[k]))
+                else:
+                    valid_cost_histories[k].append(valid_cost_histories[k][-1])
+                    if classifier:
+                        valid_count_histories[k].append(valid_count_histories[k][-1])
+
+        # run all step lengths together
+        weight_histories = optimizers.gradient_descent_sweep(
+            self.cost_value_and_grad,
+            alpha_choices,
+            self.max_its,
+            self.w_init,
+            self.num_pts,
+            self.batch_size,
+            callback=track_histories,
+            shuffler=shuffler,
+            prefetch=prefetch,
+        )
 
-            # store count history
-            self.train_count_histories.append(train_count_history)
-            self.valid_count_histories.append(valid_count_history)
+        # store all new histories
+        for k in range(K):
+            self.weight_histories.append(weight_histories[k])
+            self.train_cost_histories.append(train_cost_histories[k])
+            self.valid_cost_histories.append(valid_cost_histories[k])
+            if classifier:
+                self.train_count_histories.append(train_count_histories[k])
+                self.valid_count_histories.append(valid_count_histories[k])
+
+    #### run many optimizations in parallel ####
+    # each configuration is a dictionary of fit settings (e.g., alpha_choice, batch_size, optimizer),
+    # plus an optional initializer seed, and is run in its own worker process.  Workers are forked,
+    # so the dataset and cost functions are shared with them rather than pickled for each task -
+    # each gets an independent random stream, and results are appended to the history containers
+    # in the order of configs
+    def fit_many(self, configs, **kwargs):
+        # number of worker processes - defaults to the number of cores
+        max_workers = None
+        if "max_workers" in kwargs:
+            max_workers = kwargs["max_workers"]
+
+        # entropy for the random streams of configurations not given a seed
+        seed = None
+        if "seed" in kwargs:
+            seed = kwargs["seed"]
+
+        # settings shared by all configurations - each configuration overrides these
+        shared = dict(kwargs)
+        shared.pop("max_workers", None)
+        shared.pop("seed", None)
+
+        # spawn an independent random stream per configuration
+        streams = np.random.SeedSequence(seed).spawn(len(configs))
+        seeds = []
+        tasks = []
+        for config, stream in zip(configs, streams):
+            config = dict(config)
+            if "seed" in config:
+                stream = np.random.SeedSequence(config.pop("seed"))
+            seeds.append(stream.generate_state(4))
+            task = dict(shared)
+            task.update(config)
+            tasks.append(task)
+
+        # workers fit on a copy of this setup sharing its data, but with empty history containers
+        scratch = copy.copy(self)
+        scratch.weight_histories = []
+        scratch.train_cost_histories = []
+        scratch.train_count_histories = []
+        scratch.valid_cost_histories = []
+        scratch.valid_count_histories = []
+
+        # run configurations in forked worker processes - or in turn here where fork is unavailable
+        global fit_many_setup
+        fit_many_setup = scratch
+        try:
+            if "fork" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("fork")
+                with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+                    results = list(executor.map(fit_many_worker, seeds, tasks))
+            else:
+                results = [fit_many_worker(worker_seed, task) for worker_seed, task in zip(seeds, tasks)]
+        finally:
+            fit_many_setup = None
+
+        # merge results into history containers, re-wrapping flat weights for unflattening
+        unflatten = flatten(self.initializer())[1]
+        for result in results:
+            weights = result["weights"]
+            weight_history = WeightHistory(unflatten, np.shape(weights)[0], np.shape(weights)[1])
+            for w in weights:
+                weight_history.append(w)
+            weight_history.stop(result["stop_reason"], result["stop_iteration"])
+            self.weight_histories.append(weight_history)
+            self.train_cost_histories.append(result["train_cost"])
+            self.valid_cost_histories.append(result["valid_cost"])
+            if result["train_count"] is not None:
+                self.train_count_histories.append(result["train_count"])
+                self.valid_count_histories.append(result["valid_count"])
+
+        # batch normalized networks keep the running statistics of the last run, as after fits in turn
+        if len(results) > 0 and results[-1]["statistics"] is not None:
+            self.transformer.load_statistics(results[-1]["statistics"])
 
     #### plot histories ###
     def show_histories(self, **kwargs):
@@ -187,10 +639,8 @@ class Setup:
     def fix_normalizers(self, w):
         ### re-set feature transformation ###
         # fix normalization at each layer by passing data and specific weight through network
-        self.feature_transforms(self.x, w)
-        # re-assign feature transformation based on these settings
-        self.feature_transforms_validation = self.transformer.feature_transforms_validation
+        self.transformer.fix_statistics(self.x, w[0])
 
-        ### re-assign cost function (and counter) based on fixed architecture ###
-        funcs = cost_functions.Setup(self.cost_name, self.x, self.y, self.feature_transforms_validation)
+        ### re-assign model based on fixed architecture ###
+        funcs = cost_functions.Setup(self.cost_name, self.x, self.y, self.transformer.feature_transforms_testing)
         self.model = funcs.model
@@ -14,6 +14,12 @@ class Setup:
         # count parameter layers of input to feature transform
         self.sig = signature(self.feature_transforms)
 
+        # function splitting flat weights into [internal weights, final linear combination] views -
+        # given for feature transforms whose weights are kept in one flat vector
+        self.unpack = None
+        if "unpack" in kwargs:
+            self.unpack = kwargs["unpack"]
+
         ### make cost function choice ###
         # for regression
         if name == "least_squares":
@@ -51,6 +57,8 @@ class Setup:
         # not have internal parameters
         f = 0
         if len(self.sig.parameters) == 2:
+            if self.unpack is not None and np.ndim(w) == 1:
+                w = self.unpack(w)
             f = self.feature_transforms(x, w[0])
         else:
             f = self.feature_transforms(x)
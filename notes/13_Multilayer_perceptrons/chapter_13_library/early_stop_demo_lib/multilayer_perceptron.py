@@ -30,6 +30,23 @@ class Setup:
         if "scale" in kwargs:
             self.scale = kwargs["scale"]
 
+        # store all weights in one flat vector, rather than as nested lists of weight matrices?
+        # (standard activations only - maxout weights stay nested)
+        self.flat = False
+        if "flat" in kwargs and activation != "maxout":
+            self.flat = kwargs["flat"]
+
+        # offset table locating each layer's weight matrix within the flat weight vector -
+        # (start, stop, shape) per layer, with the final linear combination last
+        self.offsets = []
+        start = 0
+        for k in range(len(self.layer_sizes) - 1):
+            shape = (self.layer_sizes[k] + 1, self.layer_sizes[k + 1])
+            stop = start + shape[0] * shape[1]
+            self.offsets.append((start, stop, shape))
+            start = stop
+        self.num_params = start
+
         # assign initializer / feature transforms function
         if activation == "linear" or activation == "tanh" or activation == "relu" or activation == "sinc" or activation == "sin":
             self.initializer = self.standard_initializer
@@ -60,8 +77,18 @@ class Setup:
         # final linear combination in predict function
         w_init = [weights[:-1], weights[-1]]
 
+        # flat layout - concatenate in the same order autograd's flatten would use
+        if self.flat == True:
+            w_init = np.concatenate([np.ravel(weight) for weight in weights])
+
         return w_init
 
+    # split a flat weight vector into per-layer views [omega_inner, w] matching the
+    # nested layout - slices of a contiguous vector, so nothing is copied
+    def unpack(self, w):
+        views = [np.reshape(w[start:stop], shape) for start, stop, shape in self.offsets]
+        return [views[:-1], views[-1]]
+
     # create initial weights for arbitrary feedforward network
     def maxout_initializer(self):
         # container for entire weight tensor
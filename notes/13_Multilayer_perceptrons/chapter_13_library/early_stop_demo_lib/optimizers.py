@@ -1,7 +1,83 @@
 import autograd.numpy as np
 from autograd import value_and_grad
 from autograd import hessian
+from autograd import grad as compute_grad
+from autograd import make_jvp
 from autograd.misc.flatten import flatten_func
+from .weight_history import WeightHistory
+
+
+# truncated conjugate gradient solve of the linear system A d = b, where A is only
+# available through matrix-vector products A_prod(v) - stops early once the residual
+# is small or a direction of non-positive curvature is found
+def conjugate_gradient(A_prod, b, max_its, **kwargs):
+    # relative residual tolerance
+    tol = 10 ** (-10)
+    if "tol" in kwargs:
+        tol = kwargs["tol"]
+
+    # initialize solution, residual, and search direction
+    d = np.zeros(np.shape(b))
+    r = b
+    p = r
+    r_sq = np.dot(r, r)
+    b_norm = np.sqrt(r_sq)
+
+    for i in range(max_its):
+        if np.sqrt(r_sq) <= tol * b_norm:
+            break
+
+        # non-positive curvature - fall back to steepest descent on the first pass
+        Ap = A_prod(p)
+        curvature = np.dot(p, Ap)
+        if curvature <= 0:
+            if i == 0:
+                d = b
+            break
+
+        # take step along conjugate direction, update residual and direction
+        step = r_sq / curvature
+        d = d + step * p
+        r = r - step * Ap
+        r_sq_new = np.dot(r, r)
+        p = r + (r_sq_new / r_sq) * p
+        r_sq = r_sq_new
+    return d
+
+
+# convergence tolerances on the gradient norm, relative change in cost and relative step size -
+# read from an optimizer's keyword arguments, each off (0) unless given
+def convergence_tolerances(kwargs):
+    tols = {"grad_tol": 0, "cost_tol": 0, "step_tol": 0}
+    for key in tols:
+        if key in kwargs:
+            tols[key] = kwargs[key]
+    return tols
+
+
+# check for convergence at weights w, reached from the previously recorded weights w_prev, given a full
+# batch gradient at either and the costs at both - any of which may be None when unavailable - returns
+# the name of the tolerance met, or None to keep going
+def check_convergence(tols, w, w_prev, grad_eval, cost_eval, cost_prev):
+    if tols["grad_tol"] > 0 and grad_eval is not None and np.linalg.norm(grad_eval) <= tols["grad_tol"]:
+        return "grad_tol"
+    if tols["cost_tol"] > 0 and cost_eval is not None and cost_prev is not None:
+        if np.abs(cost_prev - cost_eval) <= tols["cost_tol"] * np.abs(cost_prev):
+            return "cost_tol"
+    if tols["step_tol"] > 0 and w_prev is not None and np.linalg.norm(w - w_prev) <= tols["step_tol"] * (1 + np.linalg.norm(w_prev)):
+        return "step_tol"
+    return None
+
+
+# stop check on recorded weights w - the callback (if any) is given a copy of them (optimizers may step
+# w in place) and their cost value first and may return a reason to stop, after which the convergence
+# tolerances are checked.  Returns the reason to stop, or None to keep going
+def check_stop(callback, tols, unflatten, w, w_prev, grad_eval, cost_eval, cost_prev):
+    if callback is not None:
+        stop_reason = callback(unflatten(np.array(w)), cost_eval)
+        if stop_reason is not None:
+            return stop_reason
+    return check_convergence(tols, w, w_prev, grad_eval, cost_eval, cost_prev)
 
 
 # minibatch gradient descent
@@ -18,19 +94,40 @@ def gradient_descent(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
     g_flat, unflatten, w = flatten_func(g, w)
     grad = value_and_grad(g_flat)
 
-    # record history
-    w_hist = []
-    w_hist.append(unflatten(w))
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight along with its cost
+    # value, when the latter comes for free from a full batch gradient evaluation.
+    # The callback may return a reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # convergence tolerances - gradient norm and relative cost change are only
+    # available for full batch steps, the relative step size for all
+    tols = convergence_tolerances(kwargs)
 
     # how many mini-batches equal the entire dataset?
     num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+    full_batch = num_batches == 1
+    if callback is not None and not full_batch:
+        callback(unflatten(w), None)
 
     # initialization for momentum direction
     h = np.zeros((w.shape))
 
     # over the line
+    w_prev = None
+    cost_prev = None
+    stop_reason = None
     for k in range(max_its):
         # loop over each minibatch
+        w_start = w
         for b in range(num_batches):
             # collect indices of current mini-batch
             batch_inds = np.arange(b * batch_size, min((b + 1) * batch_size, num_pts))
@@ -39,6 +136,14 @@ def gradient_descent(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
             cost_eval, grad_eval = grad(w, batch_inds)
             grad_eval.shape = np.shape(w)
 
+            # full batch cost value belongs to the most recently recorded weights - stop
+            # here, before stepping, if they have converged
+            if full_batch:
+                stop_reason = check_stop(callback, tols, unflatten, w, w_prev, grad_eval, cost_eval, cost_prev)
+                if stop_reason is not None:
+                    break
+                cost_prev = cost_eval
+
             # normalize?
             if normalize == True:
                 grad_eval = np.sign(grad_eval)
@@ -49,54 +154,144 @@ def gradient_descent(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
             # take descent step with momentum
             w = w - alpha * grad_eval
 
+        if stop_reason is not None:
+            w_hist.stop(stop_reason, k)
+            break
+
         # record weight update
-        w_hist.append(unflatten(w))
+        w_hist.append(w)
+        w_prev = w_start
+        if not full_batch:
+            stop_reason = check_stop(callback, tols, unflatten, w, w_prev, None, None, None)
+            if stop_reason is not None:
+                w_hist.stop(stop_reason, k + 1)
+                break
+
+    # final weights have not been evaluated by a full batch gradient
+    if callback is not None and full_batch and stop_reason is None:
+        callback(unflatten(w), None)
 
     return w_hist
 
 
-# RMSprop advanced first order optimizer
-def RMSprop(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
-    # rmsprop params
-    gamma = 0.9
-    eps = 10**-8
-    if "gamma" in kwargs:
-        gamma = kwargs["gamma"]
-    if "eps" in kwargs:
-        eps = kwargs["eps"]
-
+# stochastic variance reduced gradient (SVRG) - each epoch takes a full gradient snapshot at the current
+# weights, followed by num_batches steps on randomly drawn mini-batches whose gradients are corrected
+# using the snapshot.  With a fixed steplength this converges linearly on strongly convex costs
+def SVRG(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
     # flatten the input function, create gradient based on flat function
     g_flat, unflatten, w = flatten_func(g, w)
     grad = value_and_grad(g_flat)
 
-    # initialize average gradient
-    avg_sq_grad = np.ones(np.size(w))
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight along with its cost
+    # value, which comes for free from each full gradient snapshot.  The callback
+    # may return a reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
 
-    # record history
-    w_hist = [unflatten(w)]
+    # convergence tolerances - checked at each full gradient snapshot
+    tols = convergence_tolerances(kwargs)
 
     # how many mini-batches equal the entire dataset?
     num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
 
     # over the line
+    w_prev = None
+    cost_prev = None
+    stop_reason = None
     for k in range(max_its):
-        # loop over each minibatch
-        for b in range(num_batches):
-            # collect indices of current mini-batch
-            batch_inds = np.arange(b * batch_size, min((b + 1) * batch_size, num_pts))
+        # full gradient snapshot - its cost value belongs to the most recently recorded weights
+        w_snap = w
+        cost_eval, full_grad = grad(w_snap, slice(0, num_pts))
+        stop_reason = check_stop(callback, tols, unflatten, w, w_prev, full_grad, cost_eval, cost_prev)
+        if stop_reason is not None:
+            w_hist.stop(stop_reason, k)
+            break
+
+        # take steps on randomly drawn mini-batches - each gradient weighted by its batch's share
+        # of points, so that the corrected gradient is an unbiased estimate of the full gradient
+        for b in np.random.randint(num_batches, size=num_batches):
+            batch_inds = slice(b * batch_size, min((b + 1) * batch_size, num_pts))
+            weight = (batch_inds.stop - batch_inds.start) * num_batches / num_pts
+            grad_eval = grad(w, batch_inds)[1]
+            snap_grad_eval = grad(w_snap, batch_inds)[1]
+            w = w - alpha * (weight * (grad_eval - snap_grad_eval) + full_grad)
+
+        # record weights after each epoch
+        w_hist.append(w)
+        w_prev = w_snap
+        cost_prev = cost_eval
+
+    # final weights have not been evaluated by a full gradient snapshot
+    if callback is not None and stop_reason is None:
+        callback(unflatten(w), None)
 
-            # plug in value into func and derivative
-            cost_eval, grad_eval = grad(w, batch_inds)
-            grad_eval.shape = np.shape(w)
+    return w_hist
 
-            # update exponential average of past gradients
-            avg_sq_grad = gamma * avg_sq_grad + (1 - gamma) * grad_eval**2
 
-            # take descent step
-            w = w - alpha * grad_eval / (avg_sq_grad ** (0.5) + eps)
+# SAGA - keeps a table of the most recent gradient of each mini-batch, stored compactly as one row
+# per batch, and steps along the newest batch gradient corrected by the table.  With a fixed
+# steplength this converges linearly on strongly convex costs
+def SAGA(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
+    # flatten the input function, create gradient based on flat function
+    g_flat, unflatten, w = flatten_func(g, w)
+    grad = value_and_grad(g_flat)
 
-        # record weight update, train and val costs
-        w_hist.append(unflatten(w))
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight, and may return a
+    # reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # relative step size tolerance - checked after each epoch
+    tols = convergence_tolerances(kwargs)
+    if callback is not None:
+        callback(unflatten(w), None)
+
+    # how many mini-batches equal the entire dataset?  Each batch's gradient is weighted by its
+    # share of points, so that the table average is the full gradient
+    num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+    batches = [slice(b * batch_size, min((b + 1) * batch_size, num_pts)) for b in range(num_batches)]
+    weights = [(s.stop - s.start) * num_batches / num_pts for s in batches]
+
+    # fill gradient table at the initialization
+    table = np.zeros((num_batches, np.size(w)))
+    for b in range(num_batches):
+        table[b] = weights[b] * grad(w, batches[b])[1]
+    table_avg = np.mean(table, axis=0)
+
+    # over the line
+    for k in range(max_its):
+        # take steps on randomly drawn mini-batches
+        w_start = w
+        for b in np.random.randint(num_batches, size=num_batches):
+            grad_eval = weights[b] * grad(w, batches[b])[1]
+            w = w - alpha * (grad_eval - table[b] + table_avg)
+
+            # update table and its average
+            table_avg = table_avg + (grad_eval - table[b]) / num_batches
+            table[b] = grad_eval
+
+        # record weights after each epoch
+        w_hist.append(w)
+        stop_reason = check_stop(callback, tols, unflatten, w, w_start, None, None, None)
+        if stop_reason is not None:
+            w_hist.stop(stop_reason, k + 1)
+            break
 
     return w_hist
 
@@ -108,15 +303,47 @@ def newtons_method(g, epsilon, max_its, w, num_pts, batch_size, **kwargs):
     grad = value_and_grad(g_flat)
     hess = hessian(g_flat)
 
-    # record history
-    w_hist = []
-    w_hist.append(unflatten(w))
+    # solve each Newton system by truncated conjugate gradient using only Hessian-vector
+    # products - never forming the Hessian - with at most cg_max_its inner iterations?
+    hessian_free = False
+    if "hessian_free" in kwargs:
+        hessian_free = kwargs["hessian_free"]
+    cg_max_its = 20
+    if "cg_max_its" in kwargs:
+        cg_max_its = kwargs["cg_max_its"]
+
+    # Hessian-vector products computed forward-over-reverse
+    hess_vec = make_jvp(compute_grad(g_flat))
+
+    # record history - optionally memory-mapped to a file
+    history_file = None
+    if "history_file" in kwargs:
+        history_file = kwargs["history_file"]
+    w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+    w_hist.append(w)
+
+    # metric callback - called once on each recorded weight along with its cost
+    # value, when the latter comes for free from a full batch gradient evaluation.
+    # The callback may return a reason (e.g., "patience") to stop the run early
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
+    # convergence tolerances - see gradient_descent
+    tols = convergence_tolerances(kwargs)
 
     # how many mini-batches equal the entire dataset?
     num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+    full_batch = num_batches == 1
+    if callback is not None and not full_batch:
+        callback(unflatten(w), None)
 
     # over the line
+    w_prev = None
+    cost_prev = None
+    stop_reason = None
     for k in range(max_its):
+        w_start = w
         for b in range(num_batches):
             # collect indices of current mini-batch
             batch_inds = np.arange(b * batch_size, min((b + 1) * batch_size, num_pts))
@@ -125,22 +352,52 @@ def newtons_method(g, epsilon, max_its, w, num_pts, batch_size, **kwargs):
             cost_eval, grad_eval = grad(w, batch_inds)
             grad_eval.shape = np.shape(w)
 
-            # evaluate the hessian
-            hess_eval = hess(w, batch_inds)
-
-            # reshape for numpy linalg functionality
-            hess_eval.shape = (int((np.size(hess_eval)) ** (0.5)), int((np.size(hess_eval)) ** (0.5)))
-            hess_eval += epsilon * np.eye(np.size(w))
-
-            # solve second order system system for weight update
-            A = hess_eval
-            b = grad_eval
-            w = np.linalg.lstsq(A, np.dot(A, w) - b)[0]
+            # full batch cost value belongs to the most recently recorded weights - stop
+            # here, before stepping, if they have converged
+            if full_batch:
+                stop_reason = check_stop(callback, tols, unflatten, w, w_prev, grad_eval, cost_eval, cost_prev)
+                if stop_reason is not None:
+                    break
+                cost_prev = cost_eval
+
+            # hessian-free - solve regularized second order system with conjugate gradient
+            if hessian_free == True:
+                hess_vec_eval = hess_vec(w, batch_inds)
+                A_prod = lambda v: hess_vec_eval(v)[1] + epsilon * v
+                w = w + conjugate_gradient(A_prod, -grad_eval, cg_max_its)
+            else:
+                # evaluate the hessian
+                hess_eval = hess(w, batch_inds)
+
+                # reshape for numpy linalg functionality
+                hess_eval.shape = (int((np.size(hess_eval)) ** (0.5)), int((np.size(hess_eval)) ** (0.5)))
+                hess_eval += epsilon * np.eye(np.size(w))
+
+                # solve second order system system for weight update
+                A = hess_eval
+                b = grad_eval
+                w = np.linalg.lstsq(A, np.dot(A, w) - b)[0]
+
+        if stop_reason is not None:
+            w_hist.stop(stop_reason, k)
+            break
 
         # record weight update, train and val costs
-        w_hist.append(unflatten(w))
-
+        w_hist.append(w)
+        w_prev = w_start
+        if not full_batch:
+            stop_reason = check_stop(callback, tols, unflatten, w, w_prev, None, None, None)
+            if stop_reason is not None:
+                w_hist.stop(stop_reason, k + 1)
+                break
+
+        # bail out of diverging runs
         if np.linalg.norm(w) > 100:
-            return w_hist
+            w_hist.stop("diverged", k + 1)
+            break
+
+    # final weights have not been evaluated by a full batch gradient
+    if callback is not None and full_batch and stop_reason is None:
+        callback(unflatten(w), None)
 
     return w_hist
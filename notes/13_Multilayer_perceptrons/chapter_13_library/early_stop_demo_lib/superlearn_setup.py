@@ -1,5 +1,6 @@
 import autograd.numpy as np
 from . import optimizers
+from . import adaptive_optimizers
 from . import cost_functions
 from . import normalizers
 from . import multilayer_perceptron
@@ -24,12 +25,17 @@ class Setup:
     #### define feature transformation ####
     def choose_features(self, name, **kwargs):
         ### select from pre-made feature transforms ###
-        # multilayer perceptron #
+        # multilayer perceptron - weights are kept in one flat vector if flat=True is given, so
+        # optimizers work on them directly instead of flattening nested lists every step - weight
+        # histories then hold flat vectors, rather than nested lists
+        self.unpack = None
         if name == "multilayer_perceptron":
             self.transformer = multilayer_perceptron.Setup(**kwargs)
             self.feature_transforms = self.transformer.feature_transforms
             self.initializer = self.transformer.initializer
             self.layer_sizes = self.transformer.layer_sizes
+            if self.transformer.flat == True:
+                self.unpack = self.transformer.unpack
 
         if name == "multilayer_perceptron_batch_normalized":
             self.transformer = multilayer_perceptron_batch_normalized.Setup(**kwargs)
@@ -74,6 +80,10 @@ class Setup:
 
     #### define cost function ####
     def choose_cost(self, name, **kwargs):
+        # flat multilayer perceptron weights are split into per-layer views by the model
+        if self.unpack is not None:
+            kwargs["unpack"] = self.unpack
+
         # create cost on entire dataset
         funcs = cost_functions.Setup(name, self.x, self.y, self.feature_transforms, **kwargs)
         self.full_cost = funcs.cost
@@ -123,6 +133,11 @@ class Setup:
             optimizer = kwargs["optimizer"]
         if "epsilon" in kwargs:
             epsilon = kwargs["epsilon"]
+
+        # memory-map the weight history to a file?
+        history_file = None
+        if "history_file" in kwargs:
+            history_file = kwargs["history_file"]
         if "init" in kwargs:
             print("here")
             self.w_init = kwargs["init"]
@@ -133,47 +148,167 @@ class Setup:
         if "batch_size" in kwargs:
             self.batch_size = kwargs["batch_size"]
 
+        # evaluate validation cost / count every valid_stride steps only?
+        valid_stride = 1
+        if "valid_stride" in kwargs:
+            valid_stride = kwargs["valid_stride"]
+
+        # stop once the validation cost has not improved for patience validation evaluations?
+        patience = None
+        if "patience" in kwargs:
+            patience = kwargs["patience"]
+
+        # convergence tolerances on the gradient norm, relative cost change and relative step
+        # size - each run stops early once any one is met (0 = off), recording why and when in
+        # its weight history's stop_reason / stop_iteration
+        tols = optimizers.convergence_tolerances(kwargs)
+
+        # containers for histories tracked during optimization
+        train_cost_history = []
+        valid_cost_history = []
+        train_count_history = []
+        valid_count_history = []
+        classifier = (
+            self.cost_name == "softmax"
+            or self.cost_name == "perceptron"
+            or self.cost_name == "multiclass_softmax"
+            or self.cost_name == "multiclass_perceptron"
+        )
+        validate = len(self.valid_inds) > 0
+        best_valid_cost = np.inf
+        num_unimproved = 0
+
+        # record training / validation histories on each weight as the optimizer produces it,
+        # reusing the training cost computed alongside a full batch gradient when available
+        def track_histories(w, cost_eval):
+            nonlocal best_valid_cost, num_unimproved
+            k = len(train_cost_history)
+            if cost_eval is None:
+                cost_eval = self.cost(w, np.arange(np.size(self.y_train)))
+            else:
+                # costs evaluated on flattened weights come back as length-one arrays
+                cost_eval = np.ravel(cost_eval)[0]
+            train_cost_history.append(cost_eval)
+            if classifier:
+                train_count_history.append(self.counter(w))
+            if not validate:
+                return
+
+            # in between validation evaluations carry the last value forward
+            if k % valid_stride == 0:
+                valid_cost_history.append(self.valid_cost(w, np.arange(np.size(self.y_valid))))
+                if classifier:
+                    valid_count_history.append(self.valid_counter(w))
+
+                # early stopping - tell the optimizer to stop once patience validation evaluations
+                # have passed without improving on the best validation cost so far
+                if patience is not None:
+                    if valid_cost_history[-1] < best_valid_cost:
+                        best_valid_cost = valid_cost_history[-1]
+                        num_unimproved = 0
+                    else:
+                        num_unimproved += 1
+                    if num_unimproved >= patience:
+                        return "patience"
+            else:
+                valid_cost_history.append(valid_cost_history[-1])
+                if classifier:
+                    valid_count_history.append(valid_count_history[-1])
+
+        # adaptive first order methods - momentum, nesterov, adagrad, RMSprop and adam - with
+        # their parameters (beta, gamma, beta_1, beta_2, eps) passed through
+        adaptive_kwargs = {}
+        for key in ["beta", "gamma", "beta_1", "beta_2", "eps"]:
+            if key in kwargs:
+                adaptive_kwargs[key] = kwargs[key]
+        adaptive = optimizer == "momentum" or optimizer == "nesterov" or optimizer == "adagrad" or optimizer == "RMSprop" or optimizer == "adam"
+
         # optimize
         weight_history = []
 
         # run gradient descent
         if optimizer == "gradient_descent":
-            weight_history = optimizers.gradient_descent(self.cost, self.alpha_choice, self.max_its, self.w_init, self.num_pts, self.batch_size)
-
-        if optimizer == "RMSprop":
-            weight_history = optimizers.RMSprop(self.cost, self.alpha_choice, self.max_its, self.w_init, self.num_pts, self.batch_size)
+            weight_history = optimizers.gradient_descent(
+                self.cost,
+                self.alpha_choice,
+                self.max_its,
+                self.w_init,
+                self.num_pts,
+                self.batch_size,
+                history_file=history_file,
+                callback=track_histories,
+                **tols,
+            )
+
+        if adaptive:
+            weight_history = adaptive_optimizers.descent(
+                self.cost,
+                optimizer,
+                self.alpha_choice,
+                self.max_its,
+                self.w_init,
+                self.num_pts,
+                self.batch_size,
+                history_file=history_file,
+                callback=track_histories,
+                **tols,
+                **adaptive_kwargs,
+            )
+
+        # variance-reduced stochastic methods for convex costs
+        if optimizer == "SVRG" or optimizer == "SAGA":
+            variance_reduced = optimizers.SVRG
+            if optimizer == "SAGA":
+                variance_reduced = optimizers.SAGA
+            weight_history = variance_reduced(
+                self.cost,
+                self.alpha_choice,
+                self.max_its,
+                self.w_init,
+                self.num_pts,
+                self.batch_size,
+                history_file=history_file,
+                callback=track_histories,
+                **tols,
+            )
 
         # run gradient descent
         if optimizer == "newtons_method":
             epsilon = 10 ** (-10)
             if "epsilon" in kwargs:
                 epsilon = kwargs["epsilon"]
-            weight_history = optimizers.newtons_method(self.cost, epsilon, self.max_its, self.w_init, self.num_pts, self.batch_size)
 
-        # compute training history
-        train_cost_history = [self.cost(v, np.arange(np.size(self.y_train))) for v in weight_history]
+            # hessian-free newton settings
+            hessian_free = False
+            if "hessian_free" in kwargs:
+                hessian_free = kwargs["hessian_free"]
+            cg_max_its = 20
+            if "cg_max_its" in kwargs:
+                cg_max_its = kwargs["cg_max_its"]
+            weight_history = optimizers.newtons_method(
+                self.cost,
+                epsilon,
+                self.max_its,
+                self.w_init,
+                self.num_pts,
+                self.batch_size,
+                hessian_free=hessian_free,
+                cg_max_its=cg_max_its,
+                history_file=history_file,
+                callback=track_histories,
+                **tols,
+            )
 
         # store all new histories
         self.weight_histories.append(weight_history)
         self.train_cost_histories.append(train_cost_history)
-
-        # compute validation history
-        if len(self.valid_inds) > 0:
-            valid_cost_history = [self.valid_cost(v, np.arange(np.size(self.y_valid))) for v in weight_history]
+        if validate:
             self.valid_cost_histories.append(valid_cost_history)
 
-        # if classification produce count history
-        if (
-            self.cost_name == "softmax"
-            or self.cost_name == "perceptron"
-            or self.cost_name == "multiclass_softmax"
-            or self.cost_name == "multiclass_perceptron"
-        ):
-            train_count_history = [self.counter(v) for v in weight_history]
+        # if classification store count history
+        if classifier:
             self.train_count_histories.append(train_count_history)
-
-            if len(self.valid_inds) > 0:
-                valid_count_history = [self.valid_counter(v) for v in weight_history]
+            if validate:
                 self.valid_count_histories.append(valid_count_history)
 
     #### plot histories ###
@@ -0,0 +1,59 @@
+import autograd.numpy as np
+
+
+class WeightHistory:
+    """
+    A drop-in replacement for a list of weights recorded during optimization.  Weights are
+    stored flattened in one preallocated (number of steps) x (number of weights) array -
+    optionally a memory-mapped file - and are only unflattened when requested.
+    """
+
+    def __init__(self, unflatten, num_steps, num_params, **kwargs):
+        # function for re-shaping a flat weight vector into its original form
+        self.unflatten = unflatten
+
+        # memory-map the history to a file?
+        filename = None
+        if "filename" in kwargs:
+            filename = kwargs["filename"]
+
+        # preallocate storage for all flattened weights
+        if filename is None:
+            self.flat_weights = np.zeros((num_steps, num_params))
+        else:
+            self.flat_weights = np.memmap(filename, dtype="float64", mode="w+", shape=(num_steps, num_params))
+
+        # number of weights recorded thus far
+        self.num_recorded = 0
+
+        # why and at which iteration the optimizer stopped early - set by stop(), and left as
+        # "max_its" / None when all iterations are run
+        self.stop_reason = "max_its"
+        self.stop_iteration = None
+
+    # record an early stop - reason is e.g., "grad_tol", "cost_tol", "step_tol" or "patience"
+    def stop(self, reason, iteration):
+        self.stop_reason = reason
+        self.stop_iteration = iteration
+
+    # record a flat weight vector
+    def append(self, w):
+        self.flat_weights[self.num_recorded] = np.ravel(w)
+        self.num_recorded += 1
+
+    # view of all recorded flat weights - one row per step - for bulk evaluation
+    def weights(self):
+        return self.flat_weights[: self.num_recorded]
+
+    def __len__(self):
+        return self.num_recorded
+
+    # unflatten weights on demand, supporting both integer and slice indexing
+    def __getitem__(self, ind):
+        if isinstance(ind, slice):
+            return [self.unflatten(np.array(w)) for w in self.weights()[ind]]
+        return self.unflatten(np.array(self.weights()[ind]))
+
+    def __iter__(self):
+        for k in range(self.num_recorded):
+            yield self[k]
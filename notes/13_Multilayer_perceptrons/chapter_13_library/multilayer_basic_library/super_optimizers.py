@@ -13,6 +13,16 @@ def gradient_descent(g, w, x_train, y_train, x_val, y_val, alpha, max_its, batch
     if "verbose" in kwargs:
         verbose = kwargs["verbose"]
 
+    # evaluate validation cost every val_stride steps only?
+    val_stride = 1
+    if "val_stride" in kwargs:
+        val_stride = kwargs["val_stride"]
+
+    # metric callback - called once on each recorded weight
+    callback = None
+    if "callback" in kwargs:
+        callback = kwargs["callback"]
+
     # flatten the input function, create gradient based on flat function
     g_flat, unflatten, w = flatten_func(g, w)
     grad = value_and_grad(g_flat)
@@ -21,11 +31,32 @@ def gradient_descent(g, w, x_train, y_train, x_val, y_val, alpha, max_its, batch
     num_train = y_train.size
     num_val = y_val.size
     w_hist = [unflatten(w)]
-    train_hist = [g_flat(w, x_train, y_train, np.arange(num_train))]
+    train_hist = []
     val_hist = [g_flat(w, x_val, y_val, np.arange(num_val))]
+    if callback is not None:
+        callback(w_hist[-1])
 
-    # how many mini-batches equal the entire dataset?
+    # how many mini-batches equal the entire dataset?  a single full batch evaluates
+    # the training cost at the most recently recorded weights for free
     num_batches = int(np.ceil(np.divide(num_train, batch_size)))
+    full_batch = num_batches == 1
+    if not full_batch:
+        train_hist.append(g_flat(w, x_train, y_train, np.arange(num_train)))
+
+    # progress line for step k, printed once the training cost of its weights is known - for a
+    # full batch, only with the next gradient evaluation
+    def report(k, elapsed):
+        if verbose == True:
+            print(
+                "step "
+                + str(k)
+                + " done in "
+                + str(np.round(elapsed, 1))
+                + " secs, train cost = "
+                + str(np.round(train_hist[-1][0], 4))
+                + ", val cost = "
+                + str(np.round(val_hist[-1][0], 4))
+            )
 
     # over the line
     for k in range(max_its):
@@ -39,32 +70,39 @@ def gradient_descent(g, w, x_train, y_train, x_val, y_val, alpha, max_its, batch
             # plug in value into func and derivative
             cost_eval, grad_eval = grad(w, x_train, y_train, batch_inds)
             grad_eval.shape = np.shape(w)
+            if full_batch:
+                train_hist.append(cost_eval)
+                if k > 0:
+                    report(k, elapsed)
 
             # take descent step with momentum
             w = w - alpha * grad_eval
 
-        end = timer()
+        elapsed = timer() - start
+
+        # update training cost - for a full batch this happens on the next step
+        if not full_batch:
+            train_cost = g_flat(w, x_train, y_train, np.arange(num_train))
+            train_hist.append(train_cost)
 
-        # update training and validation cost
-        train_cost = g_flat(w, x_train, y_train, np.arange(num_train))
-        val_cost = g_flat(w, x_val, y_val, np.arange(num_val))
+        # update validation cost - in between evaluations carry the last value forward
+        val_cost = val_hist[-1]
+        if (k + 1) % val_stride == 0:
+            val_cost = g_flat(w, x_val, y_val, np.arange(num_val))
 
-        # record weight update, train and val costs
+        # record weight update and val cost
         w_hist.append(unflatten(w))
-        train_hist.append(train_cost)
         val_hist.append(val_cost)
+        if callback is not None:
+            callback(w_hist[-1])
+        if not full_batch:
+            report(k + 1, elapsed)
 
-        if verbose == True:
-            print(
-                "step "
-                + str(k + 1)
-                + " done in "
-                + str(np.round(end - start, 1))
-                + " secs, train cost = "
-                + str(np.round(train_hist[-1][0], 4))
-                + ", val cost = "
-                + str(np.round(val_hist[-1][0], 4))
-            )
+    # final weights have not been evaluated by a full batch gradient
+    if full_batch:
+        train_hist.append(g_flat(w, x_train, y_train, np.arange(num_train)))
+        if max_its > 0:
+            report(max_its, elapsed)
 
     if verbose == True:
         print("finished all " + str(max_its) + " steps")
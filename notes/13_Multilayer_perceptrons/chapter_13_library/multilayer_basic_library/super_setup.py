@@ -154,6 +154,36 @@ class Setup:
         if "verbose" in kwargs:
             verbose = kwargs["verbose"]
 
+        # evaluate validation cost / accuracy every val_stride steps only?
+        val_stride = 1
+        if "val_stride" in kwargs:
+            val_stride = kwargs["val_stride"]
+
+        # containers for accuracy histories tracked during optimization
+        train_accuracy_history = []
+        val_accuracy_history = []
+        classifier = (
+            self.cost_name == "softmax"
+            or self.cost_name == "perceptron"
+            or self.cost_name == "multiclass_softmax"
+            or self.cost_name == "multiclass_perceptron"
+        )
+
+        # record accuracies on each weight as the optimizer produces it
+        def track_accuracies(w):
+            k = len(train_accuracy_history)
+            train_accuracy_history.append(1 - self.counter(w, self.x_train, self.y_train) / float(self.y_train.size))
+
+            # in between validation evaluations carry the last value forward
+            if k % val_stride == 0:
+                val_accuracy_history.append(1 - self.counter(w, self.x_val, self.y_val) / float(self.y_val.size))
+            else:
+                val_accuracy_history.append(val_accuracy_history[-1])
+
+        callback = None
+        if classifier:
+            callback = track_accuracies
+
         # optimize
         weight_history = []
         cost_history = []
@@ -170,6 +200,8 @@ class Setup:
             self.max_its,
             self.batch_size,
             verbose=verbose,
+            val_stride=val_stride,
+            callback=callback,
         )
 
         # store all new histories
@@ -177,17 +209,8 @@ class Setup:
         self.train_cost_histories.append(train_cost_history)
         self.val_cost_histories.append(val_cost_history)
 
-        # if classification produce count history
-        if (
-            self.cost_name == "softmax"
-            or self.cost_name == "perceptron"
-            or self.cost_name == "multiclass_softmax"
-            or self.cost_name == "multiclass_perceptron"
-        ):
-            train_accuracy_history = [1 - self.counter(v, self.x_train, self.y_train) / float(self.y_train.size) for v in weight_history]
-            val_accuracy_history = [1 - self.counter(v, self.x_val, self.y_val) / float(self.y_val.size) for v in weight_history]
-
-            # store count history
+        # if classification store accuracy history
+        if classifier:
             self.train_accuracy_histories.append(train_accuracy_history)
             self.val_accuracy_histories.append(val_accuracy_history)
 
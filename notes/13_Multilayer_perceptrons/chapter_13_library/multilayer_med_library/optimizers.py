@@ -1,59 +1,47 @@
 import autograd.numpy as np
 from autograd import value_and_grad
 from autograd import hessian
+from autograd import grad as compute_grad
+from autograd import make_jvp
 from autograd.misc.flatten import flatten_func
 
 
-# minibatch gradient descent
-def RMSprop(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
-    # rmsprop params
-    gamma = 0.9
-    eps = 10**-8
-    if "gamma" in kwargs:
-        gamma = kwargs["gamma"]
-    if "eps" in kwargs:
-        eps = kwargs["eps"]
-
-    # flatten the input function, create gradient based on flat function
-    g_flat, unflatten, w = flatten_func(g, w)
-    grad = value_and_grad(g_flat)
-
-    # initialize average gradient
-    avg_sq_grad = np.ones(np.size(w))
-
-    # record history
-    w_hist = [unflatten(w)]
-    train_hist = [g_flat(w, np.arange(num_pts))]
-
-    # how many mini-batches equal the entire dataset?
-    num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
-
-    # over the line
-    for k in range(max_its):
-        # loop over each minibatch
-        train_cost = 0
-        for b in range(num_batches):
-            # collect indices of current mini-batch
-            batch_inds = np.arange(b * batch_size, min((b + 1) * batch_size, num_pts))
-
-            # plug in value into func and derivative
-            cost_eval, grad_eval = grad(w, batch_inds)
-            grad_eval.shape = np.shape(w)
-
-            # update exponential average of past gradients
-            avg_sq_grad = gamma * avg_sq_grad + (1 - gamma) * grad_eval**2
-
-            # take descent step
-            w = w - alpha * grad_eval / (avg_sq_grad ** (0.5) + eps)
-
-        # update training and validation cost
-        train_cost = g_flat(w, np.arange(num_pts))
-
-        # record weight update, train and val costs
-        w_hist.append(unflatten(w))
-        train_hist.append(train_cost)
-
-    return w_hist, train_hist
+# truncated conjugate gradient solve of the linear system A d = b, where A is only
+# available through matrix-vector products A_prod(v) - stops early once the residual
+# is small or a direction of non-positive curvature is found
+def conjugate_gradient(A_prod, b, max_its, **kwargs):
+    # relative residual tolerance
+    tol = 10 ** (-10)
+    if "tol" in kwargs:
+        tol = kwargs["tol"]
+
+    # initialize solution, residual, and search direction
+    d = np.zeros(np.shape(b))
+    r = b
+    p = r
+    r_sq = np.dot(r, r)
+    b_norm = np.sqrt(r_sq)
+
+    for i in range(max_its):
+        if np.sqrt(r_sq) <= tol * b_norm:
+            break
+
+        # non-positive curvature - fall back to steepest descent on the first pass
+        Ap = A_prod(p)
+        curvature = np.dot(p, Ap)
+        if curvature <= 0:
+            if i == 0:
+                d = b
+            break
+
+        # take step along conjugate direction, update residual and direction
+        step = r_sq / curvature
+        d = d + step * p
+        r = r - step * Ap
+        r_sq_new = np.dot(r, r)
+        p = r + (r_sq_new / r_sq) * p
+        r_sq = r_sq_new
+    return d
 
 
 # minibatch gradient descent
@@ -103,6 +91,18 @@ def newtons_method(g, max_its, w, num_pts, batch_size, **kwargs):
     if "epsilon" in kwargs:
         epsilon = kwargs["epsilon"]
 
+    # solve each Newton system by truncated conjugate gradient using only Hessian-vector
+    # products - never forming the Hessian - with at most cg_max_its inner iterations?
+    hessian_free = False
+    if "hessian_free" in kwargs:
+        hessian_free = kwargs["hessian_free"]
+    cg_max_its = 20
+    if "cg_max_its" in kwargs:
+        cg_max_its = kwargs["cg_max_its"]
+
+    # Hessian-vector products computed forward-over-reverse
+    hess_vec = make_jvp(compute_grad(g_flat))
+
     # record history
     w_hist = []
     w_hist.append(unflatten(w))
@@ -121,25 +121,31 @@ def newtons_method(g, max_its, w, num_pts, batch_size, **kwargs):
             # evaluate the gradient, store current weights and cost function value
             cost_eval, grad_eval = gradient(w, batch_inds)
 
-            # evaluate the hessian
-            hess_eval = hess(w, batch_inds)
-
-            # reshape for numpy linalg functionality
-            hess_eval.shape = (int((np.size(hess_eval)) ** (0.5)), int((np.size(hess_eval)) ** (0.5)))
-
-            """
-            # compute minimum eigenvalue of hessian matrix 
-            eigs, vecs = np.linalg.eig(hess_eval)
-            smallest_eig = np.min(eigs)
-            adjust = 0
-            if smallest_eig < 0:
-                adjust = np.abs(smallest_eig)
-            """
-
-            # solve second order system system for weight update
-            A = hess_eval + (epsilon) * np.eye(np.size(w))
-            b = grad_eval
-            w = np.linalg.lstsq(A, np.dot(A, w) - b)[0]
+            # hessian-free - solve regularized second order system with conjugate gradient
+            if hessian_free == True:
+                hess_vec_eval = hess_vec(w, batch_inds)
+                A_prod = lambda v: hess_vec_eval(v)[1] + epsilon * v
+                w = w + conjugate_gradient(A_prod, -grad_eval, cg_max_its)
+            else:
+                # evaluate the hessian
+                hess_eval = hess(w, batch_inds)
+
+                # reshape for numpy linalg functionality
+                hess_eval.shape = (int((np.size(hess_eval)) ** (0.5)), int((np.size(hess_eval)) ** (0.5)))
+
+                """
+                # compute minimum eigenvalue of hessian matrix 
+                eigs, vecs = np.linalg.eig(hess_eval)
+                smallest_eig = np.min(eigs)
+                adjust = 0
+                if smallest_eig < 0:
+                    adjust = np.abs(smallest_eig)
+                """
+
+                # solve second order system system for weight update
+                A = hess_eval + (epsilon) * np.eye(np.size(w))
+                b = grad_eval
+                w = np.linalg.lstsq(A, np.dot(A, w) - b)[0]
 
             # w = w - np.dot(np.linalg.pinv(hess_eval + epsilon*np.eye(np.size(w))),grad_eval)
 
@@ -26,10 +26,12 @@ class Setup:
         self.training_architecture = self.compute_general_network_features
         self.initializer = self.initialize_general_network_weights
         self.testing_architecture = self.compute_network_features_testing
+        self.folded_architecture = self.compute_folded_network_features
         if self.activation_name == "maxout":
             self.training_architecture = self.compute_maxout_network_features
             self.initializer = self.initialize_maxout_network_weights
             self.testing_architecture = self.compute_maxout_network_features_testing
+            self.folded_architecture = self.compute_folded_maxout_network_features
 
     # our normalization function
     def normalize(self, data, data_mean, data_std):
@@ -38,14 +40,14 @@ class Setup:
 
     ########## architectures ##########
     def compute_general_network_features(self, x, inner_weights):
-        # pad data with ones to deal with bias
-        o = np.ones((np.shape(x)[0], 1))
-        a_padded = np.concatenate((o, x), axis=1)
+        # the first row of each weight matrix holds the biases, so activations are only
+        # padded with ones once, for the final linear combination
+        a = x
 
         # loop through weights and update each layer of the network
         for W in inner_weights:
             # output of layer activation
-            a = self.activation(np.dot(a_padded, W))
+            a = self.activation(W[0] + np.dot(a, W[1:]))
 
             ### normalize output of activation
             # compute the mean and standard deviation of the activation output distributions
@@ -53,23 +55,22 @@ class Setup:
             a_stds = np.std(a, axis=0)
 
             # normalize the activation outputs
-            a_normed = self.normalize(a, a_means, a_stds)
-
-            # pad with ones for bias
-            o = np.ones((np.shape(a_normed)[0], 1))
-            a_padded = np.concatenate((o, a_normed), axis=1)
+            a = self.normalize(a, a_means, a_stds)
 
+        # pad with ones for bias
+        o = np.ones((np.shape(a)[0], 1))
+        a_padded = np.concatenate((o, a), axis=1)
         return a_padded
 
     def compute_maxout_network_features(self, x, inner_weights):
-        # pad data with ones to deal with bias
-        o = np.ones((np.shape(x)[0], 1))
-        a_padded = np.concatenate((o, x), axis=1)
+        # the first row of each weight matrix holds the biases, so activations are only
+        # padded with ones once, for the final linear combination
+        a = x
 
         # loop through weights and update each layer of the network
         for W1, W2 in inner_weights:
             # output of layer activation
-            a = self.activation(np.dot(a_padded, W1), np.dot(a_padded, W2))
+            a = self.activation(W1[0] + np.dot(a, W1[1:]), W2[0] + np.dot(a, W2[1:]))
 
             ### normalize output of activation
             # compute the mean and standard deviation of the activation output distributions
@@ -77,12 +78,11 @@ class Setup:
             a_stds = np.std(a, axis=0)
 
             # normalize the activation outputs
-            a_normed = self.normalize(a, a_means, a_stds)
-
-            # pad with ones for bias
-            o = np.ones((np.shape(a_normed)[0], 1))
-            a_padded = np.concatenate((o, a_normed), axis=1)
+            a = self.normalize(a, a_means, a_stds)
 
+        # pad with ones for bias
+        o = np.ones((np.shape(a)[0], 1))
+        a_padded = np.concatenate((o, a), axis=1)
         return a_padded
 
     ########## test versions of the architecture to extract stats ##########
@@ -96,15 +96,15 @@ class Setup:
         if np.size(stats) == 0:
             switch = "training"
 
-        # pad data with ones to deal with bias
-        o = np.ones((np.shape(x)[0], 1))
-        a_padded = np.concatenate((o, x), axis=1)
+        # the first row of each weight matrix holds the biases, so activations are only
+        # padded with ones once, for the final linear combination
+        a = x
 
         # loop through weights and update each layer of the network
         c = 0
         for W in inner_weights:
             # output of layer activation
-            a = self.activation(np.dot(a_padded, W))
+            a = self.activation(W[0] + np.dot(a, W[1:]))
 
             ### normalize output of activation
             a_means = 0
@@ -119,13 +119,12 @@ class Setup:
                 a_stds = stats[c][1]
 
             # normalize the activation outputs
-            a_normed = self.normalize(a, a_means, a_stds)
-
-            # pad with ones for bias
-            o = np.ones((np.shape(a_normed)[0], 1))
-            a_padded = np.concatenate((o, a_normed), axis=1)
+            a = self.normalize(a, a_means, a_stds)
             c += 1
 
+        # pad with ones for bias
+        o = np.ones((np.shape(a)[0], 1))
+        a_padded = np.concatenate((o, a), axis=1)
         return a_padded, stats
 
     def compute_maxout_network_features_testing(self, x, inner_weights, stats):
@@ -138,15 +137,15 @@ class Setup:
         if np.size(stats) == 0:
             switch = "training"
 
-        # pad data with ones to deal with bias
-        o = np.ones((np.shape(x)[0], 1))
-        a_padded = np.concatenate((o, x), axis=1)
+        # the first row of each weight matrix holds the biases, so activations are only
+        # padded with ones once, for the final linear combination
+        a = x
 
         # loop through weights and update each layer of the network
         c = 0
         for W1, W2 in inner_weights:
             # output of layer activation
-            a = self.activation(np.dot(a_padded, W1), np.dot(a_padded, W2))
+            a = self.activation(W1[0] + np.dot(a, W1[1:]), W2[0] + np.dot(a, W2[1:]))
 
             ### normalize output of activation
             a_means = 0
@@ -161,15 +160,57 @@ class Setup:
                 a_stds = stats[c][1]
 
             # normalize the activation outputs
-            a_normed = self.normalize(a, a_means, a_stds)
-
-            # pad with ones for bias
-            o = np.ones((np.shape(a_normed)[0], 1))
-            a_padded = np.concatenate((o, a_normed), axis=1)
+            a = self.normalize(a, a_means, a_stds)
             c += 1
 
+        # pad with ones for bias
+        o = np.ones((np.shape(a)[0], 1))
+        a_padded = np.concatenate((o, a), axis=1)
         return a_padded, stats
 
+    ########## folded versions of the architecture for fast evaluation ##########
+    def fold_normalization(self, inner_weights, w_final, stats):
+        """
+        Normalizing a layer's outputs by fixed statistics - as in the testing architecture - is a linear map,
+        so it can be absorbed into the biases and weights of the next layer (the final linear combination
+        included).  Returns the folded inner weights and final weights, for use with the folded architecture.
+        """
+
+        # fold the normalization (a - a_means)/(a_stds + 10^-5) into the weight matrix W of the following layer
+        def fold(W, a_means, a_stds):
+            W_lin = W[1:] / (a_stds + 10 ** (-5))[:, np.newaxis]
+            b = W[0] - np.dot(a_means, W_lin)
+            return np.vstack((b, W_lin))
+
+        # the input layer receives unnormalized data, so its weights are left as they are
+        folded_weights = []
+        for c, W in enumerate(inner_weights):
+            if c > 0:
+                a_means, a_stds = stats[c - 1]
+                if self.activation_name == "maxout":
+                    W = [fold(V, a_means, a_stds) for V in W]
+                else:
+                    W = fold(W, a_means, a_stds)
+            folded_weights.append(W)
+        if len(inner_weights) > 0:
+            a_means, a_stds = stats[-1]
+            w_final = fold(w_final, a_means, a_stds)
+        return folded_weights, w_final
+
+    def compute_folded_network_features(self, x, folded_weights):
+        # normalization is folded into the weights, so each layer is a plain linear combination and activation
+        a = x
+        for W in folded_weights:
+            a = self.activation(W[0] + np.dot(a, W[1:]))
+        return a
+
+    def compute_folded_maxout_network_features(self, x, folded_weights):
+        # normalization is folded into the weights, so each layer is a plain linear combination and activation
+        a = x
+        for W1, W2 in folded_weights:
+            a = self.activation(W1[0] + np.dot(a, W1[1:]), W2[0] + np.dot(a, W2[1:]))
+        return a
+
     ########## weight initializers ##########
     # create initial weights for arbitrary feedforward network
     def initialize_general_network_weights(self, layer_sizes, scale):
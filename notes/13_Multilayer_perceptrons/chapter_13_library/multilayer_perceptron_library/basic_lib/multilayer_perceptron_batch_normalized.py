@@ -165,15 +165,12 @@ class Setup:
         # loop through each layer matrix
         c = 0
         for W in w:
-            #  pad with ones (to compactly take care of bias) for next layer computation
-            o = np.ones((1, np.shape(a)[1]))
-            a = np.vstack((o, a))
-
-            # compute linear combination of current layer units
-            a = np.dot(a.T, W).T
+            # compute linear combination of current layer units - the first row of W
+            # holds the biases, so no row of ones need be padded onto the input
+            a = W[0] + np.dot(a.T, W[1:])
 
             # pass through activation
-            a = self.activation(a)
+            a = self.activation(a).T
 
             # get normalizer for this layer tuned to training data
             normalizer = self.normalizers[c]
@@ -188,16 +185,13 @@ class Setup:
         # loop through each layer matrix
         c = 0
         for W1, W2 in w:
-            #  pad with ones (to compactly take care of bias) for next layer computation
-            o = np.ones((1, np.shape(a)[1]))
-            a = np.vstack((o, a))
-
-            # compute linear combination of current layer units
-            a1 = np.dot(a.T, W1).T
-            a2 = np.dot(a.T, W2).T
+            # compute linear combination of current layer units - the first rows of W1 / W2
+            # hold the biases, so no row of ones need be padded onto the input
+            a1 = W1[0] + np.dot(a.T, W1[1:])
+            a2 = W2[0] + np.dot(a.T, W2[1:])
 
             # pass through activation
-            a = self.activation(a1, a2)
+            a = self.activation(a1, a2).T
 
             # get normalizer for this layer tuned to training data
             normalizer = self.normalizers[c]
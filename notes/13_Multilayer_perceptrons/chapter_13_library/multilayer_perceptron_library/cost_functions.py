@@ -25,25 +25,35 @@ class Setup:
         if cost_name == "multiclass_counter":
             self.cost = self.multiclass_counter
 
+    # points of the mini-batch indexed by iter - all points when iter is None
+    def batch(self, iter):
+        if iter is None:
+            return self.x, self.y
+        return self.x[iter], self.y[iter]
+
     ########## cost functions ##########
     # least squares cost
-    def least_squares(self, w):
-        cost = np.sum((self.predict(self.x, w) - self.y) ** 2)
+    def least_squares(self, w, iter=None):
+        x_p, y_p = self.batch(iter)
+        cost = np.sum((self.predict(x_p, w) - y_p) ** 2)
         return cost
 
     # two-class softmax / logistic regression cost
-    def twoclass_softmax(self, w):
-        cost = np.sum(np.log(1 + np.exp((-self.y) * (self.predict(self.x, w)))))
+    def twoclass_softmax(self, w, iter=None):
+        x_p, y_p = self.batch(iter)
+        cost = np.sum(np.log(1 + np.exp((-y_p) * (self.predict(x_p, w)))))
         return cost
 
     # multiclass softmaax regularized by the summed length of all normal vectors
-    def multiclass_softmax(self, W):
+    def multiclass_softmax(self, W, iter=None):
+        x_p, y_p = self.batch(iter)
+
         # pre-compute predictions on all points
-        all_evals = self.predict(self.x, W)
+        all_evals = self.predict(x_p, W)
 
         # compute cost in compact form using numpy broadcasting
         a = np.log(np.sum(np.exp(all_evals), axis=1))
-        b = all_evals[np.arange(len(self.y)), self.y]
+        b = all_evals[np.arange(len(y_p)), y_p]
         cost = np.sum(a - b)
         return cost
 
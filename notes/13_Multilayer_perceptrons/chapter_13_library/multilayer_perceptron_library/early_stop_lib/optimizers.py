@@ -55,52 +55,6 @@ def gradient_descent(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
     return w_hist
 
 
-# RMSprop advanced first order optimizer
-def RMSprop(g, alpha, max_its, w, num_pts, batch_size, **kwargs):
-    # rmsprop params
-    gamma = 0.9
-    eps = 10**-8
-    if "gamma" in kwargs:
-        gamma = kwargs["gamma"]
-    if "eps" in kwargs:
-        eps = kwargs["eps"]
-
-    # flatten the input function, create gradient based on flat function
-    g_flat, unflatten, w = flatten_func(g, w)
-    grad = value_and_grad(g_flat)
-
-    # initialize average gradient
-    avg_sq_grad = np.ones(np.size(w))
-
-    # record history
-    w_hist = [unflatten(w)]
-
-    # how many mini-batches equal the entire dataset?
-    num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
-
-    # over the line
-    for k in range(max_its):
-        # loop over each minibatch
-        for b in range(num_batches):
-            # collect indices of current mini-batch
-            batch_inds = np.arange(b * batch_size, min((b + 1) * batch_size, num_pts))
-
-            # plug in value into func and derivative
-            cost_eval, grad_eval = grad(w, batch_inds)
-            grad_eval.shape = np.shape(w)
-
-            # update exponential average of past gradients
-            avg_sq_grad = gamma * avg_sq_grad + (1 - gamma) * grad_eval**2
-
-            # take descent step
-            w = w - alpha * grad_eval / (avg_sq_grad ** (0.5) + eps)
-
-        # record weight update, train and val costs
-        w_hist.append(unflatten(w))
-
-    return w_hist
-
-
 # newtons method function - inputs: g (input function), max_its (maximum number of iterations), w (initialization)
 def newtons_method(g, epsilon, max_its, w, num_pts, batch_size, **kwargs):
     # flatten the input function, create gradient based on flat function
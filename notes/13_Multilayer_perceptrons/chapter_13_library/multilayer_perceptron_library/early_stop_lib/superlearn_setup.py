@@ -1,5 +1,6 @@
 import autograd.numpy as np
 from . import optimizers
+from . import adaptive_optimizers
 from . import cost_functions
 from . import normalizers
 from . import multilayer_perceptron
@@ -133,6 +134,14 @@ class Setup:
         if "batch_size" in kwargs:
             self.batch_size = kwargs["batch_size"]
 
+        # adaptive first order methods - momentum, nesterov, adagrad, RMSprop and adam - with
+        # their parameters (beta, gamma, beta_1, beta_2, eps) passed through
+        adaptive_kwargs = {}
+        for key in ["beta", "gamma", "beta_1", "beta_2", "eps"]:
+            if key in kwargs:
+                adaptive_kwargs[key] = kwargs[key]
+        adaptive = optimizer == "momentum" or optimizer == "nesterov" or optimizer == "adagrad" or optimizer == "RMSprop" or optimizer == "adam"
+
         # optimize
         weight_history = []
 
@@ -140,8 +149,10 @@ class Setup:
         if optimizer == "gradient_descent":
             weight_history = optimizers.gradient_descent(self.cost, self.alpha_choice, self.max_its, self.w_init, self.num_pts, self.batch_size)
 
-        if optimizer == "RMSprop":
-            weight_history = optimizers.RMSprop(self.cost, self.alpha_choice, self.max_its, self.w_init, self.num_pts, self.batch_size)
+        if adaptive:
+            weight_history = adaptive_optimizers.descent(
+                self.cost, optimizer, self.alpha_choice, self.max_its, self.w_init, self.num_pts, self.batch_size, **adaptive_kwargs
+            )
 
         # run gradient descent
         if optimizer == "newtons_method":
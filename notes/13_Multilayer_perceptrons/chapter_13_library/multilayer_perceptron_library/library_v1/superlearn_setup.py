@@ -1,5 +1,6 @@
 import autograd.numpy as np
 from . import optimizers
+from . import adaptive_optimizers
 from . import cost_functions
 from . import normalizers
 from . import multilayer_perceptron
@@ -104,6 +105,14 @@ class Setup:
         if "batch_size" in kwargs:
             self.batch_size = kwargs["batch_size"]
 
+        # adaptive first order methods - momentum, nesterov, adagrad, RMSprop and adam - with
+        # their parameters (beta, gamma, beta_1, beta_2, eps) passed through
+        adaptive_kwargs = {}
+        for key in ["beta", "gamma", "beta_1", "beta_2", "eps"]:
+            if key in kwargs:
+                adaptive_kwargs[key] = kwargs[key]
+        adaptive = optimizer == "momentum" or optimizer == "nesterov" or optimizer == "adagrad" or optimizer == "RMSprop" or optimizer == "adam"
+
         # optimize
         weight_history = []
         cost_history = []
@@ -114,15 +123,25 @@ class Setup:
                 self.cost, self.alpha_choice, self.max_its, self.w_init, self.num_pts, self.batch_size
             )
 
-        if optimizer == "RMSprop":
-            weight_history, cost_history = optimizers.RMSprop(self.cost, self.alpha_choice, self.max_its, self.w_init, self.num_pts, self.batch_size)
+        if adaptive:
+            weight_history, cost_history = adaptive_optimizers.descent(
+                self.cost, optimizer, self.alpha_choice, self.max_its, self.w_init, self.num_pts, self.batch_size, **adaptive_kwargs
+            )
 
         if optimizer == "newtons method":
             epsilon = 10 ** (-7)
             if "epsilon" in kwargs:
                 epsilon = kwargs["epsilon"]
+
+            # hessian-free newton settings
+            hessian_free = False
+            if "hessian_free" in kwargs:
+                hessian_free = kwargs["hessian_free"]
+            cg_max_its = 20
+            if "cg_max_its" in kwargs:
+                cg_max_its = kwargs["cg_max_its"]
             weight_history, cost_history = optimizers.newtons_method(
-                self.cost, self.max_its, self.w_init, self.num_pts, self.batch_size, epsilon=epsilon
+                self.cost, self.max_its, self.w_init, self.num_pts, self.batch_size, epsilon=epsilon, hessian_free=hessian_free, cg_max_its=cg_max_its
             )
 
         # store all new histories
@@ -15,6 +15,7 @@ from matplotlib import gridspec
 
 ##### import network functionality #####
 from . import optimizers
+from . import adaptive_optimizers
 from . import cost_functions
 from . import architectures
 
@@ -121,6 +122,33 @@ class Network:
         if "version" in kwargs:
             self.version = kwargs["version"]
 
+        # optimizer - gradient descent, or one of the adaptive methods momentum, nesterov, adagrad,
+        # RMSprop or adam with their parameters (beta, gamma, beta_1, beta_2, eps) passed through
+        self.optimizer = "gradient_descent"
+        if "optimizer" in kwargs:
+            self.optimizer = kwargs["optimizer"]
+        self.adaptive_kwargs = {}
+        for key in ["beta", "gamma", "beta_1", "beta_2", "eps"]:
+            if key in kwargs:
+                self.adaptive_kwargs[key] = kwargs[key]
+
+        # mini-batch size - full batch by default - and the number of worker processes each batch is
+        # split across, whose gradients are summed (gradient descent only)
+        self.batch_size = None
+        if "batch_size" in kwargs:
+            self.batch_size = kwargs["batch_size"]
+        self.num_workers = 1
+        if "num_workers" in kwargs:
+            self.num_workers = kwargs["num_workers"]
+
+        # only gradient descent has a data-parallel path - refuse extra workers rather than ignore them
+        if self.num_workers > 1 and self.optimizer != "gradient_descent":
+            raise ValueError("num_workers > 1 is only supported with optimizer='gradient_descent', not '" + str(self.optimizer) + "'")
+
+        # convergence tolerances (grad_tol, cost_tol, step_tol) - the run stops early once any one is
+        # met, recording why and when in the weight history's stop_reason / stop_iteration
+        self.tols = optimizers.convergence_tolerances(kwargs)
+
         # create instance of optimizers
         self.opt = optimizers.Setup()
 
@@ -129,15 +157,98 @@ class Network:
         if "verbose" in kwargs:
             verbose = kwargs["verbose"]
 
+        # network statistics cached for the previous weight history, if any, are stale
+        self.stats_cache = {}
+
+        # with mini-batches each iteration is an epoch over a fresh shuffle of the training points - network
+        # normalization statistics are then those of each mini-batch, as the training architecture computes
+        # them on whichever points it is given
+        num_pts = np.shape(self.x_train)[0]
+        batch_size = num_pts
+        if self.batch_size is not None:
+            batch_size = self.batch_size
+
         # run optimizer
-        self.weight_history = self.opt.gradient_descent(
-            self.training_cost, self.w_init, self.alpha, self.max_its, self.beta, self.version, verbose=verbose
-        )
+        if self.optimizer == "gradient_descent":
+            self.weight_history = self.opt.gradient_descent(
+                self.training_cost,
+                self.w_init,
+                self.alpha,
+                self.max_its,
+                self.beta,
+                self.version,
+                verbose=verbose,
+                num_pts=num_pts,
+                batch_size=batch_size,
+                num_workers=self.num_workers,
+                **self.tols
+            )
+        else:
+            self.weight_history = adaptive_optimizers.descent(
+                self.training_cost,
+                self.optimizer,
+                self.alpha,
+                self.max_its,
+                self.w_init,
+                num_pts,
+                batch_size,
+                shuffle=True,
+                **self.adaptive_kwargs,
+                **self.tols
+            )
 
     ####### show cost function plots #######
-    def compute_cost_plots(self):
-        # create instance of cost functions
-        cost_function2 = cost_functions.Setup()
+    # statistics of the training data at each layer of the network, for the weights at index ind of the
+    # weight history - cached per index, since computing them takes a full pass of the training data.
+    # Returns the stats, and the training features of that pass (None if the stats were cached)
+    def history_stats(self, ind):
+        a_padded = None
+        if ind not in self.stats_cache:
+            a_padded, stats = self.architectures.testing_architecture(self.x_train, self.weight_history[ind][0], [])
+            self.stats_cache[ind] = stats
+        return self.stats_cache[ind], a_padded
+
+    # compile a predictor for weights w with the network statistics stats folded into them - equivalent
+    # to predict_testing with train_stats = stats, but with no normalization performed per evaluation
+    def compile_predictor(self, w, stats):
+        folded_weights, w_final = self.architectures.fold_normalization(w[0], w[1], stats)
+
+        def predictor(x):
+            f = self.architectures.folded_architecture(x, folded_weights)
+            vals = w_final[0] + np.dot(f, w_final[1:])
+            return vals
+
+        return predictor
+
+    def compute_cost_plots(self, **kwargs):
+        # evaluate every stride-th weight in the history (the final weight is always included)
+        stride = 1
+        if "stride" in kwargs:
+            stride = kwargs["stride"]
+        num_weights = len(self.weight_history)
+        self.history_inds = list(range(0, num_weights, stride))
+        if self.history_inds[-1] != num_weights - 1:
+            self.history_inds.append(num_weights - 1)
+
+        # cost functions are built once per dataset, and evaluated on the predictions of each
+        # compiled predictor - so that a cost and counter share one pass of the data
+        def value_costs(x, y):
+            costs = []
+            names = [self.cost_name]
+            if self.cost_name == "twoclass_softmax":
+                names.append("twoclass_counter")
+            if self.cost_name == "multiclass_softmax":
+                names.append("multiclass_counter")
+            for name in names:
+                cost_function = cost_functions.Setup()
+                cost_function.choose_cost(name, lambda x, vals: vals, x, y)
+                costs.append(cost_function.cost)
+            return costs
+
+        train_costs = value_costs(self.x_train, self.y_train)
+        test_costs = []
+        if np.size(self.test_data) > 0:
+            test_costs = value_costs(self.x_test, self.y_test)
 
         # loop over weights in history and construct cost function plots for training and testing data
         self.train_cost_history = []
@@ -150,47 +261,37 @@ class Network:
             self.test_count_history = []
 
         # loop over weights and record cost values
-        for w in self.weight_history:
-            # use testing architecture to gather stats on training data network normalization
-            a_padded, self.train_stats = self.architectures.testing_architecture(self.x_train, w[0], [])
+        for ind in self.history_inds:
+            # gather stats on training data network normalization, and fold them into the current weights
+            w = self.weight_history[ind]
+            self.train_stats, a_padded = self.history_stats(ind)
             self.training_stats.append(self.train_stats)
+            predictor = self.compile_predictor(w, self.train_stats)
 
-            # evalaute both training and testing data using testing predictor, which will normalize network
-            # with respect to current weights and training data
-            cost_function2.choose_cost(self.cost_name, self.predict_testing, self.x_train, self.y_train)
-            testing_cost = cost_function2.cost
-            self.train_cost_history.append(testing_cost(w))
+            # evaluate both training and testing data using the folded predictor - unless the training
+            # features were just computed along with the stats
+            if a_padded is not None:
+                vals = np.dot(a_padded, w[1])
+            else:
+                vals = predictor(self.x_train)
+            self.train_cost_history.append(train_costs[0](vals))
 
             # classification?  then record misclassification data too
-            if self.cost_name == "twoclass_softmax":
-                cost_function2.choose_cost("twoclass_counter", self.predict_testing, self.x_train, self.y_train)
-                testing_cost = cost_function2.cost
-                self.train_count_history.append(testing_cost(w))
-            if self.cost_name == "multiclass_softmax":
-                cost_function2.choose_cost("multiclass_counter", self.predict_testing, self.x_train, self.y_train)
-                testing_cost = cost_function2.cost
-                self.train_count_history.append(testing_cost(w))
+            if len(train_costs) > 1:
+                self.train_count_history.append(train_costs[1](vals))
 
             # was test data included?  then compute error on this
-            if np.size(self.test_data) > 0:
-                cost_function2.choose_cost(self.cost_name, self.predict_testing, self.x_test, self.y_test)
-                testing_cost = cost_function2.cost
-                self.test_cost_history.append(testing_cost(w))
-
-                # classification?  then record misclassification data too
-                if self.cost_name == "twoclass_softmax":
-                    cost_function2.choose_cost("twoclass_counter", self.predict_testing, self.x_test, self.y_test)
-                    testing_cost = cost_function2.cost
-                    self.test_count_history.append(testing_cost(w))
-                if self.cost_name == "multiclass_softmax":
-                    cost_function2.choose_cost("multiclass_counter", self.predict_testing, self.x_test, self.y_test)
-                    testing_cost = cost_function2.cost
-                    self.test_count_history.append(testing_cost(w))
-
-            ### if performing classification record number of micclassifications as well ###
+            if len(test_costs) > 0:
+                vals = predictor(self.x_test)
+                self.test_cost_history.append(test_costs[0](vals))
+                if len(test_costs) > 1:
+                    self.test_count_history.append(test_costs[1](vals))
 
     # plot cost function histories
     def plot_histories(self, start):
+        # start is an iteration number - find the first evaluated weight at or after it
+        start = int(np.searchsorted(self.history_inds, start))
+
         ### plot
         # initialize figure
         fig = plt.figure(figsize=(8, 3))
@@ -204,8 +305,8 @@ class Network:
             ax2 = plt.subplot(gs[1])
 
         # now plot each, one per panel
-        ax.plot(np.arange(start, len(self.train_cost_history), 1), self.train_cost_history[start:], linewidth=3 * (0.8) ** (1))
-        ax.plot(np.arange(start, len(self.test_cost_history), 1), self.test_cost_history[start:], linewidth=3 * (0.8) ** (2))
+        ax.plot(self.history_inds[start : len(self.train_cost_history)], self.train_cost_history[start:], linewidth=3 * (0.8) ** (1))
+        ax.plot(self.history_inds[start : len(self.test_cost_history)], self.test_cost_history[start:], linewidth=3 * (0.8) ** (2))
 
         # label up
         ax.set_xlabel("iteration")
@@ -221,8 +322,8 @@ class Network:
         # classification?  then record count history as well
         if self.cost_name == "twoclass_softmax" or self.cost_name == "multiclass_softmax":
             # now plot each, one per panel
-            ax2.plot(np.arange(start, len(self.train_count_history), 1), self.train_count_history[start:], linewidth=3 * (0.8) ** (1))
-            ax2.plot(np.arange(start, len(self.test_count_history), 1), self.test_count_history[start:], linewidth=3 * (0.8) ** (2))
+            ax2.plot(self.history_inds[start : len(self.train_count_history)], self.train_count_history[start:], linewidth=3 * (0.8) ** (1))
+            ax2.plot(self.history_inds[start : len(self.test_count_history)], self.test_count_history[start:], linewidth=3 * (0.8) ** (2))
 
             # label up
             ax2.set_xlabel("iteration")
@@ -3,11 +3,104 @@ from IPython.display import clear_output
 
 # import autograd functionality
 from autograd import grad as compute_grad
+from autograd import value_and_grad
 import autograd.numpy as np
 import math
 import time
 import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from autograd.misc.flatten import flatten_func
+from .weight_history import WeightHistory
+
+
+# convergence tolerances on the gradient norm, relative change in cost and relative step size -
+# read from an optimizer's keyword arguments, each off (0) unless given
+def convergence_tolerances(kwargs):
+    tols = {"grad_tol": 0, "cost_tol": 0, "step_tol": 0}
+    for key in tols:
+        if key in kwargs:
+            tols[key] = kwargs[key]
+    return tols
+
+
+# check for convergence at weights w, reached from the previously recorded weights w_prev, given a full
+# batch gradient at either and the costs at both - any of which may be None when unavailable - returns
+# the name of the tolerance met, or None to keep going
+def check_convergence(tols, w, w_prev, grad_eval, cost_eval, cost_prev):
+    if tols["grad_tol"] > 0 and grad_eval is not None and np.linalg.norm(grad_eval) <= tols["grad_tol"]:
+        return "grad_tol"
+    if tols["cost_tol"] > 0 and cost_eval is not None and cost_prev is not None:
+        if np.abs(cost_prev - cost_eval) <= tols["cost_tol"] * np.abs(cost_prev):
+            return "cost_tol"
+    if tols["step_tol"] > 0 and w_prev is not None and np.linalg.norm(w - w_prev) <= tols["step_tol"] * (1 + np.linalg.norm(w_prev)):
+        return "step_tol"
+    return None
+
+
+# stop check on recorded weights w - the callback (if any) is given a copy of them (optimizers may step
+# w in place) and their cost value first and may return a reason to stop, after which the convergence
+# tolerances are checked.  Returns the reason to stop, or None to keep going
+def check_stop(callback, tols, unflatten, w, w_prev, grad_eval, cost_eval, cost_prev):
+    if callback is not None:
+        stop_reason = callback(unflatten(np.array(w)), cost_eval)
+        if stop_reason is not None:
+            return stop_reason
+    return check_convergence(tols, w, w_prev, grad_eval, cost_eval, cost_prev)
+
+
+# cost / gradient function shared with forked data-parallel workers - inherited rather than pickled per task
+shard_value_and_grad = None
+
+
+# evaluate the shared cost and gradient at flat weights w on the points inds of one shard
+def shard_worker(w, inds):
+    return shard_value_and_grad(w, inds)
+
+
+class ShardedGradient:
+    """
+    Data-parallel cost / gradient evaluation - each batch of points is split into shards, one per forked
+    worker process, whose costs and gradients are summed.  As costs are sums over points this is the
+    cost and gradient of the batch - though a network that normalizes its layers does so by the
+    statistics of each shard.  Shards are evaluated in turn here where fork is unavailable.
+    """
+
+    def __init__(self, value_and_grad, num_pts, num_workers):
+        self.value_and_grad = value_and_grad
+        self.num_pts = num_pts
+        self.num_workers = num_workers
+
+        # workers are forked on demand, while the shared function is set
+        global shard_value_and_grad
+        shard_value_and_grad = value_and_grad
+        self.executor = None
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            self.executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=context)
+
+    # summed cost and gradient at w over the points inds - all points when inds is None
+    def __call__(self, w, inds):
+        if inds is None:
+            inds = np.arange(self.num_pts)
+        shards = [shard for shard in np.array_split(inds, self.num_workers) if np.size(shard) > 0]
+        if self.executor is not None:
+            results = list(self.executor.map(shard_worker, [w] * len(shards), shards))
+        else:
+            results = [self.value_and_grad(w, shard) for shard in shards]
+
+        cost_eval = 0
+        grad_eval = np.zeros(np.shape(w))
+        for shard_cost, shard_grad in results:
+            cost_eval += shard_cost
+            grad_eval += shard_grad
+        return cost_eval, grad_eval
+
+    def close(self):
+        global shard_value_and_grad
+        if self.executor is not None:
+            self.executor.shutdown()
+        shard_value_and_grad = None
 
 
 class Setup:
@@ -16,45 +109,125 @@ class Setup:
     """
 
     ########## optimizer ##########
-    # gradient descent function
+    # gradient descent function - g takes weights and the indices of a mini-batch of points (None for all
+    # points), and is a sum over those points.  With a batch_size smaller than num_pts each iteration is an
+    # epoch of mini-batch steps over a fresh shuffle of the points, and weights are recorded once per epoch
     def gradient_descent(self, g, w, alpha, max_its, beta, version, **kwargs):
         verbose = False
         if "verbose" in kwargs:
             verbose = kwargs["verbose"]
 
+        # mini-batch settings - full batch by default
+        num_pts = None
+        batch_size = None
+        if "num_pts" in kwargs:
+            num_pts = kwargs["num_pts"]
+        if "batch_size" in kwargs:
+            batch_size = kwargs["batch_size"]
+
+        # number of worker processes to split each batch across - 1 evaluates gradients here
+        num_workers = 1
+        if "num_workers" in kwargs:
+            num_workers = kwargs["num_workers"]
+
         # flatten the input function, create gradient based on flat function
         g_flat, unflatten, w = flatten_func(g, w)
         grad = compute_grad(g_flat)
 
-        # record history
-        w_hist = []
-        w_hist.append(unflatten(w))
+        # record history - optionally memory-mapped to a file
+        history_file = None
+        if "history_file" in kwargs:
+            history_file = kwargs["history_file"]
+        w_hist = WeightHistory(unflatten, max_its + 1, np.size(w), filename=history_file)
+        w_hist.append(w)
 
-        # start gradient descent loop
+        # start gradient descent loop - weights are updated in place, so work on a copy
+        # of the initialization, with momentum term and step in preallocated buffers
+        w = np.array(w, dtype=float)
         z = np.zeros((np.shape(w)))  # momentum term
+        step = np.zeros((np.shape(w)))
+
+        # gradient norm / relative step size tolerances - the run stops early once either is met
+        # (0 = off), with the weights before each step (or epoch) kept in a buffer for the latter
+        tols = convergence_tolerances(kwargs)
+        w_prev = None
+        w_start = np.zeros((np.shape(w)))
+
+        # how many mini-batches equal the entire dataset?
+        num_batches = 1
+        if num_pts is not None and batch_size is not None:
+            num_batches = int(np.ceil(np.divide(num_pts, batch_size)))
+        full_batch = num_batches == 1
 
         if verbose == True:
             print("starting optimization...")
 
-        # over the line
-        for k in range(max_its):
-            # plug in value into func and derivative
-            grad_eval = grad(w)
-            grad_eval.shape = np.shape(w)
-
-            ### normalized or unnormalized descent step? ###
-            if version == "normalized":
-                grad_norm = np.linalg.norm(grad_eval)
-                if grad_norm == 0:
-                    grad_norm += 10**-6 * np.sign(2 * np.random.rand(1) - 1)
-                grad_eval /= grad_norm
-
-            # take descent step with momentum
-            z = beta * z + grad_eval
-            w = w - alpha * z
-
-            # record weight update
-            w_hist.append(unflatten(w))
+        # split each batch's gradient across worker processes - always shut down, even if the run is interrupted
+        sharded = None
+        stop_reason = None
+        try:
+            if num_workers > 1:
+                sharded = ShardedGradient(value_and_grad(g_flat), num_pts, num_workers)
+
+            # over the line
+            for k in range(max_its):
+                # shuffle points for this epoch
+                perm = None
+                if not full_batch:
+                    perm = np.random.permutation(num_pts)
+                    np.copyto(w_start, w)
+                    w_prev = w_start
+
+                # loop over each minibatch
+                for b in range(num_batches):
+                    batch_inds = None
+                    if not full_batch:
+                        batch_inds = perm[b * batch_size : min((b + 1) * batch_size, num_pts)]
+
+                    # plug in value into func and derivative
+                    if sharded is not None:
+                        grad_eval = sharded(w, batch_inds)[1]
+                    else:
+                        grad_eval = grad(w, batch_inds)
+                        grad_eval.shape = np.shape(w)
+
+                    # stop here, before stepping, if the current weights have converged
+                    if full_batch:
+                        stop_reason = check_convergence(tols, w, w_prev, grad_eval, None, None)
+                        if stop_reason is not None:
+                            break
+
+                    ### normalized or unnormalized descent step? ###
+                    if version == "normalized":
+                        grad_norm = np.linalg.norm(grad_eval)
+                        if grad_norm == 0:
+                            grad_norm += 10**-6 * np.sign(2 * np.random.rand(1) - 1)
+                        grad_eval /= grad_norm
+
+                    # take descent step with momentum: z = beta*z + grad, w = w - alpha*z
+                    if full_batch:
+                        np.copyto(w_start, w)
+                        w_prev = w_start
+                    np.multiply(z, beta, out=z)
+                    np.add(z, grad_eval, out=z)
+                    np.multiply(z, alpha, out=step)
+                    np.subtract(w, step, out=w)
+                if stop_reason is not None:
+                    w_hist.stop(stop_reason, k)
+                    break
+
+                # record weight update
+                w_hist.append(w)
+
+                # mini-batch gradients say little about convergence, so only the step over the epoch is checked
+                if not full_batch:
+                    stop_reason = check_convergence(tols, w, w_prev, None, None, None)
+                    if stop_reason is not None:
+                        w_hist.stop(stop_reason, k + 1)
+                        break
+        finally:
+            if sharded is not None:
+                sharded.close()
 
         if verbose == True:
             print("...optimization complete!")
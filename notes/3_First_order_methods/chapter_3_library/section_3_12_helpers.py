@@ -25,6 +25,9 @@ class convservative_steplength_visualizer:
         self.w_hist.append(w)
         w_old = np.inf
         j = 0
+
+        # cost value at the current point - carried over from one line search to the next
+        func_eval = self.g(w)
         for j in range(int(self.max_its)):
             # update old w and index
             w_old = w
@@ -44,9 +47,9 @@ class convservative_steplength_visualizer:
             if self.steplength == "diminishing":
                 alpha = 1 / (1 + j)
             elif self.steplength == "backtracking":
-                alpha = self.backtracking(w, grad_eval)
+                alpha, func_eval = self.backtracking(w, grad_eval, func_eval)
             elif self.steplength == "exact":
-                alpha = self.exact(w, grad_eval)
+                alpha, func_eval = self.exact(w, grad_eval, func_eval)
             else:
                 alpha = float(self.steplength)
 
@@ -56,37 +59,84 @@ class convservative_steplength_visualizer:
             # record
             self.w_hist.append(w)
 
+    ######## line searches ########
+    # each line search takes the current point w, descent direction grad_eval and cost value
+    # func_eval at w, and returns a steplength along with the cost value at the resulting point
+
+    # evaluate cost at the points w - alpha*grad_eval for an array of steplengths - in one batched
+    # call when g broadcasts over a stack of points (stored as columns), else one point at a time
+    def ray_evals(self, w, grad_eval, alphas):
+        if np.ndim(w) == 0:
+            pts = w - alphas * grad_eval
+        else:
+            pts = w[:, np.newaxis] - alphas[np.newaxis, :] * grad_eval[:, np.newaxis]
+
+        # try a batched call, checking it against the known cost at the first point
+        if self.batched_g == True:
+            try:
+                func_evals = np.ravel(self.g(pts))
+                if np.size(func_evals) == np.size(alphas) and np.allclose(func_evals[0], self.g(w - alphas[0] * grad_eval)):
+                    return func_evals
+            except Exception:
+                pass
+            self.batched_g = False
+        return np.array([np.ravel(self.g(w - alpha * grad_eval))[0] for alpha in alphas])
+
     # backtracking linesearch module
-    def backtracking(self, w, grad_eval):
+    def backtracking(self, w, grad_eval, func_eval):
         # set input parameters
         alpha = 1
         t = 0.8
 
-        # compute initial function and gradient values
-        func_eval = self.g(w)
+        # compute initial gradient value
         grad_norm = np.linalg.norm(grad_eval) ** 2
 
         # loop over and tune steplength
-        while self.g(w - alpha * grad_eval) > func_eval - alpha * 0.5 * grad_norm:
+        new_eval = self.g(w - alpha * grad_eval)
+        while new_eval > func_eval - alpha * 0.5 * grad_norm:
             alpha = t * alpha
-        return alpha
+            new_eval = self.g(w - alpha * grad_eval)
+        return alpha, new_eval
 
-    # exact linesearch module
-    def exact(self, w, grad_eval):
+    # exact linesearch module - coarse grid search along the ray, refined by golden section search
+    # on the bracket around the best grid point
+    def exact(self, w, grad_eval, func_eval):
         # set parameters of linesearch at each step
         valmax = 10
-        num_evals = 3000
+        num_evals = 300
+        tol = 10 ** (-8)
 
-        # set alpha range
+        # evaluate function over direction and coarse alpha range, bracket alpha giving lowest eval
         alpha_range = np.linspace(0, valmax, num_evals)
-
-        # evaluate function over direction and alpha range, grab alpha giving lowest eval
-        steps = [(w - alpha * grad_eval) for alpha in alpha_range]
-        func_evals = np.array([self.g(s) for s in steps])
+        func_evals = self.ray_evals(w, grad_eval, alpha_range)
         ind = np.argmin(func_evals)
         best_alpha = alpha_range[ind]
+        best_eval = func_evals[ind]
+        a = alpha_range[max(ind - 1, 0)]
+        b = alpha_range[min(ind + 1, num_evals - 1)]
+
+        # golden section search on the bracket
+        ratio = (np.sqrt(5) - 1) / 2
+        c = b - ratio * (b - a)
+        d = a + ratio * (b - a)
+        g_c = self.g(w - c * grad_eval)
+        g_d = self.g(w - d * grad_eval)
+        while b - a > tol:
+            if g_c < g_d:
+                b, d, g_d = d, c, g_c
+                c = b - ratio * (b - a)
+                g_c = self.g(w - c * grad_eval)
+            else:
+                a, c, g_c = c, d, g_d
+                d = a + ratio * (b - a)
+                g_d = self.g(w - d * grad_eval)
 
-        return best_alpha
+        # keep refined steplength only if it improves on the best grid point
+        alpha = (a + b) / 2
+        new_eval = self.g(w - alpha * grad_eval)
+        if new_eval < best_eval:
+            return alpha, new_eval
+        return best_alpha, best_eval
 
     # visualize descent on multi-input function
     def run(self, g, w_init, steplength_vals, max_its, **kwargs):
@@ -99,6 +149,9 @@ class convservative_steplength_visualizer:
         self.grad = compute_grad(self.g)  # gradient of input function
         self.w_init = w_init
 
+        # try evaluating the cost on many points at once in exact line searches
+        self.batched_g = True
+
         pts = "off"
         if "pts" in kwargs:
             pts = "off"